@@ -0,0 +1,7 @@
+"""
+Helpers for the Audio Text Collector that do not depend on Tk or an audio device.
+
+Everything in this package must stay importable on a headless machine: modules
+that need PyAudio receive the PyAudio instance from the caller instead of
+importing it at module level.
+"""
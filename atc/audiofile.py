@@ -0,0 +1,71 @@
+"""
+Reading takes regardless of the format they are stored in.
+
+Takes are always recorded and linked as WAV; with TAKE_FORMAT = "flac" they are
+re-encoded in the background afterwards (see atc.encoder) and the WAV is removed.
+The session index, transcripts and checkpoints keep referring to the `.wav` name;
+everything that opens a take goes through here, and a `.wav` path that no longer
+exists is resolved to the `.flac` beside it.
+
+FLAC needs the optional `soundfile` package (libsndfile).
+"""
+import os
+
+from atc.wavfile import WavInfo, map_samples, read_header
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+TAKE_EXTENSIONS = ('.wav', '.flac')
+_SAMPWIDTH = {'PCM_S8': 1, 'PCM_U8': 1, 'PCM_16': 2, 'PCM_24': 3, 'PCM_32': 4}
+
+
+def flac_available():
+    return soundfile is not None
+
+
+def is_take(name):
+    return name.endswith(TAKE_EXTENSIONS)
+
+
+def canonical_name(name):
+    """The `.wav` name a take is known by, whatever it is stored as."""
+    return os.path.splitext(name)[0] + '.wav'
+
+
+def resolve(path):
+    """The file a take path refers to (the WAV while it exists, else the FLAC), or None."""
+    base = os.path.splitext(path)[0]
+    for ext in TAKE_EXTENSIONS:
+        if os.path.exists(base + ext):
+            return base + ext
+    return None
+
+
+def read_info(path):
+    """WavInfo of a take; for a FLAC, data_offset is None and data_size is the decoded size."""
+    path = resolve(path) or path
+    if not path.endswith('.flac'):
+        return read_header(path)
+    if soundfile is None:
+        raise ValueError(f"{path}: reading FLAC takes needs the soundfile package")
+    info = soundfile.info(path)
+    sampwidth = _SAMPWIDTH.get(info.subtype, 2)
+    return WavInfo(info.channels, sampwidth, info.samplerate, info.frames, None,
+                   info.frames * info.channels * sampwidth)
+
+
+def read_samples(path, info=None):
+    """
+    Interleaved int16 samples of a take: a read-only memmap for a WAV (drop it as soon
+    as possible, see map_samples), a decoded array for a FLAC.
+    """
+    path = resolve(path) or path
+    if not path.endswith('.flac'):
+        return map_samples(path, info)
+    if soundfile is None:
+        raise ValueError(f"{path}: reading FLAC takes needs the soundfile package")
+    data, _ = soundfile.read(path, dtype='int16', always_2d=True)
+    return data.reshape(-1)
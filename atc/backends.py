@@ -0,0 +1,350 @@
+"""
+Audio input and output behind one small interface.
+
+A backend opens 16-bit PCM streams and lists the devices it can use:
+
+    backend.open_input(rate, channels, frames_per_buffer, callback, device=None)
+        callback(data, frames, overflow, adc_time) is called from the audio
+        thread with each captured chunk (interleaved int16 bytes); overflow is
+        True when the device dropped input before this chunk, and adc_time is
+        when its first frame was captured, in seconds on the stream's clock
+        (None where the host API does not report it).
+    backend.open_output(rate, channels, frames_per_buffer, callback, device=None)
+        callback(frames) returns (data, done): the next interleaved int16 bytes
+        and whether that was the last chunk.
+    backend.devices()
+        [{'index', 'name', 'inputs', 'outputs', 'default_rate'}, ...]
+
+Streams are created stopped and have start(), stop(), close(), `active` (output
+is running), `stopped` (stop() was called or the stream never started) and
+`latency` (seconds of output still buffered).
+
+AUDIO_BACKEND picks the implementation:
+
+    "pyaudio"      PortAudio through PyAudio (the default)
+    "sounddevice"  PortAudio through the optional sounddevice package
+    "replay"       no sound card: input replays REPLAY_SOURCE (a WAV/FLAC file, a
+                   folder of them, or "" for a synthetic speech-like signal) and
+                   output is consumed, both at REPLAY_SPEED times real time
+                   (0: as fast as the callbacks return), e.g. to load-test a
+                   full session on a headless machine.
+
+PyAudio and sounddevice are imported only when their backend is created.
+"""
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from atc import config
+from atc.audiofile import is_take, read_info, read_samples
+from atc.resample import resample
+
+
+def create(name=None, **kwargs):
+    """The backend named `name` (default: AUDIO_BACKEND)."""
+    name = name or config.AUDIO_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown audio backend {name!r}; choose from {', '.join(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
+
+# -------------------------
+# PyAudio
+# -------------------------
+class PyAudioStream:
+    def __init__(self, stream):
+        self._stream = stream
+
+    def start(self):
+        self._stream.start_stream()
+
+    def stop(self):
+        self._stream.stop_stream()
+
+    def close(self):
+        self._stream.close()
+
+    @property
+    def active(self):
+        return self._stream.is_active()
+
+    @property
+    def stopped(self):
+        return self._stream.is_stopped()
+
+    @property
+    def latency(self):
+        return self._stream.get_output_latency()
+
+
+class PyAudioBackend:
+    name = "pyaudio"
+
+    def __init__(self):
+        import pyaudio
+        self._pyaudio = pyaudio
+        # PortAudio probes every host API on startup and prints its complaints to stderr
+        original_stderr = sys.stderr
+        sys.stderr = open(os.devnull, 'w')
+        try:
+            self.pa = pyaudio.PyAudio()
+        finally:
+            sys.stderr.close()
+            sys.stderr = original_stderr
+
+    def open_input(self, rate, channels, frames_per_buffer, callback, device=None):
+        pyaudio = self._pyaudio
+
+        def on_input(in_data, frame_count, time_info, status):
+            adc_time = time_info.get('input_buffer_adc_time') if time_info else None
+            callback(in_data, frame_count, bool(status & pyaudio.paInputOverflow), adc_time or None)
+            return (None, pyaudio.paContinue)
+        return PyAudioStream(self.pa.open(format=pyaudio.paInt16, channels=channels, rate=rate, input=True,
+                                          input_device_index=device, frames_per_buffer=frames_per_buffer,
+                                          stream_callback=on_input, start=False))
+
+    def open_output(self, rate, channels, frames_per_buffer, callback, device=None):
+        pyaudio = self._pyaudio
+
+        def on_output(in_data, frame_count, time_info, status):
+            data, done = callback(frame_count)
+            return (data, pyaudio.paComplete if done else pyaudio.paContinue)
+        return PyAudioStream(self.pa.open(format=pyaudio.paInt16, channels=channels, rate=rate, output=True,
+                                          output_device_index=device, frames_per_buffer=frames_per_buffer,
+                                          stream_callback=on_output, start=False))
+
+    def devices(self):
+        out = []
+        for i in range(self.pa.get_device_count()):
+            info = self.pa.get_device_info_by_index(i)
+            out.append({'index': i, 'name': info['name'], 'inputs': info['maxInputChannels'],
+                        'outputs': info['maxOutputChannels'], 'default_rate': info['defaultSampleRate']})
+        return out
+
+    def terminate(self):
+        self.pa.terminate()
+
+
+# -------------------------
+# sounddevice
+# -------------------------
+class SoundDeviceStream:
+    def __init__(self, stream):
+        self._stream = stream
+
+    def start(self):
+        self._stream.start()
+
+    def stop(self):
+        self._stream.stop()
+
+    def close(self):
+        self._stream.close()
+
+    @property
+    def active(self):
+        return self._stream.active
+
+    @property
+    def stopped(self):
+        return self._stream.stopped
+
+    @property
+    def latency(self):
+        return self._stream.latency
+
+
+class SoundDeviceBackend:
+    name = "sounddevice"
+
+    def __init__(self):
+        import sounddevice
+        self.sd = sounddevice
+
+    def open_input(self, rate, channels, frames_per_buffer, callback, device=None):
+        def on_input(indata, frames, time_info, status):
+            callback(bytes(indata), frames, bool(status.input_overflow), time_info.inputBufferAdcTime or None)
+        return SoundDeviceStream(self.sd.RawInputStream(samplerate=rate, channels=channels, dtype='int16',
+                                                        blocksize=frames_per_buffer, device=device,
+                                                        callback=on_input))
+
+    def open_output(self, rate, channels, frames_per_buffer, callback, device=None):
+        sd = self.sd
+
+        def on_output(outdata, frames, time_info, status):
+            data, done = callback(frames)
+            outdata[:len(data)] = data
+            if len(data) < len(outdata):
+                outdata[len(data):] = b'\0' * (len(outdata) - len(data))
+            if done:
+                raise sd.CallbackStop
+        return SoundDeviceStream(sd.RawOutputStream(samplerate=rate, channels=channels, dtype='int16',
+                                                    blocksize=frames_per_buffer, device=device,
+                                                    callback=on_output))
+
+    def devices(self):
+        return [{'index': i, 'name': d['name'], 'inputs': d['max_input_channels'],
+                 'outputs': d['max_output_channels'], 'default_rate': d['default_samplerate']}
+                for i, d in enumerate(self.sd.query_devices())]
+
+    def terminate(self):
+        pass
+
+
+# -------------------------
+# Replay (no sound card)
+# -------------------------
+def synthetic_speech(seconds, rate=44100, channels=1, seed=0):
+    """Noise floor with a voiced, syllable-modulated tone over its middle 70% (interleaved int16)."""
+    rng = np.random.default_rng(seed)
+    n = int(seconds * rate)
+    x = rng.normal(0, 20, n)
+    t = np.arange(n) / rate
+    lo, hi = int(0.15 * n), int(0.85 * n)
+    x[lo:hi] += np.sin(2 * np.pi * 180 * t[lo:hi]) * 8000 * (1 + np.sin(2 * np.pi * 3 * t[lo:hi])) / 2
+    x = np.clip(x, -32768, 32767).astype(np.int16)
+    return np.repeat(x, channels) if channels > 1 else x
+
+
+def replay_files(source):
+    """Takes to replay: `source` itself, or the takes in the folder it names, in name order."""
+    if os.path.isdir(source):
+        return [os.path.join(source, name) for name in sorted(os.listdir(source)) if is_take(name)]
+    return [source]
+
+
+class ReplayStream:
+    """Calls `pump()` from its own thread once per buffer, paced to `speed` times real time."""
+    def __init__(self, rate, frames_per_buffer, speed, pump):
+        self.period = frames_per_buffer / rate / speed if speed else 0.0
+        self._pump = pump
+        self._stop = threading.Event()
+        self._thread = None
+        self.latency = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="replay", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        due = time.perf_counter()
+        while not self._stop.is_set():
+            if not self._pump():
+                break
+            if self.period:
+                due += self.period
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    self._stop.wait(delay)
+
+    def stop(self):
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def close(self):
+        self.stop()
+
+    @property
+    def active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def stopped(self):
+        return self._thread is None
+
+
+class ReplayBackend:
+    """
+    Input replays `source` (see replay_files; None: REPLAY_SOURCE, "": synthetic
+    speech) in a loop, converted to the requested rate and channels; output pulls
+    from its callback and discards the audio. Both run at `speed` times real time.
+    With `overrun_every` (default: REPLAY_OVERRUN_EVERY) input skips one buffer
+    in that many and reports it as an overrun, to exercise overrun handling.
+    """
+    name = "replay"
+
+    def __init__(self, source=None, speed=None, overrun_every=None):
+        self.source = config.REPLAY_SOURCE if source is None else source
+        self.speed = float(config.REPLAY_SPEED if speed is None else speed)
+        self.overrun_every = int(config.REPLAY_OVERRUN_EVERY if overrun_every is None else overrun_every)
+        self._audio = {}
+        # chunks delivered by input streams, for load tests to wait on
+        self.frames_captured = 0
+
+    def audio(self, rate, channels):
+        """The replayed signal as interleaved int16 at `rate`/`channels` (converted once)."""
+        key = (rate, channels)
+        if key not in self._audio:
+            if not self.source:
+                self._audio[key] = synthetic_speech(10, rate, channels)
+            else:
+                parts = []
+                for path in replay_files(self.source):
+                    info = read_info(path)
+                    samples = np.array(read_samples(path, info), dtype=np.int16)
+                    if (info.rate, info.channels) != key:
+                        samples = resample(samples, info.channels, info.rate, rate, channels)
+                    parts.append(samples)
+                if not parts:
+                    raise ValueError(f"No takes to replay in {self.source}")
+                self._audio[key] = np.concatenate(parts)
+        return self._audio[key]
+
+    def open_input(self, rate, channels, frames_per_buffer, callback, device=None):
+        audio = self.audio(rate, channels)
+        step = frames_per_buffer * channels
+        # loop the signal: pad it to whole buffers
+        if len(audio) % step:
+            audio = np.concatenate((audio, audio[:step - len(audio) % step]))
+        # read position in `audio`, and buffers produced (the stream clock) including skipped ones
+        state = {'position': 0, 'buffers': 0}
+
+        def pump():
+            overflow = False
+            if self.overrun_every and state['buffers'] % self.overrun_every == self.overrun_every - 1:
+                # this buffer is "lost": skip it and flag the next one
+                state['position'] = (state['position'] + step) % len(audio)
+                state['buffers'] += 1
+                overflow = True
+            start = state['position']
+            chunk = audio[start:start + step]
+            state['position'] = (start + step) % len(audio)
+            adc_time = 1.0 + state['buffers'] * frames_per_buffer / rate
+            state['buffers'] += 1
+            callback(chunk.tobytes(), frames_per_buffer, overflow, adc_time)
+            self.frames_captured += frames_per_buffer
+            return True
+        return ReplayStream(rate, frames_per_buffer, self.speed, pump)
+
+    def open_output(self, rate, channels, frames_per_buffer, callback, device=None):
+        def pump():
+            _, done = callback(frames_per_buffer)
+            return not done
+        return ReplayStream(rate, frames_per_buffer, self.speed, pump)
+
+    def devices(self):
+        return [{'index': 0, 'name': f"replay ({self.source or 'synthetic'}, x{self.speed:g})", 'inputs': 2,
+                 'outputs': 2, 'default_rate': int(config.CAPTURE_RATE)}]
+
+    def wait_frames(self, frames):
+        """Block until input streams have delivered at least `frames` frames in total."""
+        while self.frames_captured < frames:
+            time.sleep(0.0005)
+
+    def terminate(self):
+        pass
+
+
+BACKENDS = {
+    'pyaudio': PyAudioBackend,
+    'sounddevice': SoundDeviceBackend,
+    'replay': ReplayBackend,
+}
@@ -0,0 +1,376 @@
+"""
+Callback-mode audio capture into a preallocated ring buffer.
+
+PortAudio calls the stream callback from its own thread for every buffer. The
+callback only copies the samples into a preallocated NumPy array and advances an
+integer write cursor, so nothing is kept per chunk and the Tk thread never has to
+wait on a blocking read. Readers keep their own cursors and take views of the
+buffer instead of copies.
+
+While a take is recording, a DiskSink thread drains the ring into the take's WAV
+file, so the ring only has to bridge disk hiccups and memory stays bounded no
+matter how long the take runs. The recorder opens and closes that file on its
+I/O thread (see atc.io_queue) rather than the Tk thread: the sink then holds
+samples in the ring until the file is open, and stops at the position where
+capture stopped even if it is closed after a new take has started.
+
+Audio that never made it into a take is replaced by silence rather than left
+out, so the rest of the take keeps its timing. This covers input overruns,
+where the device dropped input before a chunk (the gap is measured from the
+chunk's ADC timestamp when the backend has one, else taken to be one buffer),
+and a disk sink that fell so far behind that the ring lapped it. Each such
+dropout is recorded, so the recorder can store the number per take. When
+CAPTURE_XRUN_CLUSTER overruns happen within CAPTURE_XRUN_WINDOW_SECONDS, the
+input buffer is doubled (up to CAPTURE_MAX_FRAMES_PER_BUFFER), which trades
+latency for headroom; the larger buffer is used from the next start(). Nothing
+here touches the UI. Buffer changes and sink failures are queued as events
+that the UI thread collects with poll_events().
+"""
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from atc import config, metrics
+from atc.wavfile import WavStreamWriter
+
+# How much audio the ring keeps before the oldest samples are overwritten. The disk
+# sink normally trails the write cursor by well under a second.
+DEFAULT_RING_SECONDS = 30
+# longest gap a single overrun is filled with (a larger ADC jump is a clock glitch)
+MAX_FILL_SECONDS = 2.0
+
+
+def capture_profile():
+    """The configured capture format, with the keys session_info.json records it under."""
+    bits = config.CAPTURE_BITS
+    if bits != 16:
+        print(f"CAPTURE_BITS = {bits} is not supported, recording 16-bit")
+        bits = 16
+    return {'sample_rate': int(config.CAPTURE_RATE), 'channels': int(config.CAPTURE_CHANNELS), 'bit_depth': bits}
+
+
+class RingBuffer:
+    """
+    Single-producer ring buffer of samples.
+
+    The storage is mirrored: every sample is written twice, `capacity` apart, so any
+    window of up to `capacity` samples is one contiguous slice and can be handed out
+    as a view. Positions are absolute sample counts; `written` only ever grows and is
+    the only thing the producer publishes, so readers need no lock.
+    """
+    def __init__(self, capacity, dtype=np.int16):
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype)
+        self._buf = np.zeros(2 * self.capacity, dtype=self.dtype)
+        self._raw = memoryview(self._buf).cast('B')
+        self.written = 0
+
+    def write(self, data):
+        if not isinstance(data, np.ndarray):
+            self._write_bytes(memoryview(data).cast('B'))
+            return
+        n = len(data)
+        if n == 0:
+            return
+        if n > self.capacity:
+            # only the newest `capacity` samples can survive anyway
+            self.written += n - self.capacity
+            data = data[-self.capacity:]
+            n = self.capacity
+        cap = self.capacity
+        i = self.written % cap
+        self._buf[i:i + n] = data
+        low = min(n, cap - i)
+        self._buf[i + cap:i + cap + low] = data[:low]
+        if low < n:
+            self._buf[0:n - low] = data[low:]
+        # publish only after the data is in place
+        self.written += n
+
+    def _write_bytes(self, mv):
+        # Same as the array path but with plain memoryview copies, which is what the
+        # stream callback hands us; avoids building an ndarray per chunk.
+        size = self.dtype.itemsize
+        n = len(mv) // size
+        if n == 0:
+            return
+        if n > self.capacity:
+            self.written += n - self.capacity
+            mv = mv[-self.capacity * size:]
+            n = self.capacity
+        cap = self.capacity
+        i = self.written % cap
+        raw = self._raw
+        raw[i * size:(i + n) * size] = mv[:n * size]
+        low = min(n, cap - i)
+        raw[(i + cap) * size:(i + cap + low) * size] = mv[:low * size]
+        if low < n:
+            raw[0:(n - low) * size] = mv[low * size:n * size]
+        self.written += n
+
+    def oldest(self):
+        """First absolute position that is still held in the buffer."""
+        return max(0, self.written - self.capacity)
+
+    def view(self, start, stop=None):
+        """
+        Zero-copy view of samples [start, stop). `start` is clamped to the oldest sample
+        still available. The view is only valid until the producer laps it, so callers
+        that keep data around must copy it.
+        """
+        if stop is None:
+            stop = self.written
+        start = max(start, self.oldest())
+        if stop <= start:
+            return self._buf[:0]
+        i = start % self.capacity
+        return self._buf[i:i + (stop - start)]
+
+
+class DiskSink:
+    """
+    Background reader of a RingBuffer that appends everything it sees to a
+    WavStreamWriter. It has its own cursor, so the producer never waits on the disk.
+    `open_writer` creates the writer; until it has been called nothing is drained.
+    `on_event(kind, value)` is told, from the sink's thread, about samples the ring
+    overwrote before they were written ('dropped', (position, samples)), which are
+    written as silence, and about a write that failed ('error', exception), after
+    which the sink stops.
+    """
+    def __init__(self, ring, open_writer, start, interval=0.05, on_event=None):
+        self.ring = ring
+        self.on_event = on_event
+        self._open_writer = open_writer
+        self.writer = None
+        self.cursor = start
+        # ring position capture stopped at (None while it runs)
+        self.end = None
+        self.interval = interval
+        self.dropped = 0
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="DiskSink", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.drain()
+            except Exception as e:
+                self.error = e
+                print(f"Failed to write take: {e}")
+                if self.on_event is not None:
+                    self.on_event('error', e)
+                return
+
+    def open(self):
+        self.writer = self._open_writer()
+        return self.writer
+
+    def drain(self):
+        writer = self.writer
+        if writer is None:
+            return
+        written = self.ring.written if self.end is None else self.end
+        oldest = self.ring.oldest()
+        if self.cursor < oldest:
+            lost = oldest - self.cursor
+            self.dropped += lost
+            metrics.count('capture.samples_lost', lost)
+            print(f"Warning: disk writer fell behind, {lost} samples replaced by silence")
+            silence = np.zeros(min(lost, self.ring.capacity), dtype=self.ring.dtype)
+            for done in range(0, lost, len(silence)):
+                writer.write(silence[:lost - done])
+            if self.on_event is not None:
+                self.on_event('dropped', (self.cursor, lost))
+            self.cursor = oldest
+        if written > self.cursor:
+            chunk = self.ring.view(self.cursor, written)
+            writer.write(chunk)
+            metrics.count('capture.bytes_written', chunk.nbytes)
+            self.cursor = written
+
+    def close(self):
+        """Write what is left and close the file. Returns the writer (None if it was never opened)."""
+        self._stop.set()
+        self._thread.join()
+        if self.writer is None:
+            return None
+        try:
+            self.drain()
+        finally:
+            self.writer.close()
+        return self.writer
+
+
+class CaptureEngine:
+    """
+    Owns the input stream and the ring buffer for the main window.
+
+    A take is the span of the ring from `take_start` to the current write position;
+    starting a new take is just moving that marker. If an `envelope` is given
+    (see atc.waveform.PeakEnvelope) every chunk is also folded into it, so the live
+    waveform never has to look at the take; an `endpoint` detector (see
+    atc.vad.EndpointDetector) is fed the same way. When `start` is given a path,
+    the take is streamed to that WAV file while recording. The input stream comes
+    from an audio backend (see atc.backends), opened on `device` (None: its default).
+    """
+    def __init__(self, backend, rate=44100, channels=1, frames_per_buffer=1024, seconds=DEFAULT_RING_SECONDS,
+                 envelope=None, endpoint=None, device=None, max_frames_per_buffer=None):
+        self.backend = backend
+        self.device = device
+        self.envelope = envelope
+        self.endpoint = endpoint
+        self.rate = rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer
+        self.max_frames_per_buffer = max(frames_per_buffer, max_frames_per_buffer
+                                         or config.CAPTURE_MAX_FRAMES_PER_BUFFER)
+        self.ring = RingBuffer(rate * channels * seconds, dtype=np.int16)
+        self.take_start = 0
+        self.stream = None
+        self.sink = None
+        # (ring position, samples) of every stretch of audio replaced by silence, oldest first
+        self.dropouts = []
+        self._silence = np.zeros(rate * channels, dtype=np.int16)
+        # ADC time the next chunk should start at, if the backend reports ADC times
+        self._next_adc = None
+        self._recent_overruns = deque()
+        # buffer size of the open stream
+        self._stream_frames = frames_per_buffer
+        # ('buffer', frames_per_buffer) and ('error', exception) for the UI thread
+        self.events = deque()
+
+    def _callback(self, data, frames, overflow, adc_time=None):
+        if overflow:
+            self._overrun(frames, adc_time)
+        self._next_adc = adc_time + frames / self.rate if adc_time else None
+        self.write(data)
+
+    def _overrun(self, frames, adc_time):
+        """The device dropped input before this chunk: fill the gap with silence."""
+        lost = frames
+        if adc_time and self._next_adc is not None:
+            gap = int(round((adc_time - self._next_adc) * self.rate))
+            if gap > 0:
+                lost = gap
+        lost = min(lost, int(MAX_FILL_SECONDS * self.rate)) * self.channels
+        self.dropouts.append((self.ring.written, lost))
+        for done in range(0, lost, len(self._silence)):
+            self.write(self._silence[:lost - done])
+        metrics.count('capture.overruns')
+        metrics.count('capture.samples_filled', lost)
+
+        now = time.monotonic()
+        recent = self._recent_overruns
+        recent.append(now)
+        while now - recent[0] > config.CAPTURE_XRUN_WINDOW_SECONDS:
+            recent.popleft()
+        # raised at most once per stream: the new size only applies from the next start()
+        if (len(recent) >= config.CAPTURE_XRUN_CLUSTER and self.frames_per_buffer == self._stream_frames
+                and self.frames_per_buffer < self.max_frames_per_buffer):
+            recent.clear()
+            self.frames_per_buffer = min(self.max_frames_per_buffer, self.frames_per_buffer * 2)
+            self.events.append(('buffer', self.frames_per_buffer))
+
+    def _sink_event(self, kind, value):
+        if kind == 'dropped':
+            self.dropouts.append(value)
+        else:
+            self.events.append((kind, value))
+
+    def poll_events(self):
+        """Events queued since the last call (UI thread)."""
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        return events
+
+    @metrics.timed('capture.write')
+    def write(self, data):
+        start = self.ring.written
+        self.ring.write(data)
+        if self.envelope is not None or self.endpoint is not None:
+            chunk = self.ring.view(start)
+            if self.envelope is not None:
+                self.envelope.add(chunk)
+            if self.endpoint is not None:
+                self.endpoint.add(chunk)
+
+    def start(self, path=None, append=False, open_later=False):
+        """
+        Open the input stream. With `path`, the take is written to that WAV as it is
+        captured; `append=True` continues an existing (paused) take file in place.
+        With `open_later` the caller opens the file by calling sink.open() (from any
+        thread); the sink is returned.
+        """
+        if path is not None:
+            def open_writer():
+                return WavStreamWriter(path, channels=self.channels, sampwidth=2, rate=self.rate, append=append)
+            self.sink = DiskSink(self.ring, open_writer, self.ring.written, on_event=self._sink_event)
+            if not open_later:
+                self.sink.open()
+        self._next_adc = None
+        self._stream_frames = self.frames_per_buffer
+        try:
+            self.stream = self.backend.open_input(self.rate, self.channels, self.frames_per_buffer, self._callback,
+                                                  device=self.device)
+            self.stream.start()
+        except Exception:
+            self._close_sink()
+            raise
+        return self.sink
+
+    def stop(self, close=True):
+        """
+        Stop capturing; returns the finished take writer (or None) once it is flushed.
+        With close=False the take's DiskSink is returned unclosed for the caller to
+        close (sink.close() returns the writer).
+        """
+        if self.stream is not None:
+            try:
+                self.stream.stop()
+            finally:
+                self.stream.close()
+                self.stream = None
+        if not close:
+            sink, self.sink = self.sink, None
+            if sink is not None:
+                sink.end = self.ring.written
+            return sink
+        return self._close_sink()
+
+    def _close_sink(self):
+        sink, self.sink = self.sink, None
+        if sink is None:
+            return None
+        return sink.close()
+
+    @property
+    def running(self):
+        return self.stream is not None
+
+    def new_take(self):
+        self.take_start = self.ring.written
+        # dropouts of earlier takes are no longer asked about
+        self.dropouts = [d for d in self.dropouts if d[0] >= self.take_start]
+        if self.envelope is not None:
+            self.envelope.reset()
+        if self.endpoint is not None:
+            self.endpoint.reset()
+
+    def take_dropouts(self):
+        """(count, seconds) of the current take's audio that was replaced by silence."""
+        dropouts = [samples for position, samples in self.dropouts if position >= self.take_start]
+        return len(dropouts), sum(dropouts) / (self.rate * self.channels)
+
+    def take_samples(self):
+        return self.ring.written - max(self.take_start, self.ring.oldest())
+
+    def take(self):
+        """View of the current take (int16, interleaved if more than one channel)."""
+        if self.take_start < self.ring.oldest():
+            print("Warning: take is longer than the capture buffer, oldest audio was dropped")
+        return self.ring.view(self.take_start)
@@ -0,0 +1,93 @@
+"""
+Checkpoint persistence off the UI thread.
+
+The recorder saves its position (line, session, and one line cursor per source
+file) at every step. CheckpointWriter keeps only the latest state: updates made
+within CHECKPOINT_DELAY_SECONDS of the first pending one are coalesced into a
+single write, done on a background thread as a temporary file that is fsync'd
+and renamed over checkpoint.txt, so a power cut leaves either the old or the new
+checkpoint and never an empty one. flush() writes whatever is pending right away
+and is called when the recorder closes.
+"""
+import json
+import os
+import threading
+import time
+
+from atc import config
+
+
+def read_checkpoint(path):
+    """The stored checkpoint (a dict, or an int from very old versions), or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_checkpoint(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CheckpointWriter:
+    def __init__(self, path, delay=None):
+        self.path = path
+        self.delay = config.CHECKPOINT_DELAY_SECONDS if delay is None else delay
+        self.writes = 0
+        self._pending = None
+        self._due = 0.0
+        self._cond = threading.Condition()
+        # serialises writes from the thread and from flush()
+        self._write_lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def update(self, data):
+        """Schedule `data` (a JSON-serialisable dict, copied) to be written."""
+        data = json.loads(json.dumps(data))
+        with self._cond:
+            if self._pending is None:
+                self._due = time.monotonic() + self.delay
+            self._pending = data
+            self._cond.notify()
+
+    def _take(self):
+        with self._cond:
+            data, self._pending = self._pending, None
+            return data
+
+    def _write(self, data):
+        try:
+            write_checkpoint(self.path, data)
+            self.writes += 1
+        except Exception as e:
+            print(f"Failed to save checkpoint: {e}")
+
+    def flush(self):
+        """Write the pending checkpoint now, on the calling thread."""
+        with self._write_lock:
+            data = self._take()
+            if data is not None:
+                self._write(data)
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and (self._pending is None or time.monotonic() < self._due):
+                    self._cond.wait(None if self._pending is None else self._due - time.monotonic())
+                if self._stopped:
+                    return
+            self.flush()
@@ -0,0 +1,372 @@
+"""
+Headless corpus tools, for servers without a display or audio device.
+
+    python -m atc stats            [--root .] [--json]
+    python -m atc verify           [--root .]
+    python -m atc reindex          [--root .] [--peaks]
+    python -m atc rebuild-metadata [--root .] [--full]
+    python -m atc qa               [--root .] [--full]
+    python -m atc resample         [--root .] --rate 16000 [--channels 1]
+    python -m atc encode           [--root .]
+    python -m atc export OUT_DIR   [--root .] [--format tar|parquet] [--audio wav|flac] [--rate 16000]
+    python -m atc compact-source SOURCE.txt ...
+    python -m atc devices          [--backend pyaudio|sounddevice|replay]
+
+Every command works on the recorder's file layout (see atc.layout) and runs one
+task per session in a process pool (--jobs, default: one per CPU), largest
+sessions first so a big session does not end up running alone at the end; `qa`
+and `resample` fan out per take and `export` per shard instead (see atc.qa,
+atc.resample, atc.export). `encode` converts WAV takes to FLAC with --jobs
+encoder threads (see atc.encoder). `compact-source` folds the edit journal of source
+files into them (see atc.source_model). `devices` lists the audio devices of a backend
+(see atc.backends), the only command that loads PyAudio or sounddevice. Nothing
+here imports tkinter.
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from atc import backends, export, peaks, qa, resample
+from atc.encoder import EncoderPool
+from atc.layout import Corpus, take_name
+from atc.metadata import merge_metadata, rebuild_metadata, session_meta_path, transcript_rows, write_session_metadata
+from atc.session_index import SessionIndex, text_hash
+from atc.source_model import SourceModel
+from atc.audiofile import canonical_name, flac_available, is_take, read_info, resolve
+
+
+def _read_lines(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f.readlines()]
+
+
+def _open_index(corpus, session, speaker_id, readonly):
+    return SessionIndex.open(corpus.session_path(session), session, corpus.transcript(session),
+                             lambda sent_id: take_name(speaker_id, session, sent_id), readonly=readonly)
+
+
+# -------------------------
+# Per-session tasks (top level so they can be sent to worker processes)
+# -------------------------
+def session_stats(root, session, speaker_id):
+    corpus = Corpus(root)
+    lines = _read_lines(corpus.transcript(session)) or []
+    index = _open_index(corpus, session, speaker_id, readonly=True)
+    durations = index.take_durations(corpus.session_path(session))
+    total = sum(durations.values())
+    return {'session': session, 'sentences': len(lines), 'linked': len(durations),
+            'pending': len(lines) - len(durations), 'duration': total,
+            'average': total / len(durations) if durations else 0.0}
+
+
+def session_verify(root, session, speaker_id):
+    """A list of problems found in one session (empty if it is consistent)."""
+    corpus = Corpus(root)
+    session_path = corpus.session_path(session)
+    problems = []
+    lines = _read_lines(corpus.transcript(session))
+    if lines is None:
+        problems.append("transcript missing")
+        lines = []
+    index = _open_index(corpus, session, speaker_id, readonly=True)
+    expected = set()
+    formats = {}
+    for i, text in enumerate(lines):
+        sent_id = i + 1
+        entry = index.get(sent_id) or {}
+        audio = entry.get('audio') or take_name(speaker_id, session, sent_id)
+        expected.add(audio)
+        audio_p = os.path.join(session_path, audio)
+        if entry.get('hash') not in (None, text_hash(text)):
+            problems.append(f"sent {sent_id}: index is stale (text changed since it was linked)")
+        if not resolve(audio_p):
+            if entry.get('status') == 'linked':
+                problems.append(f"sent {sent_id}: take {audio} is missing")
+            continue
+        try:
+            info = read_info(audio_p)
+        except (OSError, ValueError) as e:
+            problems.append(f"sent {sent_id}: take {audio} is unreadable ({e})")
+            continue
+        if info.nframes == 0:
+            problems.append(f"sent {sent_id}: take {audio} is empty")
+        formats.setdefault((info.rate, info.channels, info.sampwidth), []).append(sent_id)
+        if entry.get('status') == 'pending':
+            problems.append(f"sent {sent_id}: take {audio} exists but the index marks it pending")
+        elif entry.get('frames') is not None and entry['frames'] != info.nframes:
+            problems.append(f"sent {sent_id}: index records {entry['frames']} frames, take has {info.nframes}")
+    if len(formats) > 1:
+        common = max(formats, key=lambda k: len(formats[k]))
+        for fmt, ids in formats.items():
+            if fmt != common:
+                problems.append(f"sents {ids}: format {fmt} differs from the session's {common} "
+                                "(rate, channels, sample width)")
+    for name in sorted(os.listdir(session_path)):
+        if is_take(name) and canonical_name(name) not in expected:
+            problems.append(f"orphan take {name}")
+    meta = session_meta_path(session_path, session)
+    if os.path.exists(meta):
+        with open(meta, 'r', encoding='utf-8') as m:
+            rows = sum(1 for _ in m) - 1
+        if rows != len(lines):
+            problems.append(f"metadata has {rows} rows, transcript has {len(lines)} lines")
+    return {'session': session, 'problems': problems}
+
+
+def session_reindex(root, session, speaker_id, with_peaks=False):
+    corpus = Corpus(root)
+    session_path = corpus.session_path(session)
+    if not os.path.exists(corpus.transcript(session)):
+        return {'session': session, 'linked': 0, 'peaks': 0, 'error': "transcript missing"}
+    index = SessionIndex.rebuild(session_path, session, corpus.transcript(session),
+                                 lambda sent_id: take_name(speaker_id, session, sent_id))
+    built = 0
+    linked = [e for e in index.entries.values() if e.get('status') == 'linked']
+    if with_peaks:
+        for entry in linked:
+            wav = resolve(os.path.join(session_path, entry['audio']))
+            if wav and not peaks.is_fresh(wav):
+                peaks.write_peaks(wav)
+                built += 1
+    return {'session': session, 'linked': len(linked), 'peaks': built}
+
+
+def session_metadata(root, session, speaker_id):
+    corpus = Corpus(root)
+    session_path = corpus.session_path(session)
+    if not os.path.exists(corpus.transcript(session)):
+        return {'session': session, 'rows': 0, 'error': "transcript missing"}
+    index = _open_index(corpus, session, speaker_id, readonly=False)
+    rows = list(transcript_rows(session_path, session, corpus.transcript(session), speaker_id,
+                                durations=index.take_durations(session_path)))
+    write_session_metadata(session_meta_path(session_path, session), rows)
+    return {'session': session, 'rows': len(rows)}
+
+
+# -------------------------
+# Fan-out
+# -------------------------
+def _session_weight(corpus, session):
+    try:
+        return os.path.getsize(corpus.transcript(session))
+    except OSError:
+        return 0
+
+
+def run_sessions(task, corpus, sessions, jobs, *args):
+    """Run task(root, session, *args) for every session and return the results in session order."""
+    sessions = sorted(sessions, key=lambda s: _session_weight(corpus, s), reverse=True)
+    results = {}
+    if jobs <= 1 or len(sessions) <= 1:
+        for session in sessions:
+            results[session] = task(corpus.root, session, *args)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(task, corpus.root, session, *args): session for session in sessions}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+    return [results[s] for s in sorted(results)]
+
+
+# -------------------------
+# Commands
+# -------------------------
+def cmd_stats(corpus, sessions, args):
+    results = run_sessions(session_stats, corpus, sessions, args.jobs, args.speaker)
+    totals = {'sessions': len(results),
+              'sentences': sum(r['sentences'] for r in results),
+              'linked': sum(r['linked'] for r in results),
+              'duration': sum(r['duration'] for r in results)}
+    totals['average'] = totals['duration'] / totals['linked'] if totals['linked'] else 0.0
+    if args.json:
+        print(json.dumps({'sessions': results, 'total': totals}, indent=2))
+        return 0
+    for r in results:
+        print(f"{r['session']}: {r['linked']}/{r['sentences']} linked, "
+              f"{r['duration'] / 60:.1f} min, avg {r['average']:.2f} s")
+    print(f"Total: {totals['sessions']} sessions, {totals['linked']}/{totals['sentences']} linked, "
+          f"{totals['duration'] / 3600:.2f} h, avg {totals['average']:.2f} s")
+    return 0
+
+
+def cmd_verify(corpus, sessions, args):
+    results = run_sessions(session_verify, corpus, sessions, args.jobs, args.speaker)
+    count = 0
+    for r in results:
+        for problem in r['problems']:
+            print(f"{r['session']}: {problem}")
+        count += len(r['problems'])
+    print(f"{count} problem(s) in {len(results)} session(s)")
+    return 1 if count else 0
+
+
+def cmd_reindex(corpus, sessions, args):
+    results = run_sessions(session_reindex, corpus, sessions, args.jobs, args.speaker, args.peaks)
+    for r in results:
+        if r.get('error'):
+            print(f"{r['session']}: skipped, {r['error']}")
+            continue
+        line = f"{r['session']}: {r['linked']} linked takes"
+        if args.peaks:
+            line += f", {r['peaks']} peak files built"
+        print(line)
+    return 0
+
+
+def cmd_rebuild_metadata(corpus, sessions, args):
+    results = run_sessions(session_metadata, corpus, sessions, args.jobs, args.speaker)
+    for r in results:
+        if r.get('error'):
+            print(f"{r['session']}: skipped, {r['error']}")
+    if args.full:
+        rebuild_metadata(corpus.audio_root, corpus.global_meta)
+    else:
+        merge_metadata(corpus.audio_root, corpus.global_meta, sessions=sorted(sessions))
+    print(f"Wrote {sum(r['rows'] for r in results)} rows for {len(results)} session(s) to {corpus.global_meta}")
+    return 0
+
+
+def cmd_qa(corpus, sessions, args):
+    result = qa.scan(corpus.audio_root, jobs=args.jobs, sessions=sessions, full=args.full)
+    for session, audio, flags in result['flagged']:
+        print(f"{session}/{audio}: {flags}")
+    print(f"Scanned {result['scanned']} of {result['takes']} takes, {len(result['flagged'])} flagged")
+    return 0
+
+
+def cmd_resample(corpus, sessions, args):
+    written, errors = resample.derive_tree(corpus.audio_root, args.rate, args.channels, jobs=args.jobs,
+                                           sessions=sessions)
+    for error in errors:
+        print(error)
+    print(f"Wrote {written} take(s) at {args.rate} Hz to {corpus.audio_root.rstrip(os.sep)}_{args.rate}")
+    return 1 if errors else 0
+
+
+def cmd_encode(corpus, sessions, args):
+    if not flac_available():
+        print("Encoding needs the soundfile package (pip install soundfile)", file=sys.stderr)
+        return 2
+    pool = EncoderPool(workers=max(1, args.jobs))
+    try:
+        pool.encode_tree(corpus.audio_root, sessions=sessions)
+    finally:
+        pool.shutdown(wait=True)
+    print(f"Encoded {pool.encoded} take(s) to FLAC, {pool.failed} failed")
+    return 1 if pool.failed else 0
+
+
+def cmd_export(corpus, sessions, args):
+    try:
+        export.export(corpus.global_meta, corpus.audio_root, args.out_dir, fmt=args.format, audio=args.audio,
+                      rate=args.rate, channels=args.channels, shard_size=export.parse_size(args.shard_size),
+                      jobs=args.jobs, sessions=set(args.sessions) if args.sessions else None)
+    except (ImportError, ValueError) as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def cmd_compact_source(corpus, sessions, args):
+    status = 0
+    for path in args.sources:
+        try:
+            model = SourceModel(path)
+        except OSError as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            status = 1
+            continue
+        try:
+            print(f"{path}: folded {model.compact()} edit(s)")
+        except OSError as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            status = 1
+        finally:
+            model.close()
+    return status
+
+
+def cmd_devices(corpus, sessions, args):
+    try:
+        backend = backends.create(args.backend)
+    except (ImportError, OSError, ValueError) as e:
+        print(f"Audio backend unavailable: {e}", file=sys.stderr)
+        return 2
+    try:
+        print(f"{'index':>5}  {'in':>3}  {'out':>3}  {'rate':>7}  name")
+        for d in backend.devices():
+            print(f"{d['index']:>5}  {d['inputs']:>3}  {d['outputs']:>3}  {int(d['default_rate']):>7}  {d['name']}")
+    finally:
+        backend.terminate()
+    return 0
+
+
+COMMANDS = {
+    'stats': cmd_stats,
+    'verify': cmd_verify,
+    'reindex': cmd_reindex,
+    'rebuild-metadata': cmd_rebuild_metadata,
+    'qa': cmd_qa,
+    'resample': cmd_resample,
+    'encode': cmd_encode,
+    'export': cmd_export,
+    'compact-source': cmd_compact_source,
+    'devices': cmd_devices,
+}
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--root', default=".", help="corpus directory (default: current directory)")
+    common.add_argument('--speaker', default="spk01", help="speaker id used in take names")
+    common.add_argument('--sessions', nargs='+', metavar='NAME', help="only these sessions")
+    common.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: one per CPU, 1 runs inline)")
+
+    parser = argparse.ArgumentParser(prog="python -m atc", description="Headless corpus tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('stats', parents=[common], help="sentence counts and recorded durations")
+    p.add_argument('--json', action='store_true', help="print JSON instead of a table")
+    sub.add_parser('verify', parents=[common], help="check takes, index and metadata; exit 1 on problems")
+    p = sub.add_parser('reindex', parents=[common], help="rebuild session indexes from transcripts and takes")
+    p.add_argument('--peaks', action='store_true', help="also build missing or stale peak files")
+    p = sub.add_parser('rebuild-metadata', parents=[common], help="rewrite session and global metadata CSVs")
+    p.add_argument('--full', action='store_true', help="rewrite metadata.csv from scratch instead of merging")
+    p = sub.add_parser('qa', parents=[common], help="compute per-take QA metrics into session_XX.qa.csv")
+    p.add_argument('--full', action='store_true', help="rescan every take, not just new or changed ones")
+    p = sub.add_parser('resample', parents=[common], help="write resampled copies of takes to audio_<rate>/")
+    p.add_argument('--rate', type=int, default=16000)
+    p.add_argument('--channels', type=int, default=1)
+    sub.add_parser('encode', parents=[common], help="convert WAV takes to FLAC (as TAKE_FORMAT flac does)")
+    p = sub.add_parser('export', parents=[common], help="write metadata.csv and its takes as training shards")
+    p.add_argument('out_dir')
+    p.add_argument('--format', choices=('tar', 'parquet'), default='tar')
+    p.add_argument('--audio', choices=('wav', 'flac'), default='wav')
+    p.add_argument('--rate', type=int, default=None, help="resample to this rate (default: keep)")
+    p.add_argument('--channels', type=int, default=None, help="downmix to this many channels (default: keep)")
+    p.add_argument('--shard-size', default="1G", help="maximum audio per shard, e.g. 512M (default 1G)")
+    p = sub.add_parser('compact-source', parents=[common],
+                       help="write journalled edits into source files (while the recorder is not using them)")
+    p.add_argument('sources', nargs='+', metavar='SOURCE')
+    p = sub.add_parser('devices', parents=[common],
+                       help="list audio devices (for AUDIO_INPUT_DEVICE and AUDIO_OUTPUT_DEVICE)")
+    p.add_argument('--backend', choices=sorted(backends.BACKENDS), help="default: AUDIO_BACKEND")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    corpus = Corpus(args.root)
+    available = corpus.sessions()
+    sessions = available
+    if args.sessions:
+        missing = [s for s in args.sessions if s not in available]
+        if missing:
+            print(f"No such session(s) under {corpus.audio_root}: {', '.join(missing)}", file=sys.stderr)
+            return 2
+        sessions = args.sessions
+    return COMMANDS[args.command](corpus, sessions, args)
@@ -0,0 +1,111 @@
+"""
+Runtime settings.
+
+The defaults below can be overridden from `atc_config.json` in the working
+directory, e.g. {"USE_SQLITE_STORE": true}. Read settings as `config.NAME` at the
+time they are needed rather than importing the names, so overrides apply.
+"""
+import json
+import os
+
+CONFIG_FILE = "atc_config.json"
+
+# Capture format of new takes, recorded in each session's session_info.json.
+# Takes are 16-bit PCM; CAPTURE_BITS is kept for the record and must be 16.
+CAPTURE_RATE = 44100
+CAPTURE_CHANNELS = 1
+CAPTURE_BITS = 16
+CAPTURE_FRAMES_PER_BUFFER = 1024
+# Input overruns are filled with silence and counted per take. When
+# CAPTURE_XRUN_CLUSTER of them happen within CAPTURE_XRUN_WINDOW_SECONDS, the
+# input buffer is doubled for the next take, up to CAPTURE_MAX_FRAMES_PER_BUFFER.
+CAPTURE_MAX_FRAMES_PER_BUFFER = 8192
+CAPTURE_XRUN_CLUSTER = 3
+CAPTURE_XRUN_WINDOW_SECONDS = 10
+
+# Audio backend (see atc.backends): "pyaudio", "sounddevice" or "replay". Devices
+# are indexes from `python -m atc devices` (None: the system default). The replay
+# backend records REPLAY_SOURCE (a take, a folder of takes, or "" for a synthetic
+# voice) at REPLAY_SPEED times real time and plays back silently, no sound card needed;
+# REPLAY_OVERRUN_EVERY = N drops one input buffer in N to simulate overruns.
+AUDIO_BACKEND = "pyaudio"
+AUDIO_INPUT_DEVICE = None
+AUDIO_OUTPUT_DEVICE = None
+REPLAY_SOURCE = ""
+REPLAY_SPEED = 1.0
+REPLAY_OVERRUN_EVERY = 0
+
+# Also write a resampled copy of every linked take to audio_<rate>/ (0 = off),
+# e.g. 16000 for ASR training. See atc.resample.
+DERIVATIVE_RATE = 0
+DERIVATIVE_CHANNELS = 1
+
+# Keep sentences, takes and session metadata in a SQLite database. The session
+# transcripts and metadata CSVs are then exported from it when a session ends.
+USE_SQLITE_STORE = False
+STORE_PATH = "corpus.db"
+
+# Cut the silence before and after speech off each take when it is linked (see
+# atc.vad). With TRIM_KEEP_RAW the untrimmed take is kept in the session's .raw/.
+TRIM_SILENCE = False
+TRIM_THRESHOLD_DBFS = -40.0
+TRIM_PAD_SECONDS = 0.15
+TRIM_HANGOVER_SECONDS = 0.3
+TRIM_MIN_SPEECH_SECONDS = 0.05
+TRIM_KEEP_RAW = False
+
+# Hands-free mode: link the take and move to the next line once the reader has
+# been silent for HANDS_FREE_SILENCE_SECONDS after speaking for at least
+# HANDS_FREE_MIN_SPEECH_SECONDS (speech threshold: TRIM_THRESHOLD_DBFS).
+HANDS_FREE = False
+HANDS_FREE_SILENCE_SECONDS = 1.0
+HANDS_FREE_MIN_SPEECH_SECONDS = 0.3
+
+# "wav" or "flac". Takes are always recorded as WAV; with "flac" they are re-encoded
+# in the background after linking (needs the soundfile package, see atc.encoder).
+TAKE_FORMAT = "wav"
+ENCODE_WORKERS = 1
+ENCODE_QUEUE = 8
+
+# Navigation cache: the takes of the PREFETCH_NEIGHBORS lines before and after the
+# current one are decoded in the background, into at most PREFETCH_BUDGET_MB of
+# memory (least recently used takes are dropped first; 0 disables the cache).
+PREFETCH_NEIGHBORS = 3
+PREFETCH_BUDGET_MB = 256
+
+# Source edits (Ctrl+E) are appended to <source>.edits; once this many lines have
+# pending edits they are folded into the source file in the background.
+SOURCE_COMPACT_EDITS = 500
+
+# checkpoint.txt is written in the background at most this long after a change
+# (later changes in that window are folded into the same write).
+CHECKPOINT_DELAY_SECONDS = 0.5
+
+# Timing histograms of the UI's hot paths and capture, plus counters and queue
+# depths (see atc.metrics; F12 shows them). Every METRICS_INTERVAL_SECONDS a JSON
+# line is appended to METRICS_FILE, which is rotated at METRICS_MAX_MB keeping
+# METRICS_BACKUPS old files. Off costs nothing.
+METRICS = False
+METRICS_FILE = "metrics.jsonl"
+METRICS_INTERVAL_SECONDS = 10
+METRICS_MAX_MB = 10
+METRICS_BACKUPS = 3
+
+
+def load(path=CONFIG_FILE):
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"Failed to read {path}: {e}")
+        return
+    for key, value in data.items():
+        if key.isupper() and key in globals():
+            globals()[key] = value
+        else:
+            print(f"Unknown setting in {path}: {key}")
+
+
+load()
@@ -0,0 +1,135 @@
+"""
+Background FLAC encoding of linked takes (TAKE_FORMAT = "flac").
+
+Linking a take stays a rename of the recorded WAV; the take is then handed to an
+EncoderPool, which encodes it next to the WAV, writes the FLAC's peak sidecar and
+removes the WAV. Readers resolve either file (see atc.audiofile), so a take can be
+opened at any point of this.
+
+The pool is bounded: ENCODE_WORKERS takes are encoded at a time and at most
+ENCODE_QUEUE more wait. A take submitted while the pool is full is not queued and
+simply stays a WAV until the next sweep (encode_tree: the recorder sweeps a
+session when it is opened, `python -m atc encode` the whole corpus), so linking
+never waits and a long backlog never competes with capture for more than
+ENCODE_WORKERS cores.
+libsndfile releases the GIL while it encodes.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from atc import config, peaks
+from atc.audiofile import flac_available, soundfile
+from atc.layout import list_sessions
+from atc.wavfile import map_samples, read_header
+
+
+def flac_path(wav_path):
+    return os.path.splitext(wav_path)[0] + '.flac'
+
+
+def encode_take(wav_path, lock=None):
+    """
+    Encode a WAV take to FLAC and remove the WAV. `lock` is held while the files are
+    swapped, so a caller that renames or removes takes under the same lock never has
+    a new take deleted from under it. Returns the FLAC path, or None if the WAV
+    changed or disappeared while it was being encoded.
+    """
+    lock = lock or threading.Lock()
+    st = os.stat(wav_path)
+    info = read_header(wav_path)
+    if info.sampwidth != 2:
+        raise ValueError(f"{wav_path}: only 16-bit takes are encoded")
+    out = flac_path(wav_path)
+    tmp_path = out + ".tmp"
+    samples = map_samples(wav_path, info)
+    try:
+        soundfile.write(tmp_path, samples.reshape(-1, info.channels), info.rate, subtype='PCM_16', format='FLAC')
+        levels = peaks.compute_levels(samples, info.channels)
+    finally:
+        # the mapping must be gone before the WAV is removed (Windows)
+        del samples
+    with lock:
+        try:
+            current = os.stat(wav_path)
+        except OSError:
+            current = None
+        if current is None or (current.st_size, current.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+            # replaced or removed while encoding: this FLAC is of an old take
+            os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, out)
+        peaks.write_peaks(out, levels=levels)
+        os.remove(wav_path)
+    peaks.remove_peaks(wav_path)
+    return out
+
+
+class EncoderPool:
+    def __init__(self, workers=None, queue=None):
+        workers = workers or config.ENCODE_WORKERS
+        queue = config.ENCODE_QUEUE if queue is None else queue
+        # held by encode_take while it swaps files, and by the UI while it renames or removes takes
+        self.lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="flac")
+        # takes submitted and not yet encoded; the counters are updated from the
+        # submitting thread and the workers, under _count_lock
+        self._count_lock = threading.Lock()
+        self.queued = 0
+        self.encoded = 0
+        self.skipped = 0
+        self.failed = 0
+
+    @classmethod
+    def create(cls):
+        """A pool if TAKE_FORMAT asks for FLAC and it can be written, else None."""
+        if config.TAKE_FORMAT != 'flac':
+            return None
+        if not flac_available():
+            print("TAKE_FORMAT is flac but the soundfile package is not installed; keeping takes as WAV")
+            return None
+        return cls()
+
+    def _count(self, name, n=1):
+        with self._count_lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def submit(self, wav_path, block=False):
+        """Queue a take for encoding. Returns False (and leaves it as WAV) if the pool is full."""
+        if not self._slots.acquire(blocking=block):
+            self._count('skipped')
+            return False
+        self._count('queued')
+        try:
+            self._executor.submit(self._run, wav_path)
+        except RuntimeError:
+            # shut down
+            self._count('queued', -1)
+            self._slots.release()
+            return False
+        return True
+
+    def _run(self, wav_path):
+        try:
+            if encode_take(wav_path, self.lock):
+                self._count('encoded')
+        except Exception as e:
+            self._count('failed')
+            print(f"Failed to encode {wav_path}: {e}")
+        finally:
+            self._count('queued', -1)
+            self._slots.release()
+
+    def encode_tree(self, audio_root, sessions=None, stop_event=None):
+        """Queue every WAV take under audio_root/session_* (or just `sessions`), waiting for room as it goes."""
+        for ses in list_sessions(audio_root) if sessions is None else sessions:
+            ses_path = os.path.join(audio_root, ses)
+            for name in sorted(os.listdir(ses_path)):
+                if stop_event is not None and stop_event.is_set():
+                    return
+                if name.endswith('.wav'):
+                    self.submit(os.path.join(ses_path, name), block=True)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
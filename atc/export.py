@@ -0,0 +1,261 @@
+"""
+Sharded dataset export for training.
+
+    python -m atc export OUT_DIR [--format tar|parquet] [--audio wav|flac]
+                                 [--rate 16000] [--channels 1] [--shard-size 1G]
+
+metadata.csv is read as a stream and cut into shards of consecutive linked takes,
+each at most --shard-size of audio (estimated from duration and output format, so
+encoded shards come out smaller). Shards are written by a process pool with a
+bounded number in flight, so memory does not grow with the corpus.
+
+    tar       WebDataset layout: <key>.wav|.flac, <key>.txt and <key>.json per take,
+              key = take file name without extension
+    parquet   one row per take: key, session, sentence_id, text, duration,
+              sample_rate, channels, audio_format, audio (bytes); needs pyarrow
+
+A shard is written to a temporary name and renamed when complete, and
+OUT_DIR/manifest.json records every finished shard. Running the same export again
+skips finished shards; the manifest refuses to resume with different options
+(including --sessions) or after the takes behind a finished shard have changed:
+every shard records a fingerprint of its rows' text and of the size and mtime of
+their take files, so a re-recorded, re-encoded or re-worded take is noticed.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import tarfile
+import time
+import wave
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from atc.audiofile import flac_available, read_info, read_samples, resolve, soundfile
+from atc.resample import resample
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 2
+# Parquet rows per row group: bounds what a worker holds in memory
+ROW_GROUP = 64
+# bytes a tar member header and the text/json members add per take, for shard sizing
+TAKE_OVERHEAD = 3 * 512 + 1024
+
+
+def parse_size(text):
+    """'512M' -> bytes."""
+    text = str(text).strip().upper()
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def metadata_rows(global_meta, audio_root, sessions=None):
+    """Linked takes listed in metadata.csv as dicts, in file order, with their resolved path."""
+    with open(global_meta, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            if sessions is not None and row['session'] not in sessions:
+                continue
+            try:
+                duration = float(row['duration'] or 0)
+            except ValueError:
+                continue
+            if duration <= 0 or not row['audio_file']:
+                continue
+            path = resolve(os.path.join(audio_root, row['session'], row['audio_file']))
+            if path is None:
+                continue
+            yield {'key': os.path.splitext(os.path.basename(path))[0], 'session': row['session'],
+                   'sentence_id': int(row['sentence_id']), 'text': row['text'], 'duration': duration,
+                   'path': path}
+
+
+def plan_shards(rows, max_bytes, rate=None, channels=None):
+    """Group rows into lists whose estimated exported size stays under max_bytes."""
+    shard = []
+    size = 0
+    for row in rows:
+        if rate:
+            estimate = int(row['duration'] * rate * (channels or 1) * 2)
+        else:
+            estimate = os.path.getsize(row['path'])
+        estimate += TAKE_OVERHEAD + len(row['text'].encode('utf-8'))
+        if shard and size + estimate > max_bytes:
+            yield shard
+            shard = []
+            size = 0
+        shard.append(row)
+        size += estimate
+    if shard:
+        yield shard
+
+
+def shard_fingerprint(rows):
+    """Digest of what a shard is made of: each row's key, text and duration, and its take's size and mtime."""
+    digest = hashlib.sha1()
+    for row in rows:
+        st = os.stat(row['path'])
+        digest.update(json.dumps([row['key'], row['session'], row['sentence_id'], row['text'], row['duration'],
+                                  os.path.basename(row['path']), st.st_size, st.st_mtime_ns],
+                                 ensure_ascii=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+# -------------------------
+# Shard writing (runs in worker processes)
+# -------------------------
+def encode_audio(path, options):
+    """(bytes, sample_rate, channels) of one take in the export format."""
+    ext = os.path.splitext(path)[1].lstrip('.')
+    rate, channels = options['rate'], options['channels']
+    info = read_info(path)
+    if ext == options['audio'] and not rate and not channels:
+        # already in the requested format: copy as is
+        with open(path, 'rb') as f:
+            return f.read(), info.rate, info.channels
+    out_rate, out_channels = rate or info.rate, channels or info.channels
+    samples = read_samples(path, info)
+    if (out_rate, out_channels) != (info.rate, info.channels):
+        samples = resample(samples, info.channels, info.rate, out_rate, out_channels)
+    buf = io.BytesIO()
+    if options['audio'] == 'flac':
+        soundfile.write(buf, samples.reshape(-1, out_channels), out_rate, subtype='PCM_16', format='FLAC')
+    else:
+        with wave.open(buf, 'wb') as w:
+            w.setnchannels(out_channels)
+            w.setsampwidth(2)
+            w.setframerate(out_rate)
+            w.writeframes(samples.tobytes())
+    return buf.getvalue(), out_rate, out_channels
+
+
+def _add_member(tar, name, data):
+    member = tarfile.TarInfo(name)
+    member.size = len(data)
+    member.mtime = int(time.time())
+    tar.addfile(member, io.BytesIO(data))
+
+
+def _write_tar(path, rows, options):
+    with tarfile.open(path, 'w') as tar:
+        for row in rows:
+            audio, rate, channels = encode_audio(row['path'], options)
+            _add_member(tar, f"{row['key']}.{options['audio']}", audio)
+            _add_member(tar, f"{row['key']}.txt", row['text'].encode('utf-8'))
+            meta = {k: row[k] for k in ('session', 'sentence_id', 'text', 'duration')}
+            meta.update({'sample_rate': rate, 'channels': channels})
+            _add_member(tar, f"{row['key']}.json", json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+
+def _write_parquet(path, rows, options):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([('key', pa.string()), ('session', pa.string()), ('sentence_id', pa.int32()),
+                        ('text', pa.string()), ('duration', pa.float64()), ('sample_rate', pa.int32()),
+                        ('channels', pa.int32()), ('audio_format', pa.string()), ('audio', pa.binary())])
+    with pq.ParquetWriter(path, schema) as writer:
+        for start in range(0, len(rows), ROW_GROUP):
+            group = {name: [] for name in schema.names}
+            for row in rows[start:start + ROW_GROUP]:
+                audio, rate, channels = encode_audio(row['path'], options)
+                for k in ('key', 'session', 'sentence_id', 'text', 'duration'):
+                    group[k].append(row[k])
+                group['sample_rate'].append(rate)
+                group['channels'].append(channels)
+                group['audio_format'].append(options['audio'])
+                group['audio'].append(audio)
+            writer.write_table(pa.table(group, schema=schema))
+
+
+def write_shard(out_dir, index, rows, options):
+    """Write one shard and return its manifest entry."""
+    name = f"shard-{index:06d}.{options['format']}"
+    path = os.path.join(out_dir, name)
+    # taken before the takes are read, so a take changed while writing makes the next run refuse
+    fingerprint = shard_fingerprint(rows)
+    tmp_path = path + ".tmp"
+    if options['format'] == 'parquet':
+        _write_parquet(tmp_path, rows, options)
+    else:
+        _write_tar(tmp_path, rows, options)
+    os.replace(tmp_path, path)
+    return {'index': index, 'file': name, 'count': len(rows), 'seconds': sum(r['duration'] for r in rows),
+            'bytes': os.path.getsize(path), 'first': rows[0]['key'], 'last': rows[-1]['key'],
+            'fingerprint': fingerprint}
+
+
+# -------------------------
+# Driver
+# -------------------------
+def _load_manifest(out_dir, options):
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'version': MANIFEST_VERSION, 'options': options, 'shards': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f"{out_dir} holds an export from an older version without shard fingerprints; "
+                         "use a new output directory")
+    if manifest.get('options') != options:
+        raise ValueError(f"{out_dir} holds an export with other options {manifest.get('options')}; "
+                         "use a new output directory")
+    return manifest
+
+
+def _save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def export(global_meta, audio_root, out_dir, fmt='tar', audio='wav', rate=None, channels=None,
+           shard_size=1 << 30, jobs=None, sessions=None, progress=print):
+    """Write (or resume) a sharded export. Returns the manifest."""
+    if audio == 'flac' and not flac_available():
+        raise ValueError("FLAC output needs the soundfile package")
+    if fmt == 'parquet':
+        import pyarrow  # noqa: F401  (fail before any work is done)
+    os.makedirs(out_dir, exist_ok=True)
+    options = {'format': fmt, 'audio': audio, 'rate': rate, 'channels': channels, 'shard_size': shard_size,
+               'sessions': sorted(sessions) if sessions is not None else None}
+    manifest = _load_manifest(out_dir, options)
+    done = manifest['shards']
+    jobs = jobs or os.cpu_count() or 1
+    started = time.monotonic()
+    exported = 0.0
+
+    def finished(entry):
+        nonlocal exported
+        done[str(entry['index'])] = entry
+        _save_manifest(out_dir, manifest)
+        exported += entry['seconds']
+        minutes = max(time.monotonic() - started, 1e-9) / 60
+        progress(f"{entry['file']}: {entry['count']} takes, {entry['seconds'] / 3600:.2f} h, "
+                 f"{exported / 3600 / minutes:.2f} audio-h/min")
+
+    shards = plan_shards(metadata_rows(global_meta, audio_root, sessions), shard_size, rate, channels)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        pending = set()
+        for index, rows in enumerate(shards):
+            entry = done.get(str(index))
+            if entry is not None:
+                if ((entry['first'], entry['last'], entry['count']) != (rows[0]['key'], rows[-1]['key'], len(rows))
+                        or entry.get('fingerprint') != shard_fingerprint(rows)):
+                    raise ValueError(f"shard {index} no longer matches the corpus; use a new output directory")
+                if os.path.exists(os.path.join(out_dir, entry['file'])):
+                    continue
+            # keep at most two shards per worker in flight: the plan is consumed lazily
+            while len(pending) >= 2 * jobs:
+                completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    finished(future.result())
+            pending.add(pool.submit(write_shard, out_dir, index, rows, options))
+        for future in wait(pending).done:
+            finished(future.result())
+    minutes = max(time.monotonic() - started, 1e-9) / 60
+    total = sum(e['seconds'] for e in done.values())
+    progress(f"{len(done)} shards, {total / 3600:.2f} h of audio in {out_dir}; "
+             f"this run: {exported / 3600:.2f} h in {minutes:.1f} min ({exported / 3600 / minutes:.2f} audio-h/min)")
+    return manifest
@@ -0,0 +1,111 @@
+"""
+Ordered background I/O for the recorder window.
+
+Linking, pausing or skipping a take used to rename files, rewrite the session
+transcript and flush the take on the Tk thread, freezing the window on slow
+disks. The recorder now hands those steps to an IOQueue: jobs run on a single
+worker thread strictly in the order they were submitted (so a take is closed
+before it is linked, and links and replacements in a session land in the order
+they were made), and each job's result or exception is passed to its callback
+back on the Tk thread, polled through `schedule` (Tk's `after`). Nothing here
+touches Tk itself.
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+from atc import metrics
+
+POLL_MS = 20
+
+
+class IOQueue:
+    def __init__(self, schedule, on_change=None, poll_ms=POLL_MS):
+        """`schedule(ms, fn)` runs fn on the UI thread; `on_change(pending)` is told how many jobs are outstanding."""
+        self.schedule = schedule
+        self.on_change = on_change
+        self.poll_ms = poll_ms
+        # jobs submitted and not yet delivered back to the UI thread (only touched there)
+        self.pending = 0
+        self._jobs = queue.Queue()
+        self._done = deque()
+        self._polling = False
+        self._thread = threading.Thread(target=self._run, name="io", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, on_done=None, on_error=None):
+        """
+        Run fn(*args) after every job submitted before it. on_done(result) or
+        on_error(exception) is then called on the UI thread; errors without an
+        on_error are printed.
+        """
+        self.pending += 1
+        self._jobs.put((fn, args, on_done, on_error))
+        self._changed()
+        if not self._polling:
+            self._polling = True
+            self.schedule(self.poll_ms, self.poll)
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                self._jobs.task_done()
+                return
+            fn, args, on_done, on_error = job
+            t0 = time.perf_counter()
+            try:
+                self._done.append((on_done, fn(*args), None, fn))
+            except Exception as e:
+                self._done.append((on_error, None, e, fn))
+            finally:
+                if metrics.ENABLED:
+                    metrics.registry.record(f"io.{getattr(fn, '__name__', 'job')}", time.perf_counter() - t0)
+                self._jobs.task_done()
+
+    def poll(self):
+        """Deliver finished jobs (UI thread)."""
+        self._polling = False
+        self._deliver()
+        if self.pending and not self._polling:
+            self._polling = True
+            self.schedule(self.poll_ms, self.poll)
+
+    def _deliver(self):
+        delivered = False
+        while self._done:
+            callback, result, error, fn = self._done.popleft()
+            self.pending -= 1
+            delivered = True
+            try:
+                if error is not None:
+                    if callback is not None:
+                        callback(error)
+                    else:
+                        print(f"Background {getattr(fn, '__name__', 'job')} failed: {error}")
+                elif callback is not None:
+                    callback(result)
+            except Exception as e:
+                print(f"Error in completion of {getattr(fn, '__name__', 'job')}: {e}")
+        if delivered:
+            self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(self.pending)
+
+    def drain(self):
+        """Block until every submitted job has run and deliver the results (UI thread)."""
+        while True:
+            self._jobs.join()
+            self._deliver()
+            # completion callbacks may have queued more work
+            if not self.pending:
+                return
+
+    def shutdown(self):
+        """Drain and stop the worker."""
+        self.drain()
+        self._jobs.put(None)
+        self._thread.join()
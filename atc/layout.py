@@ -0,0 +1,51 @@
+"""
+Where things live in a corpus directory.
+
+    audio/session_XX/<speaker>_session_XX_sentNNNN.wav   takes
+    audio/session_XX/session_info.json                  session-level metadata
+    audio/session_XX/session_XX.metadata.csv            per-session metadata
+    transcripts/session_XX.txt                          session transcript, line N = sent_id N
+    metadata.csv                                        corpus-wide metadata
+"""
+import os
+import re
+
+AUDIO_DIR = "audio"
+TRANSCRIPTS_DIR = "transcripts"
+GLOBAL_META = "metadata.csv"
+
+
+def take_name(speaker_id, session, sent_id):
+    return f"{speaker_id}_{session}_sent{sent_id:04d}.wav"
+
+
+def take_sent_id(name):
+    """The sent_id in a take's file name (WAV or FLAC), or None if it is not a take name."""
+    match = re.search(r"_sent(\d+)\.\w+$", name)
+    return int(match.group(1)) if match else None
+
+
+def list_sessions(audio_root):
+    try:
+        names = os.listdir(audio_root)
+    except OSError:
+        return []
+    return sorted(d for d in names if d.startswith('session_') and os.path.isdir(os.path.join(audio_root, d)))
+
+
+class Corpus:
+    """Paths of one corpus root (the directory the recorder runs in)."""
+    def __init__(self, root="."):
+        self.root = root
+        self.audio_root = os.path.join(root, AUDIO_DIR)
+        self.transcripts_root = os.path.join(root, TRANSCRIPTS_DIR)
+        self.global_meta = os.path.join(root, GLOBAL_META)
+
+    def sessions(self):
+        return list_sessions(self.audio_root)
+
+    def session_path(self, session):
+        return os.path.join(self.audio_root, session)
+
+    def transcript(self, session):
+        return os.path.join(self.transcripts_root, f"{session}.txt")
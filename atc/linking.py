@@ -0,0 +1,117 @@
+"""
+Linking a recorded take to its sentence.
+
+The recorder's write_take (on its I/O thread) and the benchmark suite both call
+link_take, so what is measured is what the recorder runs:
+
+    1. trim leading and trailing silence (TRIM_SILENCE), keeping the original
+       with TRIM_KEEP_RAW
+    2. rename the take into the session and record the sentence: in the store
+       (USE_SQLITE_STORE; committed before the rename, confirmed after it), else
+       by rewriting the session transcript
+    3. write the take's peak sidecar
+    4. record duration and format in the session index
+
+Resampled copies and FLAC encoding are left to the caller's background pools.
+"""
+import os
+import threading
+
+from atc import config, peaks, vad
+from atc.encoder import flac_path
+from atc.wavfile import format_fields, read_header
+
+
+def trim_take(take):
+    """
+    Cut leading and trailing silence off a recorded take (TRIM_SILENCE). Returns the
+    path the untrimmed take was moved to when TRIM_KEEP_RAW is set, else None.
+    """
+    if not config.TRIM_SILENCE:
+        return None
+    raw = take + ".raw"
+    # after a failed link attempt the take is already trimmed; keep the first original
+    keep = raw if config.TRIM_KEEP_RAW and not os.path.exists(raw) else None
+    try:
+        vad.trim_file(take, keep_raw=keep)
+    except Exception as e:
+        print(f"Failed to trim take: {e}")
+    return raw if config.TRIM_KEEP_RAW and os.path.exists(raw) else None
+
+
+def finalize_take(take, audio_file, lock):
+    """Move a recorded take into place, dropping an encoded copy of the take it replaces."""
+    with lock:
+        os.replace(take, audio_file)
+        if os.path.exists(flac_path(audio_file)):
+            os.remove(flac_path(audio_file))
+            peaks.remove_peaks(flac_path(audio_file))
+
+
+def link_to_transcript(take, audio_file, sent_id, text, session_txt, lock):
+    """File-layout linking: rename the take into the session and rewrite the session transcript."""
+    # load existing session transcript lines
+    with open(session_txt, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+
+    if sent_id - 1 < len(lines):
+        # update existing sentence line
+        lines[sent_id - 1] = text + '\n'
+    else:
+        # new line; pad in case an earlier sent_id could not be written
+        while len(lines) < sent_id - 1:
+            lines.append('\n')
+        lines.append(text + '\n')
+
+    # the take is already a complete WAV on disk; finalizing it is a single rename
+    finalize_take(take, audio_file, lock)
+    with open(session_txt, 'w', encoding='utf-8') as f:
+        f.write(''.join(lines))
+
+
+def index_take(index, sent_id, fields, audio_file):
+    """Persist a linked take's index entry, with its duration and format read from the header."""
+    if index is None:
+        return
+    fields = dict(fields)
+    try:
+        # cache duration and format now so end_session never has to open the take
+        fields.update(format_fields(read_header(audio_file)))
+    except Exception as e:
+        print(f"Failed to read take header {audio_file}: {e}")
+        fields['duration'] = None
+    try:
+        index.update(sent_id, **fields)
+    except Exception as e:
+        print(f"Failed to update session index: {e}")
+
+
+def link_take(take, audio_file, sent_id, text, fields, session, session_txt, index, store=None, lock=None):
+    """
+    Link the recorded `take` to sentence `sent_id` as `audio_file` (steps above).
+    `fields` is its index entry (source and line are also stored); `lock` is held
+    while take files are renamed (the encoder's lock). Raises if the take could
+    not be moved into place, in which case the sentence is left as it was.
+    """
+    lock = lock or threading.Lock()
+    raw_take = trim_take(take)
+    if store is not None:
+        info = read_header(take)
+        # committed as 'linking' before the rename; a crash before it is confirmed
+        # is settled by Store.reconcile when the session is next opened
+        store.link(session, sent_id, text, os.path.basename(audio_file), info.nframes / info.rate,
+                   source=fields.get('source'), line=fields.get('line'),
+                   finalize=lambda: finalize_take(take, audio_file, lock))
+    else:
+        link_to_transcript(take, audio_file, sent_id, text, session_txt, lock)
+    if raw_take:
+        try:
+            os.makedirs(os.path.dirname(vad.raw_path(audio_file)), exist_ok=True)
+            os.replace(raw_take, vad.raw_path(audio_file))
+        except Exception as e:
+            print(f"Failed to keep untrimmed take for {audio_file}: {e}")
+    try:
+        peaks.write_peaks(audio_file)
+    except Exception as e:
+        print(f"Failed to write peaks for {audio_file}: {e}")
+    index_take(index, sent_id, fields, audio_file)
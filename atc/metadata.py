@@ -0,0 +1,195 @@
+"""
+Per-session and corpus-wide metadata CSVs.
+
+    audio/session_XX/session_XX.metadata.csv   sentence_id,audio_file,text,duration
+    metadata.csv                               session,sentence_id,audio_file,text,duration
+
+Both are written with the csv module, so sentence text containing commas or
+quotes is quoted; each row is still exactly one line.
+"""
+import csv
+import json
+import os
+
+from atc.layout import take_name
+from atc.audiofile import read_info, resolve
+
+SESSION_HEADER = "sentence_id,audio_file,text,duration\n"
+GLOBAL_HEADER = "session,sentence_id,audio_file,text,duration\n"
+
+
+def session_meta_path(session_path, session_name):
+    return os.path.join(session_path, f"{session_name}.metadata.csv")
+
+
+def transcript_rows(session_path, session_name, transcript_path, speaker_id, durations=None):
+    """
+    (sent_id, audio_file, text, duration) for every line of a session transcript.
+    Durations come from `durations` ({sent_id: seconds}, e.g. the session index) and
+    only takes missing from it are looked up, from their header. audio_file names the
+    file actually on disk (the FLAC once a take has been encoded).
+    """
+    durations = durations or {}
+    with open(transcript_path, 'r', encoding='utf-8') as txt:
+        lines = [line.strip() for line in txt.readlines()]
+    for i, text in enumerate(lines):
+        sent_id = i + 1
+        audio = take_name(speaker_id, session_name, sent_id)
+        audio_p = resolve(os.path.join(session_path, audio))
+        if audio_p:
+            audio = os.path.basename(audio_p)
+        dur = durations.get(sent_id)
+        if dur is None:
+            dur = 0
+            if audio_p:
+                info = read_info(audio_p)
+                dur = info.nframes / info.rate
+        yield sent_id, audio, text, dur
+
+
+def export_session(audio_root, session_name, session_path, transcript_path, speaker_id, global_meta, durations=None):
+    """
+    Write the metadata CSV of a session that has just been closed and merge it into
+    `global_meta`, leaving the other sessions' rows alone (what End Session does in
+    the file layout).
+    """
+    write_session_metadata(session_meta_path(session_path, session_name),
+                           transcript_rows(session_path, session_name, transcript_path, speaker_id, durations=durations))
+    merge_metadata(audio_root, global_meta, sessions=[session_name])
+
+
+def csv_writer(f):
+    return csv.writer(f, lineterminator='\n')
+
+
+def write_session_metadata(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(SESSION_HEADER)
+        writer = csv_writer(f)
+        for sent_id, audio, text, dur in rows:
+            writer.writerow((sent_id, audio, text, dur))
+
+
+def manifest_path(global_meta):
+    return global_meta + ".manifest.json"
+
+
+def _fingerprint(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _session_block(audio_root, ses):
+    """
+    The rows `ses` contributes to the global CSV, as bytes, or None without a CSV.
+    Session CSV lines are complete CSV records, so prefixing the session name keeps
+    them valid.
+    """
+    meta = session_meta_path(os.path.join(audio_root, ses), ses)
+    if not os.path.exists(meta):
+        return None, None
+    fp = _fingerprint(meta)
+    out = []
+    with open(meta, 'r', encoding='utf-8') as m:
+        next(m, None)
+        for line in m:
+            if not line.endswith('\n'):
+                line += '\n'
+            out.append(f"{ses},{line}")
+    return ''.join(out).encode('utf-8'), fp
+
+
+def _load_manifest(global_meta):
+    """The manifest if it still describes global_meta byte for byte, else None."""
+    try:
+        with open(manifest_path(global_meta), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != 1 or _fingerprint(global_meta) != manifest['file']:
+            return None
+        return manifest
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save_manifest(global_meta, manifest):
+    manifest['file'] = _fingerprint(global_meta)
+    tmp_path = manifest_path(global_meta) + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path(global_meta))
+
+
+def rebuild_metadata(audio_root, global_meta="metadata.csv"):
+    """Rewrite the global metadata.csv from every session's metadata CSV."""
+    manifest = {'version': 1, 'sessions': []}
+    sessions = sorted(d for d in os.listdir(audio_root) if d.startswith('session_'))
+    tmp_path = global_meta + ".tmp"
+    with open(tmp_path, 'wb') as g:
+        g.write(GLOBAL_HEADER.encode('utf-8'))
+        for ses in sessions:
+            block, fp = _session_block(audio_root, ses)
+            if block is None:
+                continue
+            manifest['sessions'].append({'name': ses, 'fingerprint': fp, 'offset': g.tell(), 'length': len(block)})
+            g.write(block)
+    os.replace(tmp_path, global_meta)
+    _save_manifest(global_meta, manifest)
+
+
+def merge_metadata(audio_root, global_meta="metadata.csv", sessions=None):
+    """
+    Bring the global metadata.csv up to date incrementally.
+
+    The manifest next to it records, for every session, the fingerprint (size and
+    mtime) of the session CSV its rows came from and where those rows sit in the
+    global file. Only sessions whose fingerprint changed are rewritten: a new
+    session is appended, a changed session is rewritten at its offset and only the
+    rows after it are moved. `sessions` limits the check to those names (end_session
+    passes just the session it closed); by default every session is checked. Without
+    a valid manifest the file is rebuilt once.
+    """
+    manifest = _load_manifest(global_meta) if os.path.exists(global_meta) else None
+    if manifest is None:
+        rebuild_metadata(audio_root, global_meta)
+        return
+    entries = manifest['sessions']
+    if sessions is None:
+        # sessions on disk plus those whose directory has since been removed
+        sessions = sorted({d for d in os.listdir(audio_root) if d.startswith('session_')}
+                          | {e['name'] for e in entries})
+    changed = False
+    with open(global_meta, 'r+b') as g:
+        for ses in sessions:
+            pos = next((i for i, e in enumerate(entries) if e['name'] == ses), None)
+            meta = session_meta_path(os.path.join(audio_root, ses), ses)
+            exists = os.path.exists(meta)
+            if pos is not None and exists and entries[pos]['fingerprint'] == _fingerprint(meta):
+                continue
+            if pos is None and not exists:
+                continue
+            block, fp = _session_block(audio_root, ses) if exists else (b'', None)
+            if pos is None:
+                # new session: append
+                g.seek(0, os.SEEK_END)
+                entries.append({'name': ses, 'fingerprint': fp, 'offset': g.tell(), 'length': len(block)})
+                g.write(block)
+            else:
+                entry = entries[pos]
+                end = entry['offset'] + entry['length']
+                g.seek(end)
+                tail = g.read()
+                g.seek(entry['offset'])
+                g.write(block)
+                g.write(tail)
+                g.truncate()
+                delta = len(block) - entry['length']
+                for later in entries[pos + 1:]:
+                    later['offset'] += delta
+                if fp is None:
+                    del entries[pos]
+                else:
+                    entry['fingerprint'] = fp
+                    entry['length'] = len(block)
+            changed = True
+    if changed:
+        _save_manifest(global_meta, manifest)
@@ -0,0 +1,268 @@
+"""
+Latency and counter instrumentation (METRICS).
+
+With METRICS on, methods decorated with @timed record how long every call takes
+into a Histogram (log-spaced buckets, so recording is O(1) and percentiles are
+within 10%), and count()/gauge() keep counters (capture overruns, bytes written)
+and the depth of the background queues. Every METRICS_INTERVAL_SECONDS a
+Reporter appends one JSON line with the interval's numbers to METRICS_FILE,
+rotated to METRICS_FILE.1, .2, ... once it reaches METRICS_MAX_MB.
+
+With METRICS off (the default), @timed returns the function itself and count()
+and gauge() return at once, so nothing is measured and nothing is written.
+Settings are read once, when this module is imported (see atc.config).
+"""
+import datetime
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+from atc import config
+
+ENABLED = bool(config.METRICS)
+
+# bucket 0 holds everything up to MIN_SECONDS; then BUCKETS_PER_OCTAVE buckets per doubling
+MIN_SECONDS = 1e-7
+BUCKETS_PER_OCTAVE = 8
+OCTAVES = 32
+_BUCKETS = OCTAVES * BUCKETS_PER_OCTAVE + 1
+_SCALE = BUCKETS_PER_OCTAVE / math.log(2)
+_LOG_MIN = math.log(MIN_SECONDS)
+
+
+def bucket_upper(i):
+    """Upper bound in seconds of histogram bucket i."""
+    return MIN_SECONDS * 2 ** (i / BUCKETS_PER_OCTAVE)
+
+
+class Histogram:
+    """Durations in seconds; not locked (Registry serialises access)."""
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        if seconds > MIN_SECONDS:
+            i = min(_BUCKETS - 1, int((math.log(seconds) - _LOG_MIN) * _SCALE) + 1)
+        else:
+            i = 0
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            if n:
+                self.counts[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile (0-100), at most the maximum."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * q / 100))
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bucket_upper(i), self.max)
+        return self.max
+
+    def summary(self):
+        """count, mean, p50, p95, p99 and max, in milliseconds."""
+        ms = 1000.0
+        return {'count': self.count,
+                'mean': round(self.total / self.count * ms, 3) if self.count else 0.0,
+                'p50': round(self.percentile(50) * ms, 3),
+                'p95': round(self.percentile(95) * ms, 3),
+                'p99': round(self.percentile(99) * ms, 3),
+                'max': round(self.max * ms, 3)}
+
+
+class Registry:
+    """
+    Histograms and counters since the last report (`interval`) and since start
+    (`totals`), plus gauges: the last value set, or callables sampled when a
+    snapshot is taken (watch()).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self._timings = {}
+        self._counters = {}
+        self._total_timings = {}
+        self._total_counters = {}
+        self._gauges = {}
+        self._watched = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            hist = self._timings.get(name)
+            if hist is None:
+                hist = self._timings[name] = Histogram()
+            hist.record(seconds)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        self._gauges[name] = value
+
+    def watch(self, name, fn):
+        """Sample fn() as gauge `name` whenever a snapshot is taken."""
+        self._watched[name] = fn
+
+    def _sample_gauges(self):
+        gauges = dict(self._gauges)
+        for name, fn in list(self._watched.items()):
+            try:
+                gauges[name] = fn()
+            except Exception as e:
+                gauges[name] = None
+                print(f"Failed to sample {name}: {e}")
+        return gauges
+
+    def snapshot(self, interval=False):
+        """
+        Summaries of everything recorded since start, or with interval=True of
+        what was recorded since the last interval snapshot (which starts a new one).
+        """
+        with self._lock:
+            timings, counters = self._timings, self._counters
+            if interval:
+                self._timings, self._counters = {}, {}
+                for name, hist in timings.items():
+                    self._total_timings.setdefault(name, Histogram()).merge(hist)
+                for name, n in counters.items():
+                    self._total_counters[name] = self._total_counters.get(name, 0) + n
+            else:
+                totals = {name: Histogram() for name in set(timings) | set(self._total_timings)}
+                for source in (self._total_timings, timings):
+                    for name, hist in source.items():
+                        totals[name].merge(hist)
+                timings = totals
+                counters = dict(self._total_counters)
+                for name, n in self._counters.items():
+                    counters[name] = counters.get(name, 0) + n
+            timings = {name: hist.summary() for name, hist in sorted(timings.items())}
+        return {'timings': timings, 'counters': dict(sorted(counters.items())),
+                'gauges': dict(sorted(self._sample_gauges().items()))}
+
+
+registry = Registry()
+
+
+def timed(name=None):
+    """
+    Decorator recording the duration of every call under `name` (default: the
+    function's qualified name). Returns the function unchanged when METRICS is off.
+    """
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        key = name or fn.__qualname__
+        record = registry.record
+        clock = time.perf_counter
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(key, clock() - t0)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1):
+    if ENABLED:
+        registry.count(name, n)
+
+
+def gauge(name, value):
+    if ENABLED:
+        registry.gauge(name, value)
+
+
+def watch(name, fn):
+    if ENABLED:
+        registry.watch(name, fn)
+
+
+# -------------------------
+# JSON-lines report
+# -------------------------
+class RotatingLog:
+    """Appends lines to `path`, moving it to path.1 (and older ones up) once it exceeds max_bytes."""
+    def __init__(self, path, max_bytes, backups):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+
+    def _rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+
+    def write(self, line):
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+            self._rotate()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + "\n")
+
+
+class Reporter:
+    """Writes an interval snapshot of `registry` to the metrics log every `interval` seconds."""
+    def __init__(self, registry=registry, path=None, interval=None):
+        self.registry = registry
+        self.interval = config.METRICS_INTERVAL_SECONDS if interval is None else interval
+        self.log = RotatingLog(path or config.METRICS_FILE, int(config.METRICS_MAX_MB * (1 << 20)),
+                               int(config.METRICS_BACKUPS))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def report(self):
+        data = self.registry.snapshot(interval=True)
+        data['time'] = datetime.datetime.now().isoformat(timespec='seconds')
+        try:
+            self.log.write(json.dumps(data))
+        except Exception as e:
+            print(f"Failed to write metrics: {e}")
+
+    def stop(self):
+        """Stop the thread and write what was recorded since the last report."""
+        self._stop.set()
+        self._thread.join()
+        self.report()
+
+
+def format_overlay(snapshot):
+    """Text of the debug overlay: one line per timing, then counters and gauges."""
+    lines = [f"{'':<22}{'n':>7}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}  ms"]
+    for name, t in snapshot['timings'].items():
+        lines.append(f"{name[-22:]:<22}{t['count']:>7}{t['p50']:>8.1f}{t['p95']:>8.1f}{t['p99']:>8.1f}{t['max']:>8.1f}")
+    values = list(snapshot['counters'].items()) + list(snapshot['gauges'].items())
+    if values:
+        lines.append("")
+        lines.extend(f"{name:<22}{value}" for name, value in values)
+    return "\n".join(lines)
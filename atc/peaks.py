@@ -0,0 +1,239 @@
+"""
+Multi-resolution peak sidecar files for linked takes.
+
+For every `audio/session_XX/<take>.wav` a `.peaks/<take>.peaks` file holds min/max
+envelopes at a few fixed zoom levels. The static waveform view reads only the
+level closest to the canvas width (read_width), so landing on a linked line
+touches a few KB instead of the whole recording. Sidecars are read into memory,
+never mapped, so they can be rebuilt or renamed while a waveform is shown
+(Windows refuses to replace a file that is still mapped). A sidecar records the size
+and mtime of the WAV it was built from and is ignored once they no longer match.
+
+Layout (little endian):
+    header  magic 'ATCP', version u16, level count u16, wav size u64, wav mtime_ns u64
+    levels  per level: samples per peak u32, peak count u32, byte offset u64
+    data    per level: peak count x (min i16, max i16)
+"""
+import os
+import struct
+
+import numpy as np
+
+from atc.audiofile import is_take, read_info, read_samples
+
+MAGIC = b'ATCP'
+VERSION = 1
+LEVELS = (256, 1024, 4096, 16384)
+PEAKS_DIR = ".peaks"
+
+_HEADER = struct.Struct('<4sHHQQ')
+_LEVEL = struct.Struct('<IIQ')
+# samples reduced per pass when building the finest level from a memory-mapped take
+_BLOCK_PEAKS = 4096
+
+
+def peaks_path(wav_path):
+    return os.path.join(os.path.dirname(wav_path), PEAKS_DIR, os.path.basename(wav_path) + ".peaks")
+
+
+def compute_levels(samples, channels=1, levels=LEVELS):
+    """
+    Build [(samples_per_peak, mins, maxs), ...] from interleaved int16 samples.
+    The finest level is reduced block by block so a memmap is never read into memory
+    in one piece; every coarser level is reduced from the one before it.
+    """
+    base = levels[0] * channels
+    n = len(samples)
+    count = -(-n // base)
+    mins = np.empty(count, dtype=np.int16)
+    maxs = np.empty(count, dtype=np.int16)
+    full = n // base
+    step = base * _BLOCK_PEAKS
+    for a in range(0, full * base, step):
+        block = np.asarray(samples[a:min(a + step, full * base)]).reshape(-1, base)
+        i = a // base
+        mins[i:i + len(block)] = block.min(axis=1)
+        maxs[i:i + len(block)] = block.max(axis=1)
+    if count > full:
+        tail = np.asarray(samples[full * base:])
+        mins[-1] = tail.min()
+        maxs[-1] = tail.max()
+    out = [(levels[0], mins, maxs)]
+    for spp in levels[1:]:
+        prev_spp, prev_mins, prev_maxs = out[-1]
+        if len(prev_mins) == 0:
+            out.append((spp, prev_mins, prev_maxs))
+            continue
+        idx = np.arange(0, len(prev_mins), spp // prev_spp)
+        out.append((spp, np.minimum.reduceat(prev_mins, idx), np.maximum.reduceat(prev_maxs, idx)))
+    return out
+
+
+def write_peaks(wav_path, levels=None):
+    """
+    (Re)build the sidecar for the take at `wav_path` (WAV or FLAC). Returns the levels,
+    which are computed from the take unless already given.
+    """
+    st = os.stat(wav_path)
+    if levels is None:
+        info = read_info(wav_path)
+        samples = read_samples(wav_path, info)
+        levels = compute_levels(samples, info.channels)
+        del samples
+    out_path = peaks_path(wav_path)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    offset = _HEADER.size + _LEVEL.size * len(levels)
+    table = []
+    for spp, mins, _ in levels:
+        table.append(_LEVEL.pack(spp, len(mins), offset))
+        offset += 4 * len(mins)
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(levels), st.st_size, st.st_mtime_ns))
+        f.write(b''.join(table))
+        for _, mins, maxs in levels:
+            pairs = np.empty((len(mins), 2), dtype='<i2')
+            pairs[:, 0] = mins
+            pairs[:, 1] = maxs
+            f.write(pairs.tobytes())
+    os.replace(tmp_path, out_path)
+    return levels
+
+
+def _read_table(wav_path):
+    path = peaks_path(wav_path)
+    try:
+        st = os.stat(wav_path)
+        with open(path, 'rb') as f:
+            magic, version, n_levels, size, mtime_ns = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC or version != VERSION or size != st.st_size or mtime_ns != st.st_mtime_ns:
+                return None
+            return [_LEVEL.unpack(f.read(_LEVEL.size)) for _ in range(n_levels)]
+    except (OSError, struct.error):
+        return None
+
+
+def is_fresh(wav_path):
+    return _read_table(wav_path) is not None
+
+
+def _read_pairs(wav_path, count, offset):
+    """`count` (min, max) pairs at byte `offset` of the sidecar, as a (count, 2) array, or None."""
+    try:
+        with open(peaks_path(wav_path), 'rb') as f:
+            f.seek(offset)
+            pairs = np.fromfile(f, dtype='<i2', count=2 * count)
+    except OSError:
+        return None
+    if len(pairs) != 2 * count:
+        return None
+    return pairs.reshape(count, 2)
+
+
+def load_levels(wav_path):
+    """
+    Every level of a valid sidecar as in-memory (samples_per_peak, mins, maxs) tuples,
+    or None when the sidecar is missing, unreadable or stale.
+    """
+    table = _read_table(wav_path)
+    if table is None:
+        return None
+    levels = []
+    for spp, count, offset in table:
+        pairs = _read_pairs(wav_path, count, offset)
+        if pairs is None:
+            return None
+        levels.append((spp, pairs[:, 0], pairs[:, 1]))
+    return levels
+
+
+def read_width(wav_path, width):
+    """
+    (mins, maxs) for drawing `wav_path` `width` columns wide from its sidecar, reading
+    only the level reduce_to_width would pick; None when the sidecar is missing,
+    unreadable or stale. Never builds one.
+    """
+    table = _read_table(wav_path)
+    if not table:
+        return None
+    width = max(1, int(width))
+    spp, count, offset = table[0]
+    for level in table:
+        if level[1] >= width:
+            spp, count, offset = level
+    pairs = _read_pairs(wav_path, count, offset)
+    if pairs is None:
+        return None
+    return reduce_to_width([(spp, pairs[:, 0], pairs[:, 1])], width)
+
+
+def remove_peaks(wav_path):
+    try:
+        os.remove(peaks_path(wav_path))
+    except OSError:
+        pass
+
+
+def reduce_to_width(levels, width):
+    """
+    Pick the coarsest level that still has at least `width` peaks and fold it down to
+    at most `width` columns. Returns (mins, maxs) arrays that share no memory with `levels`.
+    """
+    width = max(1, int(width))
+    chosen = levels[0]
+    for level in levels:
+        if len(level[1]) >= width:
+            chosen = level
+    _, mins, maxs = chosen
+    if len(mins) <= width:
+        return np.array(mins), np.array(maxs)
+    idx = np.arange(0, len(mins), -(-len(mins) // width))
+    return np.minimum.reduceat(mins, idx), np.maximum.reduceat(maxs, idx)
+
+
+def peaks_for_width(wav_path, width, sidecar=True):
+    """
+    (mins, maxs) for drawing `wav_path` `width` columns wide. With `sidecar` a stale or
+    missing sidecar is rebuilt on the way, which decodes the whole take (the recorder
+    calls read_width instead and rebuilds in the background); without it the levels
+    are computed in memory and nothing is written.
+    """
+    if sidecar:
+        peaks = read_width(wav_path, width)
+        if peaks is not None:
+            return peaks
+        levels = write_peaks(wav_path)
+    else:
+        info = read_info(wav_path)
+        levels = compute_levels(read_samples(wav_path, info), info.channels)
+    return reduce_to_width(levels, width)
+
+
+def regenerate_tree(audio_root, stop_event=None):
+    """
+    Build missing or stale sidecars for every take under audio_root/session_*.
+    Meant for a background thread; returns how many sidecars were written.
+    """
+    written = 0
+    try:
+        sessions = sorted(d for d in os.listdir(audio_root) if d.startswith('session_'))
+    except OSError:
+        return 0
+    for ses in sessions:
+        ses_path = os.path.join(audio_root, ses)
+        if not os.path.isdir(ses_path):
+            continue
+        for name in sorted(os.listdir(ses_path)):
+            if stop_event is not None and stop_event.is_set():
+                return written
+            if not is_take(name):
+                continue
+            wav_path = os.path.join(ses_path, name)
+            if is_fresh(wav_path):
+                continue
+            try:
+                write_peaks(wav_path)
+                written += 1
+            except Exception as e:
+                print(f"Failed to build peaks for {wav_path}: {e}")
+    return written
@@ -0,0 +1,161 @@
+"""
+Take playback through the application's audio backend (see atc.backends).
+
+A take is decoded once into memory (WAV or FLAC, see atc.audiofile) and kept until
+a different or changed file is loaded, so playing it again, seeking or restarting
+never touches the disk. The output callback copies the next frames from that
+buffer and advances an integer frame cursor: the playback position is that cursor
+minus the output latency, exact to the sample rather than the ~10 ms steps of
+pygame's get_pos().
+"""
+import os
+import threading
+
+import numpy as np
+
+from atc.audiofile import read_info, read_samples
+
+
+class PlaybackEngine:
+    def __init__(self, backend, frames_per_buffer=1024, device=None):
+        self.backend = backend
+        self.device = device
+        self.frames_per_buffer = frames_per_buffer
+        self.stream = None
+        self.path = None
+        self._stamp = None
+        self.samples = np.zeros(0, dtype=np.int16)
+        self.rate = 44100
+        self.channels = 1
+        self.nframes = 0
+        self.cursor = 0
+        self.stop_frame = 0
+        self._lock = threading.Lock()
+
+    # -------------------------
+    # Loading
+    # -------------------------
+    def load(self, path, cached=None):
+        """
+        Decode `path` unless it is already loaded and unchanged. Resets the cursor on a
+        new take. `cached` is a current atc.prefetch.CachedTake of `path`, used instead
+        of reading the file.
+        """
+        if cached is not None:
+            stamp = cached.stamp
+        else:
+            st = os.stat(path)
+            stamp = (st.st_size, st.st_mtime_ns)
+        if path == self.path and stamp == self._stamp:
+            return
+        self.stop()
+        if cached is not None:
+            # cached samples are never modified, so they are shared rather than copied
+            self.samples, rate, channels = cached.samples, cached.rate, cached.channels
+        else:
+            info = read_info(path)
+            samples = read_samples(path, info)
+            # a private copy: a memmap would keep the take file open (Windows) and may change under us
+            self.samples = np.array(samples, dtype=np.int16)
+            del samples
+            rate, channels = info.rate, info.channels
+        if self.stream is not None and (rate, channels) != (self.rate, self.channels):
+            self.close()
+        self.rate = rate
+        self.channels = channels
+        self.nframes = len(self.samples) // self.channels
+        self.path = path
+        self._stamp = stamp
+        self.cursor = 0
+        self.stop_frame = self.nframes
+
+    def unload(self):
+        self.close()
+        self.path = None
+        self._stamp = None
+        self.samples = np.zeros(0, dtype=np.int16)
+        self.nframes = self.cursor = self.stop_frame = 0
+
+    @property
+    def duration(self):
+        """Length of the loaded take in seconds (computed once per load)."""
+        return self.nframes / self.rate if self.rate else 0.0
+
+    # -------------------------
+    # Transport
+    # -------------------------
+    def _callback(self, frame_count):
+        with self._lock:
+            start = self.cursor
+            end = min(start + frame_count, self.stop_frame)
+            self.cursor = max(start, end)
+        chunk = self.samples[start * self.channels:end * self.channels]
+        if end - start < frame_count:
+            pad = np.zeros((frame_count - max(0, end - start)) * self.channels, dtype=np.int16)
+            return np.concatenate((chunk, pad)).tobytes(), True
+        return chunk.tobytes(), False
+
+    def _open(self):
+        if self.stream is not None:
+            return
+        self.stream = self.backend.open_output(self.rate, self.channels, self.frames_per_buffer, self._callback,
+                                               device=self.device)
+
+    def play(self, start=None, stop=None):
+        """
+        Play from `start` (seconds, default: the cursor, or the beginning once the end
+        was reached) up to `stop` (default: the end of the take).
+        """
+        self._halt()
+        with self._lock:
+            self.stop_frame = self.nframes if stop is None else min(self.nframes, int(stop * self.rate))
+            if start is not None:
+                self.cursor = max(0, min(self.nframes, int(start * self.rate)))
+            elif self.cursor >= self.stop_frame:
+                self.cursor = 0
+        self._open()
+        self.stream.start()
+
+    def restart(self):
+        self.play(start=0)
+
+    def pause(self):
+        """Stop output and keep the cursor where the listener heard it last."""
+        if self.stream is None or not self.stream.active:
+            return
+        heard = int(self.position() * self.rate)
+        self._halt()
+        with self._lock:
+            self.cursor = heard
+
+    def stop(self):
+        self._halt()
+        with self._lock:
+            self.cursor = 0
+            self.stop_frame = self.nframes
+
+    def seek(self, seconds):
+        with self._lock:
+            self.cursor = max(0, min(self.nframes, int(seconds * self.rate)))
+
+    def _halt(self):
+        if self.stream is not None and not self.stream.stopped:
+            self.stream.stop()
+
+    def close(self):
+        if self.stream is not None:
+            self._halt()
+            self.stream.close()
+            self.stream = None
+
+    @property
+    def active(self):
+        """True while output is running (False once a play reached its stop point)."""
+        return self.stream is not None and self.stream.active
+
+    def position(self):
+        """Seconds of the take the listener has heard: the cursor minus what is still buffered."""
+        cursor = self.cursor
+        if self.active:
+            cursor -= int(self.stream.latency * self.rate)
+        return max(0, cursor) / self.rate if self.rate else 0.0
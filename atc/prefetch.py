@@ -0,0 +1,149 @@
+"""
+Background prefetch of neighbouring takes for navigation.
+
+TakeCache is an LRU of decoded takes (samples plus waveform peak levels) bounded
+by a byte budget. A Prefetcher thread fills it with the takes around the line on
+screen, so moving to the previous or next line draws the waveform and starts
+playback from memory instead of the disk. Entries remember the size and mtime of
+the file they were decoded from and are dropped when those change; linking or
+replacing a take also invalidates it explicitly.
+"""
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from atc import peaks
+from atc.audiofile import read_info, read_samples, resolve
+
+CachedTake = namedtuple('CachedTake', 'path stamp samples rate channels levels nbytes')
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def decode_take(path):
+    """Load a take and its peak levels into memory as a CachedTake."""
+    stamp = _stamp(path)
+    info = read_info(path)
+    samples = read_samples(path, info)
+    # private copies: nothing in the cache may keep a take or sidecar file mapped
+    data = np.array(samples, dtype=np.int16)
+    del samples
+    levels = peaks.load_levels(path)
+    if levels is None:
+        levels = peaks.compute_levels(data, info.channels)
+    levels = [(spp, np.array(mins), np.array(maxs)) for spp, mins, maxs in levels]
+    nbytes = data.nbytes + sum(mins.nbytes + maxs.nbytes for _, mins, maxs in levels)
+    return CachedTake(path, stamp, data, info.rate, info.channels, levels, nbytes)
+
+
+class TakeCache:
+    def __init__(self, budget_bytes):
+        self.budget = budget_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, path, count=True):
+        """The cached take at `path` if it is still current, else None."""
+        with self._lock:
+            entry = self.entries.get(path)
+            if entry is not None:
+                try:
+                    current = _stamp(path) == entry.stamp
+                except OSError:
+                    current = False
+                if current:
+                    self.entries.move_to_end(path)
+                    if count:
+                        self.hits += 1
+                    return entry
+                self._drop(path)
+            if count:
+                self.misses += 1
+            return None
+
+    def put(self, entry):
+        if entry.nbytes > self.budget:
+            return
+        with self._lock:
+            if entry.path in self.entries:
+                self._drop(entry.path)
+            self.entries[entry.path] = entry
+            self.bytes += entry.nbytes
+            while self.bytes > self.budget:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def load(self, path):
+        """Cached take, decoding (and caching) it on a miss."""
+        entry = self.get(path)
+        if entry is None:
+            entry = decode_take(path)
+            self.put(entry)
+        return entry
+
+    def invalidate(self, path):
+        """Forget every cached form of a take (its WAV and FLAC file)."""
+        base = os.path.splitext(path)[0]
+        with self._lock:
+            for key in [k for k in self.entries if os.path.splitext(k)[0] == base]:
+                self._drop(key)
+
+    def _drop(self, path):
+        entry = self.entries.pop(path)
+        self.bytes -= entry.nbytes
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self.entries), 'bytes': self.bytes, 'evictions': self.evictions}
+
+
+class Prefetcher:
+    """
+    One daemon thread that decodes requested takes into a TakeCache. Each request
+    replaces the previous one, so after fast navigation only the takes around the
+    latest line are loaded.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self._wanted = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def request(self, paths):
+        """Prefetch `paths` (nearest first); take paths may name the WAV of an encoded take."""
+        with self._cond:
+            self._wanted = list(paths)
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._wanted and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                path = self._wanted.pop(0)
+            path = resolve(path)
+            if path is None or self.cache.get(path, count=False) is not None:
+                continue
+            try:
+                self.cache.put(decode_take(path))
+            except Exception as e:
+                print(f"Failed to prefetch {path}: {e}")
@@ -0,0 +1,233 @@
+"""
+Per-take audio QA: level, clipping, noise and silence metrics.
+
+Every take under audio/session_XX/ gets a row in `session_XX.qa.csv`, keyed by
+audio_file like the metadata CSVs so the two can be joined. Takes are read
+through a memory map in blocks, so a long take never has to fit in memory, and
+scanned in a process pool. A row records the size and mtime of the take it was
+computed from and is reused while they match, so a repeated scan only reads new
+or re-recorded takes.
+
+Columns:
+    peak_dbfs, rms_dbfs   level relative to full scale
+    clip_count            samples at full scale
+    snr_db                loud frames (90th percentile) over quiet frames (10th)
+    lead_silence, trail_silence
+                          seconds before the first / after the last voiced frame
+    silence_ratio         share of frames below SILENCE_DBFS
+    dc_offset             mean sample value, as a fraction of full scale
+    overruns, dropout_seconds
+                          input overruns while the take was recorded and the
+                          audio they cost (filled with silence), copied from the
+                          session index; empty for takes recorded before they
+                          were counted
+    flags                 ';'-separated: empty, unreadable, clipped, silent,
+                          truncated, low_snr, dc, overrun
+"""
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from atc.layout import list_sessions
+from atc.audiofile import canonical_name, is_take, read_info, read_samples
+from atc.session_index import SessionIndex
+
+FRAME_SECONDS = 0.02
+# frames read from the memory map per pass
+BLOCK_FRAMES = 1 << 18
+SILENCE_DBFS = -45.0
+SILENT_TAKE_DBFS = -50.0
+LOW_SNR_DB = 15.0
+DC_LIMIT = 0.01
+# a take whose voice runs closer than this to the end was probably cut off
+TRUNCATED_SECONDS = 0.1
+MIN_DBFS = -120.0
+
+QA_FIELDS = ['audio_file', 'size', 'mtime_ns', 'duration', 'peak_dbfs', 'clip_count', 'rms_dbfs', 'snr_db',
+             'lead_silence', 'trail_silence', 'silence_ratio', 'dc_offset', 'overruns', 'dropout_seconds', 'flags']
+
+
+def qa_path(session_path, session_name):
+    return os.path.join(session_path, f"{session_name}.qa.csv")
+
+
+def dbfs(value):
+    if value <= 0:
+        return MIN_DBFS
+    return max(MIN_DBFS, 20.0 * float(np.log10(value)))
+
+
+def frame_rms(samples, channels=1, frame_len=882):
+    """RMS of each frame of `frame_len` frames (the last may be shorter), as a fraction of full scale."""
+    x = np.asarray(samples).reshape(-1, channels)
+    n = len(x)
+    if n == 0:
+        return np.zeros(0, dtype=np.float32)
+    sq = np.square(x, dtype=np.float32)
+    if channels > 1:
+        sq = sq.mean(axis=1)
+    else:
+        sq = sq.ravel()
+    starts = np.arange(0, n, frame_len)
+    sums = np.add.reduceat(sq, starts)
+    counts = np.diff(np.append(starts, n))
+    return np.sqrt(sums / counts) / 32768.0
+
+
+def take_metrics(path):
+    """QA metrics of one take, as a dict of QA_FIELDS without the file columns."""
+    try:
+        info = read_info(path)
+        samples = read_samples(path, info)
+    except (OSError, ValueError) as e:
+        print(f"Failed to read {path}: {e}")
+        return {'flags': 'unreadable'}
+    n = len(samples) // info.channels
+    if n == 0:
+        return {'duration': 0.0, 'flags': 'empty'}
+    frame_len = max(1, int(info.rate * FRAME_SECONDS))
+    block = max(frame_len, BLOCK_FRAMES // frame_len * frame_len) * info.channels
+    peak = 0
+    clips = 0
+    total = 0
+    total_sq = 0.0
+    rms = []
+    for start in range(0, n * info.channels, block):
+        chunk = samples[start:start + block]
+        lo, hi = int(chunk.min()), int(chunk.max())
+        peak = max(peak, hi, -lo)
+        if hi >= 32767 or lo <= -32767:
+            clips += int(np.count_nonzero((chunk >= 32767) | (chunk <= -32767)))
+        total += int(chunk.sum(dtype=np.int64))
+        f = chunk.astype(np.float64)
+        total_sq += float(np.dot(f, f))
+        rms.append(frame_rms(chunk, info.channels, frame_len))
+    del samples
+    rms = np.concatenate(rms)
+    count = n * info.channels
+    voiced = np.flatnonzero(rms > 10 ** (SILENCE_DBFS / 20))
+    frame_seconds = frame_len / info.rate
+    duration = n / info.rate
+    if len(voiced):
+        lead = voiced[0] * frame_seconds
+        trail = max(0.0, duration - (voiced[-1] + 1) * frame_seconds)
+    else:
+        lead = trail = duration
+    noise, signal = np.percentile(rms, [10, 90])
+    snr = dbfs(signal) - dbfs(max(noise, 1 / 32768))
+    m = {
+        'duration': duration,
+        'peak_dbfs': round(dbfs(peak / 32768), 2),
+        'clip_count': clips,
+        'rms_dbfs': round(dbfs(np.sqrt(total_sq / count) / 32768), 2),
+        'snr_db': round(snr, 2),
+        'lead_silence': round(lead, 3),
+        'trail_silence': round(trail, 3),
+        'silence_ratio': round(1 - len(voiced) / len(rms), 4),
+        'dc_offset': round(total / count / 32768, 5),
+    }
+    flags = []
+    if clips:
+        flags.append('clipped')
+    if m['rms_dbfs'] < SILENT_TAKE_DBFS or not len(voiced):
+        flags.append('silent')
+    elif trail < TRUNCATED_SECONDS:
+        flags.append('truncated')
+    if len(voiced) and snr < LOW_SNR_DB:
+        flags.append('low_snr')
+    if abs(m['dc_offset']) > DC_LIMIT:
+        flags.append('dc')
+    m['flags'] = ';'.join(flags)
+    return m
+
+
+def recorded_overruns(session_path, session_name):
+    """{take name: (overruns, dropout_seconds)} from the session index, for takes that have them."""
+    index = SessionIndex.open(session_path, session_name, readonly=True)
+    return {canonical_name(entry['audio']): (entry['overruns'], entry.get('dropout_seconds', ''))
+            for entry in index.entries.values() if entry.get('audio') and entry.get('overruns') is not None}
+
+
+def apply_overruns(row, recorded):
+    """Copy a take's overrun counts into its row and (un)flag it. Returns True if the row changed."""
+    before = (row.get('overruns'), row.get('dropout_seconds'), row.get('flags'))
+    overruns, seconds = recorded.get(canonical_name(row['audio_file']), ('', ''))
+    flags = [f for f in (row.get('flags') or '').split(';') if f and f != 'overrun']
+    if overruns:
+        flags.append('overrun')
+    row['overruns'] = str(overruns)
+    row['dropout_seconds'] = str(seconds)
+    row['flags'] = ';'.join(flags)
+    return (row['overruns'], row['dropout_seconds'], row['flags']) != before
+
+
+def load_table(path):
+    """{audio_file: row} from a QA CSV, or {} if there is none."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return {row['audio_file']: row for row in csv.DictReader(f)}
+
+
+def write_table(path, rows):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=QA_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for name in sorted(rows):
+            writer.writerow(rows[name])
+    os.replace(tmp_path, path)
+
+
+def scan(audio_root, jobs=None, sessions=None, full=False):
+    """
+    Bring the QA tables of `sessions` (default: all) up to date. Only takes whose
+    size or mtime changed since their row was written are read, unless `full`.
+    Returns {'takes': n, 'scanned': n, 'flagged': [(session, audio_file, flags), ...]}.
+    """
+    sessions = sessions if sessions is not None else list_sessions(audio_root)
+    tables = {}
+    dirty = set()
+    todo = []
+    for ses in sessions:
+        session_path = os.path.join(audio_root, ses)
+        old = {} if full else load_table(qa_path(session_path, ses))
+        current = {}
+        for name in sorted(os.listdir(session_path)):
+            if not is_take(name):
+                continue
+            st = os.stat(os.path.join(session_path, name))
+            row = old.get(name)
+            if row and row.get('size') == str(st.st_size) and row.get('mtime_ns') == str(st.st_mtime_ns):
+                current[name] = row
+            else:
+                current[name] = {'audio_file': name, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+                todo.append((ses, name))
+        if full or set(current) != set(old):
+            dirty.add(ses)
+        tables[ses] = current
+
+    paths = [os.path.join(audio_root, ses, name) for ses, name in todo]
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1 or len(paths) <= 1:
+        results = [take_metrics(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(take_metrics, paths, chunksize=max(1, len(paths) // (jobs * 4))))
+    for (ses, name), metrics in zip(todo, results):
+        tables[ses][name].update(metrics)
+        dirty.add(ses)
+    for ses in sessions:
+        # counted at recording time, so taken from the index rather than the audio
+        recorded = recorded_overruns(os.path.join(audio_root, ses), ses)
+        for row in tables[ses].values():
+            if apply_overruns(row, recorded):
+                dirty.add(ses)
+
+    for ses in sorted(dirty):
+        write_table(qa_path(os.path.join(audio_root, ses), ses), tables[ses])
+    flagged = [(ses, name, row['flags']) for ses in sessions for name, row in sorted(tables[ses].items())
+               if row.get('flags')]
+    return {'takes': sum(len(t) for t in tables.values()), 'scanned': len(todo), 'flagged': flagged}
@@ -0,0 +1,140 @@
+"""
+Polyphase resampling and downmixing of takes to training formats.
+
+Takes are recorded in the capture profile (CAPTURE_RATE etc.); ASR training often
+wants 16 kHz mono. `write_derivative` writes such a copy of a take into a parallel
+tree, audio_<rate>/session_XX/<take>.wav, either at link time (DERIVATIVE_RATE) or
+in batch (`python -m atc resample`).
+
+Resampling by up/down (the rates divided by their gcd, 160/441 for 44.1 -> 16 kHz)
+uses a Kaiser-windowed sinc low-pass split into `up` phases. Each output sample is
+the dot product of one phase with a short run of input samples; outputs are
+computed a block at a time with a gathered (outputs x taps) matrix, so there is
+no per-sample Python loop.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+
+from atc.audiofile import canonical_name, is_take, read_info, read_samples
+from atc.layout import list_sessions
+from atc.wavfile import WavStreamWriter
+
+# zero crossings of the sinc on each side, and the Kaiser window shape (about 80 dB)
+ZEROS = 16
+BETA = 8.6
+# cutoff as a fraction of the lower Nyquist frequency
+ROLLOFF = 0.95
+# output samples computed per gathered block
+BLOCK = 4096
+
+
+@lru_cache(maxsize=8)
+def polyphase_filter(up, down):
+    """(phases, delay): phases[p, j] is tap p + j * up of the prototype low-pass."""
+    m = max(up, down)
+    half = ZEROS * m
+    n = np.arange(-half, half + 1)
+    cutoff = ROLLOFF * 0.5 / m
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(2 * half + 1, BETA) * up
+    taps = -(-len(h) // up)
+    padded = np.zeros(taps * up)
+    padded[:len(h)] = h
+    return padded.reshape(taps, up).T.copy(), half
+
+
+def resample_channel(x, up, down):
+    """Resample one channel of float samples by up/down."""
+    if up == down:
+        return np.asarray(x, dtype=np.float64)
+    phases, half = polyphase_filter(up, down)
+    taps = phases.shape[1]
+    n_out = -(-len(x) * up // down)
+    xp = np.concatenate((np.zeros(taps), x, np.zeros(half // up + 2)))
+    out = np.empty(n_out)
+    j = np.arange(taps)
+    for a in range(0, n_out, BLOCK):
+        t = np.arange(a, min(a + BLOCK, n_out), dtype=np.int64) * down + half
+        idx = (t // up + taps)[:, None] - j
+        out[a:a + len(t)] = np.einsum('ij,ij->i', xp[idx], phases[t % up])
+    return out
+
+
+def resample(samples, channels, src_rate, dst_rate, dst_channels=1):
+    """Interleaved int16 at src_rate/channels -> interleaved int16 at dst_rate/dst_channels."""
+    x = np.asarray(samples).reshape(-1, channels).astype(np.float64)
+    if dst_channels == 1 and channels > 1:
+        x = x.mean(axis=1, keepdims=True)
+    elif dst_channels != channels:
+        if channels != 1:
+            raise ValueError(f"cannot map {channels} channels to {dst_channels}")
+        x = np.repeat(x, dst_channels, axis=1)
+    g = gcd(src_rate, dst_rate)
+    up, down = dst_rate // g, src_rate // g
+    out = np.stack([resample_channel(x[:, c], up, down) for c in range(x.shape[1])], axis=1)
+    return np.clip(np.rint(out), -32768, 32767).astype(np.int16).reshape(-1)
+
+
+def derivative_path(take_path, rate):
+    """audio/session_XX/<take> -> audio_<rate>/session_XX/<take>.wav"""
+    session_dir, name = os.path.split(take_path)
+    audio_root, session = os.path.split(os.path.normpath(session_dir))
+    return os.path.join(f"{os.path.normpath(audio_root or '.')}_{rate}", session, canonical_name(name))
+
+
+def write_derivative(take_path, rate, channels=1, out_path=None):
+    """Write a resampled copy of a take (WAV or FLAC). Returns its path."""
+    out_path = out_path or derivative_path(take_path, rate)
+    info = read_info(take_path)
+    samples = read_samples(take_path, info)
+    try:
+        data = resample(samples, info.channels, info.rate, rate, channels)
+    finally:
+        del samples
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = out_path + ".tmp"
+    writer = WavStreamWriter(tmp_path, channels=channels, sampwidth=2, rate=rate, fsync=False)
+    try:
+        writer.write(data)
+    finally:
+        writer.close()
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def _derive(args):
+    take_path, rate, channels = args
+    try:
+        write_derivative(take_path, rate, channels)
+        return None
+    except Exception as e:
+        return f"{take_path}: {e}"
+
+
+def derive_tree(audio_root, rate, channels=1, jobs=None, sessions=None):
+    """
+    Write missing or outdated derivatives for every take under audio_root/session_*.
+    Returns (written, errors).
+    """
+    todo = []
+    for ses in sessions if sessions is not None else list_sessions(audio_root):
+        ses_path = os.path.join(audio_root, ses)
+        for name in sorted(os.listdir(ses_path)):
+            if not is_take(name):
+                continue
+            take_path = os.path.join(ses_path, name)
+            out = derivative_path(take_path, rate)
+            if os.path.exists(out) and os.path.getmtime(out) >= os.path.getmtime(take_path):
+                continue
+            todo.append((take_path, rate, channels))
+    jobs = jobs or os.cpu_count() or 1
+    if jobs <= 1 or len(todo) <= 1:
+        results = [_derive(args) for args in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_derive, todo, chunksize=max(1, len(todo) // (jobs * 4))))
+    errors = [r for r in results if r]
+    return len(todo) - len(errors), errors
@@ -0,0 +1,240 @@
+"""
+Persistent sentence -> take index for one session.
+
+`audio/session_XX/session_XX.index.jsonl` is an append-only JSON-lines log; each
+record describes one sent_id and a later record for the same sent_id replaces the
+earlier one. It is read once when a session is opened and then kept in memory, so
+finding the take of the line on screen is a dict lookup instead of a scan of the
+session transcript.
+
+Record fields:
+    sent_id   1-based position in the session transcript
+    source    basename of the source text the line came from (None for old sessions)
+    line      0-based index of the line in that source (None for old sessions)
+    hash      content hash of the linked text
+    audio     take file name inside the session directory, or None
+    duration  take length in seconds, or None if unknown
+    frames, rate, channels, sampwidth
+              take format, recorded together with the duration
+    status    'linked' or 'pending' (audio removed for a replacement)
+"""
+import hashlib
+import json
+import os
+import threading
+
+from atc.audiofile import read_info, resolve
+from atc.wavfile import format_fields
+
+
+def text_hash(text):
+    return hashlib.sha1(text.strip().encode('utf-8')).hexdigest()[:16]
+
+
+def index_path(session_path, session_name):
+    return os.path.join(session_path, f"{session_name}.index.jsonl")
+
+
+class SessionIndex:
+    def __init__(self, path, readonly=False):
+        self.path = path
+        # a read-only index (used by reporting tools) never writes to disk
+        self.readonly = readonly
+        self.entries = {}
+        self.by_line = {}
+        self.by_hash = {}
+        # guards the dicts; file writes are ordered by _write_lock so lookups never wait on the disk
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, session_path, session_name, transcript_path=None, audio_name=None, readonly=False):
+        """
+        Load the index of a session. Sessions recorded before the index existed are
+        indexed once from their transcript (`audio_name(sent_id)` gives the take file
+        name) and the result is written out, so this only happens the first time.
+        """
+        index = cls(index_path(session_path, session_name), readonly=readonly)
+        records = 0
+        if os.path.exists(index.path):
+            with open(index.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        index._apply(json.loads(line))
+                        records += 1
+                    except ValueError:
+                        # a torn last line from a crash; everything before it is intact
+                        print(f"Skipping unreadable record in {index.path}")
+            if records > 2 * len(index.entries) + 64:
+                index.compact()
+        elif transcript_path and os.path.exists(transcript_path):
+            with open(transcript_path, 'r', encoding='utf-8') as f:
+                for i, text in enumerate(f):
+                    sent_id = i + 1
+                    audio = audio_name(sent_id) if audio_name else None
+                    if audio and not resolve(os.path.join(session_path, audio)):
+                        audio = None
+                    index._apply({'sent_id': sent_id, 'source': None, 'line': None,
+                                  'hash': text_hash(text), 'audio': audio, 'duration': None,
+                                  'status': 'linked' if audio else 'pending'})
+            index.compact()
+        return index
+
+    @classmethod
+    def rebuild(cls, session_path, session_name, transcript_path, audio_name):
+        """
+        Re-derive the index from the transcript and the takes on disk. Where a line
+        came from is kept for sentences whose text is unchanged; everything else
+        (take file, duration, format, status) is read fresh.
+        """
+        old = None
+        if os.path.exists(index_path(session_path, session_name)):
+            old = cls.open(session_path, session_name, readonly=True)
+        index = cls(index_path(session_path, session_name))
+        with open(transcript_path, 'r', encoding='utf-8') as f:
+            for i, text in enumerate(f):
+                sent_id = i + 1
+                record = {'sent_id': sent_id, 'source': None, 'line': None, 'hash': text_hash(text),
+                          'audio': None, 'duration': None, 'status': 'pending'}
+                prev = old.get(sent_id) if old else None
+                if prev and prev.get('hash') == record['hash']:
+                    record['source'] = prev.get('source')
+                    record['line'] = prev.get('line')
+                audio = audio_name(sent_id)
+                audio_p = os.path.join(session_path, audio)
+                if resolve(audio_p):
+                    try:
+                        record.update(format_fields(read_info(audio_p)))
+                        record['audio'] = audio
+                        record['status'] = 'linked'
+                    except (OSError, ValueError) as e:
+                        print(f"Failed to read take header {audio_p}: {e}")
+                index._apply(record)
+        index.compact()
+        return index
+
+    def _apply(self, record):
+        sent_id = record['sent_id']
+        old = self.entries.get(sent_id)
+        if old is not None:
+            if old.get('line') is not None:
+                self.by_line.pop((old.get('source'), old['line']), None)
+            ids = self.by_hash.get(old.get('hash'))
+            if ids and sent_id in ids:
+                ids.remove(sent_id)
+        entry = dict(old or {})
+        entry.update(record)
+        self.entries[sent_id] = entry
+        if entry.get('line') is not None:
+            self.by_line[(entry.get('source'), entry['line'])] = sent_id
+        ids = self.by_hash.setdefault(entry.get('hash'), [])
+        ids.append(sent_id)
+        ids.sort()
+        return entry
+
+    def get(self, sent_id):
+        with self._lock:
+            return self.entries.get(sent_id)
+
+    def lookup(self, source, line, text):
+        """
+        Entry for a source line. The (source, line) position is authoritative; the
+        content hash is only used for entries from old sessions that never recorded
+        where their line came from.
+        """
+        with self._lock:
+            sent_id = self.by_line.get((source, line))
+            if sent_id is not None:
+                return self.entries[sent_id]
+            for sent_id in self.by_hash.get(text_hash(text), ()):
+                entry = self.entries[sent_id]
+                if entry.get('line') is None:
+                    return entry
+            return None
+
+    def take_durations(self, session_path):
+        """
+        {sent_id: seconds} for every linked take. Entries indexed before durations were
+        recorded get theirs from a header-only scan of the take, once: the result is
+        written back to the index.
+        """
+        out = {}
+        filled = []
+        for sent_id, entry in list(self.entries.items()):
+            if entry.get('status') != 'linked' or not entry.get('audio'):
+                continue
+            duration = entry.get('duration')
+            if duration is None:
+                try:
+                    info = read_info(os.path.join(session_path, entry['audio']))
+                except (OSError, ValueError) as e:
+                    print(f"Failed to read take header {entry['audio']}: {e}")
+                    continue
+                record = format_fields(info)
+                record['sent_id'] = sent_id
+                filled.append(record)
+                duration = record['duration']
+            out[sent_id] = duration
+        if filled:
+            self._append(filled)
+        return out
+
+    def next_sent_id(self):
+        with self._lock:
+            return max(self.entries, default=0) + 1
+
+    def stage(self, sent_id, **fields):
+        """
+        Apply a change in memory only, for a take that is still being written; the
+        update() that follows persists it. Returns the entry as it was before (None
+        if there was none), for restore().
+        """
+        with self._lock:
+            old = self.entries.get(sent_id)
+            self._apply(dict(fields, sent_id=sent_id))
+            return dict(old) if old is not None else None
+
+    def restore(self, sent_id, entry):
+        """Undo a stage() whose take could not be written."""
+        with self._lock:
+            old = self.entries.pop(sent_id, None)
+            if old is not None:
+                if old.get('line') is not None:
+                    self.by_line.pop((old.get('source'), old['line']), None)
+                ids = self.by_hash.get(old.get('hash'))
+                if ids and sent_id in ids:
+                    ids.remove(sent_id)
+            if entry is not None:
+                self._apply(entry)
+
+    def update(self, sent_id, **fields):
+        """Apply and persist a change to one sent_id (a single appended line)."""
+        record = {'sent_id': sent_id}
+        record.update(fields)
+        return self._append([record])[0]
+
+    def _append(self, records):
+        with self._write_lock:
+            with self._lock:
+                entries = [self._apply(record) for record in records]
+            if self.readonly:
+                return entries
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+            return entries
+
+    def compact(self):
+        """Rewrite the log with one record per sent_id."""
+        if self.readonly:
+            return
+        with self._write_lock:
+            with self._lock:
+                entries = [dict(self.entries[sent_id]) for sent_id in sorted(self.entries)]
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
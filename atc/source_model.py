@@ -0,0 +1,310 @@
+"""
+Lazy access to the sentences of a large source text file.
+
+The recorder shows one sentence per non-empty line of the source. Instead of
+reading the whole file into a list, SourceModel memory-maps it and keeps only the
+byte offset of every non-empty line in an array('Q') (8 bytes per sentence);
+lines are decoded when they are shown. Building the offsets scans the file once
+with numpy; they are cached in .index/<name>.lines next to the source, keyed by
+the source's size and mtime, so reopening an unchanged source only reads that
+file.
+
+A line counts as empty when it holds nothing but ASCII whitespace, as with
+line.strip() for the plain text sources this tool reads.
+
+Edits do not rewrite the source. Each one is appended (and fsync'd) to a journal,
+<source>.edits, as a JSON line {"line", "text", "time"}; the journal's first line
+records the size and mtime of the source it applies to. Journalled edits overlay
+the file when lines are read, and compact() folds them all into the source in one
+pass, after which the journal starts over. Edits never add or remove lines, so
+line numbers (which the session indexes store) stay valid across compaction. A
+journal left over from a different version of the source is set aside as
+<source>.edits.stale rather than applied to the wrong lines.
+"""
+import datetime
+import json
+import mmap
+import os
+import struct
+import threading
+from array import array
+from collections.abc import Sequence
+
+import numpy as np
+
+MAGIC = b'ATCL'
+VERSION = 1
+INDEX_DIR = ".index"
+_HEADER = struct.Struct('<4sHQQQ')
+# bytes scanned per numpy pass while building the index
+BLOCK = 1 << 24
+# bytes copied at a time when a line is rewritten
+COPY_CHUNK = 1 << 22
+
+_SPACE = np.zeros(256, dtype=bool)
+_SPACE[[9, 10, 11, 12, 13, 32]] = True
+
+
+def index_path(source_path):
+    return os.path.join(os.path.dirname(source_path), INDEX_DIR, os.path.basename(source_path) + ".lines")
+
+
+def journal_path(source_path):
+    return source_path + ".edits"
+
+
+def scan_offsets(buf, size):
+    """array('Q') of the start offsets of the non-empty lines in the first `size` bytes of `buf`."""
+    offsets = array('Q')
+    start = 0          # start of the line that runs into the next block
+    has_text = False   # whether that line has non-space bytes so far
+    for base in range(0, size, BLOCK):
+        data = np.frombuffer(buf, dtype=np.uint8, count=min(BLOCK, size - base), offset=base)
+        text = ~_SPACE[data]
+        starts = np.concatenate(([0], np.flatnonzero(data == 10) + 1))
+        # line i of the block spans starts[i]:starts[i + 1]; the last one may continue in the next block
+        inside = starts < len(data)
+        seg = np.zeros(len(starts), dtype=bool)
+        seg[inside] = np.logical_or.reduceat(text, starts[inside])
+        seg[0] |= has_text
+        absolute = starts.astype(np.uint64) + np.uint64(base)
+        absolute[0] = start
+        offsets.frombytes(absolute[:-1][seg[:-1]].tobytes())
+        start, has_text = int(absolute[-1]), bool(seg[-1])
+    if has_text:
+        offsets.append(start)
+    return offsets
+
+
+def load_index(source_path, stamp):
+    """Cached offsets if the sidecar matches `stamp` (size, mtime_ns), else None."""
+    try:
+        with open(index_path(source_path), 'rb') as f:
+            magic, version, size, mtime, count = _HEADER.unpack(f.read(_HEADER.size))
+            if (magic, version, size, mtime) != (MAGIC, VERSION) + tuple(stamp):
+                return None
+            offsets = array('Q')
+            offsets.frombytes(f.read(count * offsets.itemsize))
+    except (OSError, struct.error):
+        return None
+    return offsets if len(offsets) == count else None
+
+
+def save_index(source_path, stamp, offsets):
+    path = index_path(source_path)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, stamp[0], stamp[1], len(offsets)))
+            offsets.tofile(f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        # the index is only a cache: a read-only source directory just means rescanning next time
+        print(f"Failed to write line index for {source_path}: {e}")
+
+
+def read_journal(path, stamp):
+    """{line: text} from a journal written against a source with `stamp`; None if it was another version."""
+    edits = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for n, raw in enumerate(f):
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                # a torn last line from a crash mid-append: the edit was never confirmed
+                continue
+            if n == 0:
+                if [record.get('size'), record.get('mtime_ns')] != list(stamp):
+                    return None
+                continue
+            edits[record['line']] = record['text']
+    return edits
+
+
+class SourceModel(Sequence):
+    """Sequence of the stripped non-empty lines of a UTF-8 text file, with journalled edits."""
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._mm = None
+        self._journal = None
+        self.edits = {}
+        # held while reading lines and while compaction swaps the file under them
+        self._lock = threading.RLock()
+        self._compacting = False
+        self._open()
+        self._load_journal()
+
+    def _open(self, offsets=None):
+        self._file = open(self.path, 'rb')
+        st = os.fstat(self._file.fileno())
+        self.size = st.st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self.stamp = (st.st_size, st.st_mtime_ns)
+        if offsets is None:
+            offsets = load_index(self.path, self.stamp)
+            if offsets is None:
+                offsets = scan_offsets(self._mm, self.size) if self._mm is not None else array('Q')
+                save_index(self.path, self.stamp, offsets)
+        else:
+            save_index(self.path, self.stamp, offsets)
+        self.offsets = offsets
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def _close_file(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # -------------------------
+    # Reading
+    # -------------------------
+    def __len__(self):
+        return len(self.offsets)
+
+    def _span(self, i):
+        """(start, end) bytes of line i, without its line break."""
+        start = self.offsets[i]
+        end = self._mm.find(b'\n', start)
+        if end < 0:
+            end = self.size
+        if end > start and self._mm[end - 1] == 13:
+            end -= 1
+        return start, end
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("source line out of range")
+        with self._lock:
+            text = self.edits.get(i)
+            if text is not None:
+                return text
+            start, end = self._span(i)
+            return self._mm[start:end].decode('utf-8', errors='replace').strip()
+
+    # -------------------------
+    # Edit journal
+    # -------------------------
+    def _load_journal(self):
+        path = journal_path(self.path)
+        if not os.path.exists(path):
+            return
+        edits = read_journal(path, self.stamp)
+        if edits is None:
+            os.replace(path, path + ".stale")
+            print(f"{path} was written for another version of the source; moved it to {path}.stale")
+            return
+        self.edits = {i: text for i, text in edits.items() if 0 <= i < len(self)}
+
+    def _open_journal(self, records=()):
+        """Start a new journal for the current source file, holding `records`."""
+        path = journal_path(self.path)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'source': os.path.basename(self.path), 'size': self.stamp[0],
+                                'mtime_ns': self.stamp[1]}) + "\n")
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self._journal = open(path, 'a', encoding='utf-8')
+
+    def edit(self, i, text):
+        """Replace line i with `text`: one fsync'd append to the journal."""
+        text = " ".join(text.split("\n")).strip()
+        if not text:
+            raise ValueError("a source line cannot be empty")
+        if not 0 <= i < len(self):
+            raise IndexError("source line out of range")
+        record = {'line': i, 'text': text, 'time': datetime.datetime.now().isoformat(timespec='seconds')}
+        with self._lock:
+            if self._journal is None:
+                if os.path.exists(journal_path(self.path)):
+                    self._journal = open(journal_path(self.path), 'a', encoding='utf-8')
+                else:
+                    self._open_journal()
+            self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self.edits[i] = text
+
+    # -------------------------
+    # Compaction
+    # -------------------------
+    def compact(self):
+        """
+        Write the journalled edits into the source and start a new journal. Safe to
+        call from a background thread: lines stay readable and editable meanwhile,
+        and edits made while the copy runs are carried over to the new journal.
+        Returns the number of edits folded in.
+        """
+        with self._lock:
+            if self._compacting or not self.edits:
+                return 0
+            self._compacting = True
+            edits = dict(self.edits)
+            spans = {i: self._span(i) for i in edits}
+        try:
+            tmp_path = self.path + ".tmp"
+            offsets = np.frombuffer(self.offsets, dtype=np.uint64).astype(np.int64)
+            shift = np.zeros(len(offsets) + 1, dtype=np.int64)
+            try:
+                with open(tmp_path, 'wb') as out:
+                    pos = 0
+                    for i in sorted(edits):
+                        start, end = spans[i]
+                        self._copy(out, pos, start)
+                        data = edits[i].encode('utf-8')
+                        out.write(data)
+                        shift[i + 1] += len(data) - (end - start)
+                        pos = end
+                    self._copy(out, pos, self.size)
+                    out.flush()
+                    os.fsync(out.fileno())
+            except Exception:
+                # includes the model being closed under a background compaction
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            offsets += np.cumsum(shift)[:-1]
+            new_offsets = array('Q', offsets.astype(np.uint64).tobytes())
+            with self._lock:
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+                # the mapping must be gone before the file is replaced (Windows)
+                self._close_file()
+                try:
+                    os.replace(tmp_path, self.path)
+                except OSError:
+                    os.remove(tmp_path)
+                    self._open()
+                    raise
+                self._open(new_offsets)
+                # edits made while copying are not in the new file yet
+                later = {i: t for i, t in self.edits.items() if edits.get(i) != t}
+                if later:
+                    self._open_journal([{'line': i, 'text': t} for i, t in sorted(later.items())])
+                else:
+                    os.remove(journal_path(self.path))
+                self.edits = later
+            return len(edits)
+        finally:
+            self._compacting = False
+
+    def _copy(self, out, a, b):
+        for pos in range(a, b, COPY_CHUNK):
+            out.write(self._mm[pos:min(b, pos + COPY_CHUNK)])
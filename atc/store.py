@@ -0,0 +1,325 @@
+"""
+Optional SQLite session store (enabled with USE_SQLITE_STORE).
+
+One database (WAL mode) holds every session, sentence and take. A file rename
+cannot be part of a transaction, so linking a line takes three steps: the row is
+committed as 'linking' (new text, take and duration), the take is renamed into
+place, and the row is marked 'linked'. A crash in between leaves a 'linking' row,
+which reconcile() settles when the session is next opened: 'linked' if the take
+on disk is the new one, else 'pending' (to be recorded again). The session
+transcripts, session metadata CSVs and the
+global metadata.csv become exports written from the store when they are needed.
+
+Existing audio/session_* directories are imported with
+
+    python -m atc.store migrate [--db corpus.db] [--audio audio/] [--transcripts transcripts/] [--speaker spk01]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+from atc import config
+from atc.layout import take_name
+from atc.metadata import GLOBAL_HEADER, csv_writer, session_meta_path, write_session_metadata
+from atc.session_index import index_path, SessionIndex
+from atc.audiofile import read_info, resolve
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    name TEXT PRIMARY KEY,
+    start_datetime TEXT,
+    info TEXT
+);
+CREATE TABLE IF NOT EXISTS sentences (
+    session TEXT NOT NULL REFERENCES sessions(name),
+    sent_id INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    source TEXT,
+    line INTEGER,
+    audio_file TEXT,
+    duration REAL,
+    status TEXT NOT NULL DEFAULT 'linked',
+    updated TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    PRIMARY KEY (session, sent_id)
+);
+"""
+
+# every column of sentences, in table order
+_COLUMNS = "session, sent_id, text, source, line, audio_file, duration, status, updated"
+
+
+class Store:
+    def __init__(self, path=None):
+        self.path = path or config.STORE_PATH
+        # links are written from the recorder's I/O thread while the Tk thread reads, so
+        # every statement holds _lock: a read never lands inside another thread's open
+        # transaction and the threads never interleave on the one connection
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _query(self, sql, params=()):
+        """All rows of one SELECT."""
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _transaction(self, fn):
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self.conn)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                # also after a failed COMMIT, which leaves the transaction open
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                raise
+            return result
+
+    # -------------------------
+    # Sessions
+    # -------------------------
+    def has_session(self, name):
+        return bool(self._query("SELECT 1 FROM sessions WHERE name = ?", (name,)))
+
+    def upsert_session(self, name, start_datetime=None, info=None):
+        info_json = json.dumps(info, ensure_ascii=False) if info is not None else None
+        self._transaction(lambda c: c.execute(
+            "INSERT INTO sessions (name, start_datetime, info) VALUES (?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET "
+            "start_datetime = COALESCE(excluded.start_datetime, start_datetime), "
+            "info = COALESCE(excluded.info, info)",
+            (name, start_datetime, info_json)))
+
+    def session_names(self):
+        return [r[0] for r in self._query("SELECT name FROM sessions ORDER BY name")]
+
+    # -------------------------
+    # Sentences / takes
+    # -------------------------
+    def next_sent_id(self, session):
+        row = self._query("SELECT MAX(sent_id) FROM sentences WHERE session = ?", (session,))[0]
+        return (row[0] or 0) + 1
+
+    def sentence_count(self, session):
+        return self._query("SELECT COUNT(*) FROM sentences WHERE session = ?", (session,))[0][0]
+
+    def total_duration(self, session):
+        row = self._query("SELECT SUM(duration) FROM sentences WHERE session = ? AND status = 'linked'",
+                          (session,))[0]
+        return row[0] or 0.0
+
+    def link(self, session, sent_id, text, audio_file, duration, source=None, line=None, finalize=None):
+        """
+        Upsert one sentence and its take. The row is committed as 'linking', then
+        `finalize` (renaming the take into place) runs, then the row is marked
+        'linked'. If `finalize` raises, the row is put back as it was.
+        """
+        def begin(c):
+            old = c.execute("SELECT " + _COLUMNS + " FROM sentences WHERE session = ? AND sent_id = ?",
+                            (session, sent_id)).fetchone()
+            c.execute(
+                "INSERT INTO sentences (session, sent_id, text, source, line, audio_file, duration, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 'linking') "
+                "ON CONFLICT(session, sent_id) DO UPDATE SET text = excluded.text, "
+                "source = COALESCE(excluded.source, source), line = COALESCE(excluded.line, line), "
+                "audio_file = excluded.audio_file, duration = excluded.duration, status = 'linking', "
+                "updated = excluded.updated",
+                (session, sent_id, text, source, line, audio_file, duration))
+            return old
+        old = self._transaction(begin)
+        if finalize is not None:
+            try:
+                finalize()
+            except BaseException:
+                self._transaction(lambda c: self._restore(c, session, sent_id, old))
+                raise
+        self._set_status(session, sent_id, 'linked')
+
+    @staticmethod
+    def _restore(c, session, sent_id, old):
+        if old is None:
+            c.execute("DELETE FROM sentences WHERE session = ? AND sent_id = ?", (session, sent_id))
+        else:
+            c.execute("INSERT OR REPLACE INTO sentences (" + _COLUMNS + ") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", old)
+
+    def _set_status(self, session, sent_id, status):
+        self._transaction(lambda c: c.execute(
+            "UPDATE sentences SET status = ?, updated = strftime('%Y-%m-%dT%H:%M:%f', 'now') "
+            "WHERE session = ? AND sent_id = ?", (status, session, sent_id)))
+
+    def mark_pending(self, session, sent_id):
+        """The take of a sentence was removed (to be recorded again)."""
+        self._transaction(lambda c: c.execute(
+            "UPDATE sentences SET status = 'pending', audio_file = NULL, duration = NULL, "
+            "updated = strftime('%Y-%m-%dT%H:%M:%f', 'now') WHERE session = ? AND sent_id = ?",
+            (session, sent_id)))
+
+    def reconcile(self, session, session_path):
+        """
+        Settle links of `session` interrupted between their commit and the rename:
+        'linked' where the take on disk has the recorded duration (it is the new
+        take), else 'pending' without a take. Returns how many rows were settled.
+        """
+        rows = self._query("SELECT sent_id, audio_file, duration FROM sentences "
+                           "WHERE session = ? AND status = 'linking'", (session,))
+        for sent_id, audio, duration in rows:
+            path = resolve(os.path.join(session_path, audio)) if audio else None
+            in_place = False
+            if path is not None and duration is not None:
+                try:
+                    info = read_info(path)
+                    in_place = abs(info.nframes / info.rate - duration) < 1e-6
+                except Exception as e:
+                    print(f"Failed to read {path}: {e}")
+            if in_place:
+                self._set_status(session, sent_id, 'linked')
+            else:
+                print(f"{session}: sentence {sent_id} was being linked when the recorder stopped; "
+                      "it needs to be recorded again")
+                self.mark_pending(session, sent_id)
+        return len(rows)
+
+    def transcript_lines(self, session):
+        """Session transcript as a list of lines, position = sent_id - 1 (gaps are blank)."""
+        lines = []
+        for sent_id, text in self._query(
+                "SELECT sent_id, text FROM sentences WHERE session = ? ORDER BY sent_id", (session,)):
+            while len(lines) < sent_id - 1:
+                lines.append("")
+            lines.append(text)
+        return lines
+
+    def metadata_rows(self, session, session_path=None):
+        """Metadata rows of a session; with `session_path`, audio_file names the file on disk (WAV or FLAC)."""
+        for sent_id, audio, text, dur, status in self._query(
+                "SELECT sent_id, audio_file, text, duration, status FROM sentences "
+                "WHERE session = ? ORDER BY sent_id", (session,)):
+            if status != 'linked':
+                # no take of this text is in place (yet)
+                yield sent_id, "", text, 0
+                continue
+            if audio and session_path:
+                audio = os.path.basename(resolve(os.path.join(session_path, audio)) or audio)
+            yield sent_id, audio or "", text, dur or 0
+
+    # -------------------------
+    # Exports
+    # -------------------------
+    def export_transcript(self, session, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for text in self.transcript_lines(session):
+                f.write(text + '\n')
+        os.replace(tmp_path, path)
+
+    def export_session_metadata(self, session, session_path):
+        write_session_metadata(session_meta_path(session_path, session), self.metadata_rows(session, session_path))
+
+    def export_global_metadata(self, path="metadata.csv", audio_root=None):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as g:
+            g.write(GLOBAL_HEADER)
+            writer = csv_writer(g)
+            for name in self.session_names():
+                session_path = os.path.join(audio_root, name) if audio_root else None
+                for sent_id, audio, text, dur in self.metadata_rows(name, session_path):
+                    writer.writerow((name, sent_id, audio, text, dur))
+        os.replace(tmp_path, path)
+
+    # -------------------------
+    # Migration from the file layout
+    # -------------------------
+    def migrate_session(self, audio_root, transcripts_root, session, speaker_id):
+        """Import one audio/session_XX directory. Returns the number of sentences."""
+        session_path = os.path.join(audio_root, session)
+        transcript = os.path.join(transcripts_root, f"{session}.txt")
+        info = None
+        info_path = os.path.join(session_path, "session_info.json")
+        if os.path.exists(info_path):
+            with open(info_path, 'r', encoding='utf-8') as sf:
+                info = json.load(sf)
+        index = None
+        if os.path.exists(index_path(session_path, session)):
+            index = SessionIndex.open(session_path, session)
+        rows = []
+        if os.path.exists(transcript):
+            with open(transcript, 'r', encoding='utf-8') as f:
+                lines = [line.strip() for line in f.readlines()]
+            for i, text in enumerate(lines):
+                sent_id = i + 1
+                entry = index.get(sent_id) if index else None
+                audio = (entry or {}).get('audio') or take_name(speaker_id, session, sent_id)
+                audio_p = os.path.join(session_path, audio)
+                duration = None
+                status = 'pending'
+                if resolve(audio_p):
+                    status = 'linked'
+                    try:
+                        h = read_info(audio_p)
+                        duration = h.nframes / h.rate
+                    except Exception as e:
+                        print(f"Failed to read {audio_p}: {e}")
+                rows.append((session, sent_id, text, (entry or {}).get('source'), (entry or {}).get('line'),
+                             audio, duration, status))
+
+        def run(c):
+            c.execute("INSERT INTO sessions (name, start_datetime, info) VALUES (?, ?, ?) "
+                      "ON CONFLICT(name) DO UPDATE SET start_datetime = excluded.start_datetime, info = excluded.info",
+                      (session, (info or {}).get('start_datetime'),
+                       json.dumps(info, ensure_ascii=False) if info is not None else None))
+            c.executemany(
+                "INSERT OR REPLACE INTO sentences (session, sent_id, text, source, line, audio_file, duration, status) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self._transaction(run)
+        return len(rows)
+
+    def migrate(self, audio_root, transcripts_root, speaker_id):
+        total = 0
+        for session in sorted(d for d in os.listdir(audio_root) if d.startswith('session_')):
+            if os.path.isdir(os.path.join(audio_root, session)):
+                n = self.migrate_session(audio_root, transcripts_root, session, speaker_id)
+                print(f"{session}: {n} sentences")
+                total += n
+        return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m atc.store", description="SQLite session store tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+    mig = sub.add_parser('migrate', help="import existing audio/session_* directories")
+    mig.add_argument('--db', default=None, help="database path (default: STORE_PATH)")
+    mig.add_argument('--audio', default="audio/")
+    mig.add_argument('--transcripts', default="transcripts/")
+    mig.add_argument('--speaker', default="spk01")
+    exp = sub.add_parser('export', help="write transcripts and metadata CSVs from the store")
+    exp.add_argument('--db', default=None)
+    exp.add_argument('--audio', default="audio/")
+    exp.add_argument('--transcripts', default="transcripts/")
+    args = parser.parse_args(argv)
+
+    store = Store(args.db)
+    try:
+        if args.command == 'migrate':
+            total = store.migrate(args.audio, args.transcripts, args.speaker)
+            print(f"Imported {total} sentences into {store.path}")
+        else:
+            for name in store.session_names():
+                store.export_transcript(name, os.path.join(args.transcripts, f"{name}.txt"))
+                session_path = os.path.join(args.audio, name)
+                if os.path.isdir(session_path):
+                    store.export_session_metadata(name, session_path)
+            store.export_global_metadata(audio_root=args.audio)
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
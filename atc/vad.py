@@ -0,0 +1,147 @@
+"""
+Energy-based voice activity detection for trimming silence off takes.
+
+A take is cut into 10 ms frames and a frame counts as voiced when its RMS is above
+TRIM_THRESHOLD_DBFS. Voiced runs shorter than TRIM_MIN_SPEECH_SECONDS (clicks,
+the key press) are dropped, and every voiced frame keeps the following
+TRIM_HANGOVER_SECONDS voiced so short pauses inside an utterance never end it.
+The take is then cut TRIM_PAD_SECONDS before the first and after the last voiced
+frame. Everything is whole-array NumPy, so a 30 s take is trimmed in a few
+milliseconds.
+
+EndpointDetector applies the same frame energy test to the live input to tell
+when the reader has finished a sentence.
+"""
+import os
+
+import numpy as np
+
+from atc import config
+from atc.qa import frame_rms
+from atc.wavfile import WavStreamWriter, map_samples, read_header
+
+FRAME_SECONDS = 0.01
+RAW_DIR = ".raw"
+
+
+def raw_path(take_path):
+    """Where the untrimmed original of a take is kept (with TRIM_KEEP_RAW)."""
+    return os.path.join(os.path.dirname(take_path), RAW_DIR, os.path.basename(take_path))
+
+
+def voiced_frames(rms, threshold, min_speech, hangover):
+    """Boolean voiced mask over frame RMS values with click removal and hangover applied."""
+    mask = rms > threshold
+    if min_speech > 1 and len(mask) >= min_speech:
+        # opening: keep only runs of at least min_speech frames
+        kernel = np.ones(min_speech, dtype=np.int32)
+        core = np.convolve(mask, kernel, 'valid') == min_speech
+        mask = np.convolve(core, kernel)[:len(mask)] > 0
+    if hangover > 0:
+        mask = np.convolve(mask, np.ones(hangover + 1, dtype=np.int32))[:len(mask)] > 0
+    return mask
+
+
+def voiced_span(samples, channels=1, rate=44100, threshold_dbfs=None, pad=None, hangover=None, min_speech=None):
+    """
+    (start, stop) in frames of the part of `samples` (interleaved int16) to keep,
+    or None when nothing in it is voiced. Unset parameters come from config.
+    """
+    threshold_dbfs = config.TRIM_THRESHOLD_DBFS if threshold_dbfs is None else threshold_dbfs
+    pad = config.TRIM_PAD_SECONDS if pad is None else pad
+    hangover = config.TRIM_HANGOVER_SECONDS if hangover is None else hangover
+    min_speech = config.TRIM_MIN_SPEECH_SECONDS if min_speech is None else min_speech
+    frame_len = max(1, int(rate * FRAME_SECONDS))
+    rms = frame_rms(samples, channels, frame_len)
+    mask = voiced_frames(rms, 10 ** (threshold_dbfs / 20), int(round(min_speech / FRAME_SECONDS)),
+                         int(round(hangover / FRAME_SECONDS)))
+    voiced = np.flatnonzero(mask)
+    if not len(voiced):
+        return None
+    n = len(samples) // channels
+    pad_frames = int(pad * rate)
+    start = max(0, int(voiced[0]) * frame_len - pad_frames)
+    stop = min(n, (int(voiced[-1]) + 1) * frame_len + pad_frames)
+    return start, stop
+
+
+def trim_file(path, keep_raw=None):
+    """
+    Trim silence off the WAV at `path` in place. With `keep_raw` the original is
+    moved there first. Returns (start, stop) in frames if the take was cut, else
+    None (nothing voiced, or nothing to cut).
+    """
+    info = read_header(path)
+    samples = map_samples(path, info)
+    span = voiced_span(samples, info.channels, info.rate)
+    if span is None or span == (0, info.nframes):
+        return None
+    start, stop = span
+    tmp_path = path + ".trim"
+    writer = WavStreamWriter(tmp_path, info.channels, info.sampwidth, info.rate)
+    try:
+        writer.write(np.ascontiguousarray(samples[start * info.channels:stop * info.channels]))
+    finally:
+        writer.close()
+        # the mapping must be gone before the take is renamed (Windows)
+        del samples
+    if keep_raw:
+        os.makedirs(os.path.dirname(keep_raw) or ".", exist_ok=True)
+        os.replace(path, keep_raw)
+    os.replace(tmp_path, path)
+    return span
+
+
+class EndpointDetector:
+    """
+    Streaming end-of-utterance detection for hands-free recording.
+
+    Fed every captured chunk from the audio callback (see CaptureEngine). Once a run
+    of at least `min_speech` seconds of voiced frames has been seen, `silence()` is
+    how long the input has been quiet since the last voiced frame; the UI polls it
+    and links the take when it exceeds its window.
+    """
+    def __init__(self, rate=44100, channels=1, threshold_dbfs=None, min_speech=None):
+        self.rate = rate
+        self.channels = channels
+        self.frame_len = max(1, int(rate * FRAME_SECONDS))
+        self.threshold_dbfs = threshold_dbfs
+        self.min_speech = min_speech
+        self.reset()
+
+    def reset(self):
+        threshold_dbfs = config.TRIM_THRESHOLD_DBFS if self.threshold_dbfs is None else self.threshold_dbfs
+        min_speech = config.HANDS_FREE_MIN_SPEECH_SECONDS if self.min_speech is None else self.min_speech
+        self._threshold = 10 ** (threshold_dbfs / 20)
+        self._min_frames = max(1, int(round(min_speech / FRAME_SECONDS)))
+        self._carry = np.zeros(0, dtype=np.int16)
+        self.frames = 0
+        self.run = 0
+        self.speaking = False
+        self.last_voiced = 0
+
+    def add(self, samples):
+        samples = np.asarray(samples)
+        if len(self._carry):
+            samples = np.concatenate((self._carry, samples))
+        whole = len(samples) // (self.frame_len * self.channels) * self.frame_len * self.channels
+        self._carry = samples[whole:].copy()
+        if not whole:
+            return
+        mask = frame_rms(samples[:whole], self.channels, self.frame_len) > self._threshold
+        # a callback carries only a few frames, so walking them is cheaper than vectorizing
+        for voiced in mask.tolist():
+            self.frames += 1
+            if voiced:
+                self.run += 1
+                self.last_voiced = self.frames
+                if self.run >= self._min_frames:
+                    self.speaking = True
+            else:
+                self.run = 0
+
+    def silence(self):
+        """Seconds of silence since speech ended, or 0.0 before any speech."""
+        if not self.speaking:
+            return 0.0
+        return (self.frames - self.last_voiced) * FRAME_SECONDS
@@ -0,0 +1,87 @@
+"""
+Peak envelopes and canvas coordinates for waveform drawing.
+
+The live view never looks at the take itself: the capture callback folds every
+new chunk into a min/max envelope (one column per `samples_per_column` samples)
+and the renderer only draws the columns that appeared since its last tick.
+"""
+import numpy as np
+
+from atc.capture import RingBuffer
+
+# 441 samples at 44.1 kHz: one canvas column per 10 ms of audio
+DEFAULT_SAMPLES_PER_COLUMN = 441
+DEFAULT_COLUMNS = 16384
+
+
+class PeakEnvelope:
+    """
+    Streaming min/max accumulator.
+
+    `add` is called by the producer (the capture callback) with int16 samples; the
+    column rings are only ever appended to and `count` is published last, so the UI
+    thread can read columns [a, count) without a lock.
+    """
+    def __init__(self, samples_per_column=DEFAULT_SAMPLES_PER_COLUMN, columns=DEFAULT_COLUMNS):
+        self.samples_per_column = samples_per_column
+        self.mins = RingBuffer(columns, dtype=np.int16)
+        self.maxs = RingBuffer(columns, dtype=np.int16)
+        self._carry = np.zeros(samples_per_column, dtype=np.int16)
+        self._carry_n = 0
+        self.count = 0
+
+    def reset(self):
+        """Only call while no producer is running."""
+        self.mins.written = 0
+        self.maxs.written = 0
+        self._carry_n = 0
+        self.count = 0
+
+    def add(self, samples):
+        spc = self.samples_per_column
+        if self._carry_n:
+            take = min(spc - self._carry_n, len(samples))
+            self._carry[self._carry_n:self._carry_n + take] = samples[:take]
+            self._carry_n += take
+            samples = samples[take:]
+            if self._carry_n < spc:
+                return
+            self._push(self._carry.min(keepdims=True), self._carry.max(keepdims=True))
+            self._carry_n = 0
+        full = len(samples) // spc
+        if full:
+            block = samples[:full * spc].reshape(full, spc)
+            self._push(block.min(axis=1), block.max(axis=1))
+        rest = len(samples) - full * spc
+        if rest:
+            self._carry[:rest] = samples[full * spc:]
+            self._carry_n = rest
+
+    def _push(self, mins, maxs):
+        self.mins.write(mins)
+        self.maxs.write(maxs)
+        self.count += len(mins)
+
+    def columns(self, start, stop=None):
+        """Views of (mins, maxs) for columns [start, stop)."""
+        if stop is None:
+            stop = self.count
+        return self.mins.view(start, stop), self.maxs.view(start, stop)
+
+
+def envelope_coords(mins, maxs, x0, height, x_step=1.0):
+    """
+    Flat [x, y, x, y, ...] list for Canvas.create_line: one vertical stroke per column,
+    zig-zagging max -> min so a single line item covers the whole batch.
+    """
+    n = len(mins)
+    if n == 0:
+        return []
+    half = height / 2.0
+    xs = x0 + np.arange(n, dtype=np.float32) * x_step
+    coords = np.empty((n, 4), dtype=np.float32)
+    coords[:, 0] = xs
+    coords[:, 1] = half - maxs.astype(np.float32) * (half / 32768.0)
+    coords[:, 2] = xs
+    coords[:, 3] = half - mins.astype(np.float32) * (half / 32768.0)
+    return coords.ravel().tolist()
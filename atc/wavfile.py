@@ -0,0 +1,155 @@
+"""
+Small RIFF/WAVE helpers that work on the file header only.
+
+The `wave` module is fine for writing a whole take at once, but these helpers let
+callers find the PCM data inside a file and map it with NumPy without reading it,
+and stream a take to disk while it is being recorded.
+"""
+import mmap
+import os
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+WavInfo = namedtuple('WavInfo', 'channels sampwidth rate nframes data_offset data_size')
+
+
+def read_header(path):
+    """
+    Parse the fmt and data chunk headers of a PCM WAV file.
+
+    The file is memory-mapped and only the chunk headers are touched, so this costs
+    the same for a one-second and a one-hour take. When the RIFF header says the data
+    chunk is the last one, everything after it counts as data: a take whose header
+    was not patched before a crash still reports every complete frame it holds.
+    """
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        if file_size < 12:
+            raise ValueError(f"{path} is not a RIFF/WAVE file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:4] != b'RIFF' or mm[8:12] != b'WAVE':
+                raise ValueError(f"{path} is not a RIFF/WAVE file")
+            riff_end = 8 + struct.unpack_from('<I', mm, 4)[0]
+            fmt = None
+            pos = 12
+            while pos + 8 <= file_size:
+                cid, size = struct.unpack_from('<4sI', mm, pos)
+                pos += 8
+                if cid == b'fmt ':
+                    _tag, channels, rate, _byte_rate, _align, bits = struct.unpack_from('<HHIIHH', mm, pos)
+                    fmt = (channels, bits // 8, rate)
+                elif cid == b'data':
+                    if fmt is None:
+                        raise ValueError(f"{path} has no fmt chunk before data")
+                    channels, sampwidth, rate = fmt
+                    if pos + size >= riff_end:
+                        size = file_size - pos
+                    size = min(size, file_size - pos)
+                    frame = channels * sampwidth
+                    size -= size % frame
+                    return WavInfo(channels, sampwidth, rate, size // frame, pos, size)
+                pos += size + (size & 1)
+    raise ValueError(f"{path} has no data chunk")
+
+
+def format_fields(info):
+    """Duration and format of a take as stored in the session index."""
+    return {
+        'duration': info.nframes / info.rate if info.rate else 0.0,
+        'frames': info.nframes,
+        'rate': info.rate,
+        'channels': info.channels,
+        'sampwidth': info.sampwidth,
+    }
+
+
+def map_samples(path, info=None):
+    """
+    Read-only np.memmap of the interleaved samples of a 16-bit WAV, or an empty array.
+    Drop the returned array as soon as possible: on Windows an open mapping blocks
+    renaming or deleting the file.
+    """
+    if info is None:
+        info = read_header(path)
+    if info.sampwidth != 2:
+        raise ValueError(f"{path}: only 16-bit PCM is supported")
+    n = info.data_size // 2
+    if n == 0:
+        return np.zeros(0, dtype='<i2')
+    return np.memmap(path, dtype='<i2', mode='r', offset=info.data_offset, shape=(n,))
+
+
+class WavStreamWriter:
+    """
+    WAV writer for takes that are still being recorded.
+
+    PCM is appended as it arrives and the RIFF and data chunk sizes are patched at
+    most every `patch_interval` seconds (and on close), so the file on disk is a
+    valid WAV at all times; at worst its header undercounts the last second, which
+    read_header recovers from. With `append=True` an existing take is continued
+    in place instead of being read back.
+    """
+    def __init__(self, path, channels=1, sampwidth=2, rate=44100, append=False, patch_interval=1.0,
+                 fsync=True):
+        self.path = path
+        self.channels = channels
+        self.sampwidth = sampwidth
+        self.rate = rate
+        self.patch_interval = patch_interval
+        self.fsync = fsync
+        if append and os.path.exists(path):
+            info = read_header(path)
+            if (info.channels, info.sampwidth, info.rate) != (channels, sampwidth, rate):
+                raise ValueError(f"{path} was recorded as {info.channels}ch/{info.sampwidth * 8}bit/"
+                                 f"{info.rate}Hz and cannot be continued with another format")
+            self.f = open(path, 'r+b')
+            self.data_offset = info.data_offset
+            self.data_size = info.data_size
+            # drop a torn last frame or anything trailing the data chunk
+            self.f.truncate(self.data_offset + self.data_size)
+            self.f.seek(self.data_offset + self.data_size)
+        else:
+            self.f = open(path, 'w+b')
+            block_align = channels * sampwidth
+            self.f.write(b'RIFF' + struct.pack('<I', 36) + b'WAVE')
+            self.f.write(b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, rate, rate * block_align,
+                                               block_align, sampwidth * 8))
+            self.f.write(b'data' + struct.pack('<I', 0))
+            self.data_offset = self.f.tell()
+            self.data_size = 0
+        self.initial_size = self.data_size
+        self._last_patch = time.monotonic()
+
+    @property
+    def nframes(self):
+        return self.data_size // (self.channels * self.sampwidth)
+
+    def write(self, data):
+        mv = memoryview(data).cast('B')
+        self.f.write(mv)
+        self.data_size += len(mv)
+        if time.monotonic() - self._last_patch >= self.patch_interval:
+            self.patch()
+
+    def patch(self):
+        end = self.f.tell()
+        self.f.seek(4)
+        self.f.write(struct.pack('<I', self.data_offset - 8 + self.data_size))
+        self.f.seek(self.data_offset - 4)
+        self.f.write(struct.pack('<I', self.data_size))
+        self.f.seek(end)
+        self.f.flush()
+        if self.fsync:
+            os.fsync(self.f.fileno())
+        self._last_patch = time.monotonic()
+
+    def close(self):
+        if self.f.closed:
+            return
+        try:
+            self.patch()
+        finally:
+            self.f.close()
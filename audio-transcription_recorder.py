@@ -1,15 +1,26 @@
 import tkinter as tk
 from tkinter import messagebox, filedialog, Toplevel
 import os
-import sys
 import json
-import wave
-import pyaudio
-import pygame
 import time
 import threading
-import numpy as np
 import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from atc import audiofile, backends, config, linking, metrics, peaks, resample, vad
+from atc.capture import CaptureEngine, capture_profile
+from atc.checkpoint import CheckpointWriter, read_checkpoint
+from atc.encoder import EncoderPool, flac_path
+from atc.io_queue import IOQueue
+from atc.layout import take_name, take_sent_id
+from atc.playback import PlaybackEngine
+from atc.prefetch import Prefetcher, TakeCache
+from atc.metadata import export_session, merge_metadata
+from atc.session_index import SessionIndex, text_hash
+from atc.source_model import SourceModel
+from atc.store import Store
+from atc.waveform import PeakEnvelope, envelope_coords
 
 # -------------------------
 # Scaling - MAIN WINDOW ONLY
@@ -50,6 +61,11 @@ ITEM_HEIGHT_MAIN = int(ITEM_HEIGHT_BASE * SCALE_TEXT_MAIN)
 # Window geometry for main window
 ROOT_GEOMETRY_MAIN = f"{int(1000 * 1.6)}x{int(800 * 1.4)}"  # larger window to accommodate bigger UI
 
+# Hands-free mode: how often the end-of-utterance detector is polled (ms), and how
+# long the reader must be quiet before the auto-link countdown is shown (s)
+AUTO_LINK_POLL_MS = 50
+AUTO_LINK_SHOW_AFTER = 0.3
+
 # -------------------------
 # SearchableDropdown widget
 # (uses NORMAL fonts so popup lists are normal-sized)
@@ -237,21 +253,50 @@ class AudioTextCollector:
         self.session_path = ""
         self.session_txt = ""
         self.session_number = 1
-        self.temp_audio = "temp.wav"
+        # every take is recorded to its own file under temp/ (a paused take is resumed in place)
+        self.temp_dir = "temp"
+        self.temp_audio = None
+        self.temp_count = 0
+        self.temp_take_open = False
+        # temp take whose file has been closed, so it can be played
+        self.temp_ready = None
         self.current_audio = None
         self.current_sent_id = None
         self.is_recording = False
         self.is_playing = False
         self.recording_start_time = 0
-        self.frames = []
-        self.stream = None
+        self.capture = None
+        # live waveform: canvas items still on screen as (item id, last column), columns drawn so far
+        # and the column currently shown at x=0
+        self.wave_items = deque()
+        self.wave_drawn = 0
+        self.wave_offset = 0
         self.checkpoint_file = "checkpoint.txt"
+        # written in the background, coalesced and atomically (see atc.checkpoint)
+        self.checkpoints = CheckpointWriter(self.checkpoint_file)
+        # last line of every source file worked on, by absolute path
+        self.source_cursors = {}
         self.speaker_id = "spk01"
         self.source_file = None
         self.session_start_datetime = None
+        # sentence -> take index of the open session (loaded once per session)
+        self.session_index = None
+        # True when the lines on screen are a session transcript opened for review
+        self.source_is_session = False
+        # optional SQLite store; transcripts and metadata CSVs are then exported from it
+        self.store = None
+        if config.USE_SQLITE_STORE:
+            try:
+                self.store = Store(config.STORE_PATH)
+            except Exception as e:
+                print(f"Failed to open session store {config.STORE_PATH}: {e}")
 
         # New flag: replacing mode (used to prevent checkpoint change / append when replacing)
         self.is_replacing = False
+        # hands-free mode: pending poll of the end-of-utterance detector, and whether the
+        # reader cancelled auto-linking of the current take
+        self.auto_link_job = None
+        self.auto_link_cancelled = False
 
         # UI elements (main window)
         self.prev_nums = []
@@ -267,13 +312,58 @@ class AudioTextCollector:
         # Setup main UI (uses MAIN scaled fonts)
         self.setup_ui_main()
 
-        # audio init
-        original_stderr = sys.stderr
-        sys.stderr = open(os.devnull, 'w')
-        self.p = pyaudio.PyAudio()
-        pygame.mixer.init()
-        sys.stderr.close()
-        sys.stderr = original_stderr
+        # file work of linking, pausing and skipping takes, done in order off the Tk thread
+        self.io = IOQueue(self.master.after, on_change=self.show_pending_writes)
+        # linked takes whose files may not be in place yet (path -> queued writes)
+        self.pending_takes = {}
+        # takes whose peak file is being built for the waveform view
+        self.peaks_pending = set()
+        # a session is being created, read or closed on the I/O thread; further
+        # New / End / Load Ses presses are ignored until it is done
+        self.session_busy = False
+        # sent_id the next new line of the open session gets
+        self.next_sent_id = 1
+        os.makedirs(self.temp_dir, exist_ok=True)
+        self.io.submit(self.clear_temp_takes)
+
+        # audio init (AUDIO_BACKEND: a sound card through PyAudio or sounddevice, or replay)
+        self.audio = backends.create()
+        self.profile = capture_profile()
+        rate, channels = self.profile['sample_rate'], self.profile['channels']
+        self.capture = CaptureEngine(self.audio, rate=rate, channels=channels,
+                                     frames_per_buffer=config.CAPTURE_FRAMES_PER_BUFFER,
+                                     # one waveform column per 10 ms whatever the rate
+                                     envelope=PeakEnvelope(samples_per_column=max(1, rate * channels // 100)),
+                                     endpoint=vad.EndpointDetector(rate, channels) if config.HANDS_FREE else None,
+                                     device=config.AUDIO_INPUT_DEVICE)
+        self.player = PlaybackEngine(self.audio, device=config.AUDIO_OUTPUT_DEVICE)
+        # decoded takes of the lines around the current one, so navigating draws and plays from memory
+        if config.PREFETCH_BUDGET_MB > 0:
+            self.take_cache = TakeCache(int(config.PREFETCH_BUDGET_MB * (1 << 20)))
+            self.prefetcher = Prefetcher(self.take_cache)
+        else:
+            self.take_cache = None
+            self.prefetcher = None
+
+        # build peak files for takes recorded before they existed (or changed since)
+        threading.Thread(target=peaks.regenerate_tree, args=(self.audio_path,), daemon=True).start()
+
+        # optional background FLAC encoding of linked takes; take files are only renamed
+        # or removed under take_lock so the encoder never deletes a newer take
+        self.encoder = EncoderPool.create()
+        self.take_lock = self.encoder.lock if self.encoder is not None else threading.Lock()
+        # resampled copies of linked takes (DERIVATIVE_RATE), written one at a time in the background
+        self.derivatives = ThreadPoolExecutor(max_workers=1) if config.DERIVATIVE_RATE else None
+
+        # METRICS: queue depths sampled with every report, and the JSON-lines reporter
+        metrics.watch('queue.io', lambda: self.io.pending)
+        if self.encoder is not None:
+            metrics.watch('queue.encode', lambda: self.encoder.queued)
+        if self.take_cache is not None:
+            metrics.watch('cache.takes_mb', lambda: round(self.take_cache.stats()['bytes'] / (1 << 20), 1))
+        self.metrics_reporter = metrics.Reporter() if metrics.ENABLED else None
+        self.metrics_overlay = None
+        self.metrics_overlay_job = None
 
         self.load_checkpoint()
         if self.current_session:
@@ -283,6 +373,8 @@ class AudioTextCollector:
                 start_dt = self._load_session_start_from_info(self.session_path)
                 if start_dt:
                     self.session_start_datetime = start_dt
+            self.open_session_index()
+            self.encode_session()
             self.new_session_btn.config(bg='red')
 
     # -------------------------
@@ -309,6 +401,13 @@ class AudioTextCollector:
                                    bg='#555555', fg='white', font=BUTTON_FONT_MAIN)
         self.about_btn.pack(side=tk.RIGHT, padx=5, ipady=btn_ipady, ipadx=btn_ipadx)
 
+        # takes and edits still being written in the background
+        self.io_label = tk.Label(top_frame, text="", bg='#333333', fg='#aaaaaa', font=ENTRY_FONT_MAIN)
+        self.io_label.pack(side=tk.RIGHT, padx=10)
+        # audio of the current take lost to input overruns (replaced by silence)
+        self.xrun_label = tk.Label(top_frame, text="", bg='#333333', fg='#ff9900', font=ENTRY_FONT_MAIN)
+        self.xrun_label.pack(side=tk.RIGHT, padx=10)
+
         # Text display frame (labels and text use MAIN fonts)
         self.text_frame = tk.Frame(self.master, bg='#333333')
         self.text_frame.pack(pady=10, padx=10, fill=tk.BOTH, expand=False)
@@ -390,6 +489,11 @@ class AudioTextCollector:
         # Progress canvas
         self.progress_canvas = tk.Canvas(self.master, bg='#444444', height=int(10 * SCALE_TEXT_MAIN), highlightthickness=0)
         self.progress_canvas.pack(fill=tk.X, padx=10)
+        self.progress_canvas.bind('<Button-1>', self.seek_playback)
+
+        # Hands-free countdown (empty unless a take is about to be linked automatically)
+        self.auto_link_label = tk.Label(self.master, text="", bg='#333333', fg='#ffcc00', font=ENTRY_FONT_MAIN)
+        self.auto_link_label.pack(fill=tk.X, pady=5)
 
         # Keyboard bindings
         self.master.bind('<Left>', lambda e: self.previous_line())
@@ -398,8 +502,12 @@ class AudioTextCollector:
         self.master.bind('<Return>', lambda e: self.link_line())
         self.master.bind('<space>', self.space_handler)
         self.master.bind('<Control-o>', lambda e: self.load_source())
-        self.master.bind('<Control-s>', lambda e: self.save_checkpoint())
+        self.master.bind('<Control-s>', lambda e: self.save_checkpoint(flush=True))
         self.master.bind('<Control-e>', lambda e: self.save_current_edit())
+        self.master.bind('<Escape>', lambda e: self.cancel_auto_link())
+        self.master.bind('<F12>', lambda e: self.toggle_metrics_overlay())
+        # write the last checkpoint before the window goes away
+        self.master.protocol("WM_DELETE_WINDOW", self.on_close)
 
     # -------------------------
     # Checkpoint & session info (unchanged)
@@ -416,11 +524,11 @@ class AudioTextCollector:
     def load_checkpoint(self):
         if os.path.exists(self.checkpoint_file):
             try:
-                with open(self.checkpoint_file, 'r') as f:
-                    data = json.load(f)
+                data = read_checkpoint(self.checkpoint_file)
                 if isinstance(data, dict):
                     self.current_index = data.get('line_index', 0)
                     self.current_session = data.get('session', None)
+                    self.source_cursors = data.get('sources', {})
                     sess_start = data.get('session_start', None)
                     if sess_start:
                         try:
@@ -441,27 +549,136 @@ class AudioTextCollector:
             self.current_session = None
         self.save_checkpoint()
 
-    def save_checkpoint(self):
+    def save_checkpoint(self, flush=False):
+        if self.source_file and not self.source_is_session:
+            self.source_cursors[os.path.abspath(self.source_file)] = self.current_index
         data = {
             'line_index': self.current_index,
             'session': self.current_session,
-            'session_start': self.session_start_datetime.isoformat() if self.session_start_datetime else None
+            'session_start': self.session_start_datetime.isoformat() if self.session_start_datetime else None,
+            'sources': self.source_cursors
         }
-        with open(self.checkpoint_file, 'w') as f:
-            json.dump(data, f)
+        self.checkpoints.update(data)
+        if flush:
+            self.checkpoints.flush()
+
+    def on_close(self):
+        self.stop_recording(temp=True)
+        # everything queued (takes being linked, transcript and index writes) lands before exit
+        self.io.shutdown()
+        self.save_checkpoint()
+        self.checkpoints.close()
+        if self.metrics_reporter is not None:
+            self.metrics_reporter.stop()
+        self.player.close()
+        self.audio.terminate()
+        self.master.destroy()
+
+    # -------------------------
+    # Metrics overlay (F12)
+    # -------------------------
+    def toggle_metrics_overlay(self):
+        if self.metrics_overlay is not None:
+            self.master.after_cancel(self.metrics_overlay_job)
+            self.metrics_overlay.destroy()
+            self.metrics_overlay = None
+            return
+        self.metrics_overlay = tk.Label(self.master, justify=tk.LEFT, anchor='nw', bg='#111111', fg='#00ff00',
+                                        font=('Courier', 9))
+        self.metrics_overlay.place(relx=1.0, rely=0.0, anchor='ne')
+        self.update_metrics_overlay()
+
+    def update_metrics_overlay(self):
+        if metrics.ENABLED:
+            text = metrics.format_overlay(metrics.registry.snapshot())
+        else:
+            text = f"Metrics are off (set METRICS in {config.CONFIG_FILE})"
+        self.metrics_overlay.config(text=text)
+        self.metrics_overlay_job = self.master.after(500, self.update_metrics_overlay)
+
+    def show_pending_writes(self, pending):
+        self.io_label.config(text=f"Saving ({pending})…" if pending else "")
 
     def _save_session_info_file(self, session_path, start_dt: datetime.datetime):
         """
-        Save only start_datetime (keeps backward compatibility).
+        Save start_datetime and the capture profile (keeps backward compatibility).
         Additional session-level fields are written in save_meta() directly.
         """
         try:
             info = {'start_datetime': start_dt.isoformat()}
+            info.update(self.profile)
             with open(os.path.join(session_path, "session_info.json"), 'w', encoding='utf-8') as sf:
                 json.dump(info, sf)
         except Exception as e:
             print(f"Failed to save session_info.json: {e}")
 
+    def session_profile(self, session_path):
+        """Capture format of a session as recorded at its start, else the current one."""
+        profile = dict(self.profile)
+        try:
+            with open(os.path.join(session_path, "session_info.json"), 'r', encoding='utf-8') as sf:
+                info = json.load(sf)
+            profile.update({k: info[k] for k in profile if k in info})
+        except Exception:
+            pass
+        return profile
+
+    def take_name(self, sent_id):
+        return take_name(self.speaker_id, self.current_session, sent_id)
+
+    def source_key(self):
+        return os.path.basename(self.source_file) if self.source_file else None
+
+    def open_session_index(self):
+        self.session_index, self.next_sent_id = self.read_session_index(self.current_session, self.session_path,
+                                                                        self.session_txt)
+
+    def read_session_index(self, session, session_path, session_txt):
+        """
+        The index of a session and the sent_id its next new line gets (sent_ids are
+        handed out from this, so linking never has to read the transcript). Safe to
+        run on the I/O thread.
+        """
+        if self.store is not None and not self.store.has_session(session):
+            # session recorded before the store was enabled: import it once
+            try:
+                self.store.migrate_session(self.audio_path, self.transcripts_path, session, self.speaker_id)
+            except Exception as e:
+                print(f"Failed to import {session} into the store: {e}")
+        if self.store is not None:
+            # links cut off between their commit and the rename of the take
+            try:
+                self.store.reconcile(session, session_path)
+            except Exception as e:
+                print(f"Failed to reconcile {session} in the store: {e}")
+        try:
+            index = SessionIndex.open(session_path, session, session_txt,
+                                      lambda sent_id: take_name(self.speaker_id, session, sent_id))
+        except Exception as e:
+            print(f"Failed to load session index: {e}")
+            index = None
+        if self.store is not None:
+            next_sent_id = self.store.next_sent_id(session)
+        elif index is not None:
+            next_sent_id = index.next_sent_id()
+        elif os.path.exists(session_txt):
+            with open(session_txt, 'r', encoding='utf-8') as f:
+                next_sent_id = sum(1 for _ in f) + 1
+        else:
+            next_sent_id = 1
+        return index, next_sent_id
+
+    def session_failed(self, error):
+        self.session_busy = False
+        messagebox.showerror("Error", f"Session could not be opened or saved: {error}")
+
+    def encode_session(self):
+        """Queue the open session's takes still stored as WAV for FLAC encoding (TAKE_FORMAT flac)."""
+        if self.encoder is not None:
+            # only this session: `python -m atc encode` converts the rest of the corpus
+            threading.Thread(target=self.encoder.encode_tree, args=(os.path.dirname(self.session_path),),
+                             kwargs={'sessions': [self.current_session]}, daemon=True).start()
+
     def _load_session_start_from_info(self, session_path):
         try:
             info_path = os.path.join(session_path, "session_info.json")
@@ -480,10 +697,21 @@ class AudioTextCollector:
     def load_source(self):
         file = filedialog.askopenfilename(initialdir=".", title="Select Source Text File", filetypes=[("Text files", "*.txt")])
         if file:
+            try:
+                # lines are read on demand; only their offsets are kept in memory
+                lines = SourceModel(file)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to open source file: {e}")
+                return
+            self.close_source()
             self.source_file = file
-            with open(file, 'r', encoding='utf-8') as f:
-                self.source_lines = [line.strip() for line in f.readlines() if line.strip()]
-            # IMPORTANT: do NOT reset self.current_index here — keep checkpoint behavior intact
+            self.source_is_session = False
+            self.source_lines = lines
+            self.compact_source()
+            # resume this source where it was left; a checkpoint from before per-source
+            # cursors keeps its line index
+            if self.source_cursors:
+                self.current_index = self.source_cursors.get(os.path.abspath(file), 0)
             # just make sure current_index is within bounds
             if self.current_index < 0:
                 self.current_index = 0
@@ -496,6 +724,29 @@ class AudioTextCollector:
         else:
             messagebox.showinfo("Info", "No file selected.")
 
+    def compact_source(self):
+        """Fold journalled source edits into the file in the background once there are enough of them."""
+        model = self.source_lines
+        if not isinstance(model, SourceModel) or not model.edits:
+            return
+        if len(model.edits) >= config.SOURCE_COMPACT_EDITS:
+            threading.Thread(target=self._compact_source, args=(model,), daemon=True).start()
+
+    def _compact_source(self, model):
+        try:
+            count = model.compact()
+            if count:
+                print(f"Folded {count} edit(s) into {model.path}")
+        except Exception as e:
+            print(f"Failed to compact edits into {model.path}: {e}")
+
+    def close_source(self):
+        if isinstance(self.source_lines, SourceModel):
+            # closed on the I/O thread once the edits queued for it are journalled
+            self.io.submit(self.source_lines.close)
+        self.source_lines = []
+
+    @metrics.timed('ui.update_display')
     def update_display(self):
 
         if not self.source_lines:
@@ -528,23 +779,53 @@ class AudioTextCollector:
         else:
             self.waveform_canvas.delete("wave")
         self.update_button_state()
+        self.prefetch_neighbors()
 
     def load_current_audio(self):
+        self.stop_playback()
         self.current_sent_id = None
         self.current_audio = None
-        if self.current_session:
-            text = self.text_box.get('1.0', tk.END).strip()
-            if text and os.path.exists(self.session_txt):
-                with open(self.session_txt, 'r', encoding='utf-8') as f:
-                    lines = [line.strip() for line in f.readlines()]
-                try:
-                    i = lines.index(text)
-                    self.current_sent_id = i + 1
-                    audio_file = os.path.join(self.session_path, f"{self.speaker_id}_{self.current_session}_sent{self.current_sent_id:04d}.wav")
-                    if os.path.exists(audio_file):
-                        self.current_audio = audio_file
-                except ValueError:
-                    pass
+        entry = self.lookup_line(self.current_index, self.text_box.get('1.0', tk.END).strip())
+        if entry:
+            self.current_sent_id = entry['sent_id']
+            if entry.get('audio'):
+                path = os.path.join(self.session_path, entry['audio'])
+                if path in self.pending_takes:
+                    # linked a moment ago and still being moved into place
+                    self.current_audio = path
+                else:
+                    # the take may have been encoded to FLAC since it was linked
+                    self.current_audio = audiofile.resolve(path)
+
+    def lookup_line(self, index, text):
+        """Session index entry of source line `index` (showing `text`), or None."""
+        if not self.current_session or self.session_index is None:
+            return None
+        if self.source_is_session:
+            # reviewing a session: line N of its transcript is sent_id N + 1
+            return self.session_index.get(index + 1)
+        return self.session_index.lookup(self.source_key(), index, text) if text else None
+
+    def prefetch_neighbors(self):
+        """Queue the current take and those of the surrounding lines (next ones first) for the cache."""
+        if self.prefetcher is None:
+            return
+        paths = []
+        if self.current_audio and self.current_audio != self.temp_audio:
+            paths.append(self.current_audio)
+        for step in range(1, int(config.PREFETCH_NEIGHBORS) + 1):
+            for idx in (self.current_index + step, self.current_index - step):
+                if 0 <= idx < len(self.source_lines):
+                    entry = self.lookup_line(idx, self.source_lines[idx])
+                    if entry and entry.get('audio'):
+                        paths.append(os.path.join(self.session_path, entry['audio']))
+        self.prefetcher.request(paths)
+
+    def cached_take(self, path):
+        """The navigation cache's decoded copy of `path`, or None."""
+        if self.take_cache is None or not path or path == self.temp_audio:
+            return None
+        return self.take_cache.get(path)
 
     # -------------------------
     # Recording/session flow (unchanged except for replace logic)
@@ -553,6 +834,16 @@ class AudioTextCollector:
         if not self.source_lines:
             messagebox.showerror("Error", "Load source first")
             return
+        if self.session_busy:
+            return
+        self.session_busy = True
+        start_dt = datetime.datetime.now()
+        # queued behind the previous session's writes; continues in session_created
+        self.io.submit(self.create_session, self.session_number, start_dt,
+                       on_done=lambda result: self.session_created(result, start_dt), on_error=self.session_failed)
+
+    def create_session(self, session_number, start_dt):
+        """Runs on the I/O thread: the next session's folder, transcript, session_info.json and index."""
         sessions = [d for d in os.listdir(self.audio_path) if d.startswith('session_')]
         if sessions:
             nums = []
@@ -561,65 +852,97 @@ class AudioTextCollector:
                     nums.append(int(d.split('_')[1]))
                 except Exception:
                     pass
-            self.session_number = max(nums) + 1 if nums else 1
-        session_name = f"session_{self.session_number:02d}"
-        self.session_path = os.path.join(self.audio_path, session_name)
-        os.makedirs(self.session_path, exist_ok=True)
-        self.session_txt = os.path.join(self.transcripts_path, f"{session_name}.txt")
-        open(self.session_txt, 'a', encoding='utf-8').close()
+            session_number = max(nums) + 1 if nums else 1
+        session_name = f"session_{session_number:02d}"
+        session_path = os.path.join(self.audio_path, session_name)
+        os.makedirs(session_path, exist_ok=True)
+        session_txt = os.path.join(self.transcripts_path, f"{session_name}.txt")
+        open(session_txt, 'a', encoding='utf-8').close()
+        self._save_session_info_file(session_path, start_dt)
+        if self.store is not None:
+            self.store.upsert_session(session_name, start_dt.isoformat())
+        index, next_sent_id = self.read_session_index(session_name, session_path, session_txt)
+        return session_number, session_name, session_path, session_txt, index, next_sent_id
+
+    def session_created(self, result, start_dt):
+        self.session_busy = False
+        self.session_number, session_name, self.session_path, self.session_txt, index, next_sent_id = result
         self.current_session = session_name
-        self.session_start_datetime = datetime.datetime.now()
-        self._save_session_info_file(self.session_path, self.session_start_datetime)
+        self.session_index, self.next_sent_id = index, next_sent_id
+        self.session_start_datetime = start_dt
         self.save_checkpoint()
         self.new_session_btn.config(bg='red')
         self.start_recording()
         print(f"New session {session_name} started at {self.session_start_datetime.isoformat()}.")
 
+    @metrics.timed('ui.start_recording')
     def start_recording(self):
         if self.is_recording:
             return
+        self.stop_playback()
+        # resuming a paused take appends to its file instead of reading it back
+        resume = self.temp_take_open
+        if not resume:
+            self.capture.new_take()
+            self.auto_link_cancelled = False
+            self.temp_count += 1
+            self.temp_audio = os.path.join(self.temp_dir, f"take_{self.temp_count:05d}.wav")
+        try:
+            sink = self.capture.start(self.temp_audio, append=resume, open_later=True)
+        except Exception as e:
+            messagebox.showerror("Recording Error", str(e))
+            return
+        # the file is opened on the I/O thread, after the previous take's file was closed
+        self.io.submit(sink.open, on_error=self.take_open_failed)
+        self.temp_take_open = True
+        self.temp_ready = None
         self.is_recording = True
-        if os.path.exists(self.temp_audio):
-            with wave.open(self.temp_audio, 'rb') as wf:
-                self.frames = []
-                while chunk := wf.readframes(1024):
-                    self.frames.append(chunk)
-        else:
-            self.frames = []
         self.recording_start_time = time.time()
-        self.stream = self.p.open(format=pyaudio.paInt16, channels=1, rate=44100, input=True, frames_per_buffer=1024)
-        self.rec_thread = threading.Thread(target=self.record_loop)
-        self.rec_thread.start()
+        self.reset_live_waveform()
+        self.show_dropouts()
         self.update_timer()
         self.update_button_state()
         self.master.after(100, self.update_waveform)
+        if self.capture.endpoint is not None:
+            if self.auto_link_job is not None:
+                self.master.after_cancel(self.auto_link_job)
+            self.auto_link_job = self.master.after(AUTO_LINK_POLL_MS, self.update_auto_link)
 
-    def record_loop(self):
-        while self.is_recording:
-            try:
-                data = self.stream.read(1024)
-                self.frames.append(data)
-            except Exception as e:
-                messagebox.showerror("Recording Error", str(e))
-                self.is_recording = False
-
+    @metrics.timed('ui.stop_recording')
     def stop_recording(self, temp=True):
         if not self.is_recording:
             return
         self.is_recording = False
-        self.rec_thread.join()
-        self.stream.stop_stream()
-        self.stream.close()
-        if temp and self.frames:
-            with wave.open(self.temp_audio, 'wb') as wf:
-                wf.setnchannels(1)
-                wf.setsampwidth(self.p.get_sample_size(pyaudio.paInt16))
-                wf.setframerate(44100)
-                wf.writeframes(b''.join(self.frames))
-            self.current_audio = self.temp_audio
-            self.draw_static_waveform()
+        has_audio = self.capture.take_samples() > 0
+        # the take has been streaming to temp_audio; flushing it and patching its header
+        # happen on the I/O thread
+        sink = self.capture.stop(close=False)
+        if sink is not None:
+            path = self.temp_audio
+            self.io.submit(sink.close, on_done=lambda writer: self.take_closed(path))
+        if temp:
+            if has_audio:
+                self.current_audio = self.temp_audio
+                self.draw_static_waveform()
+            else:
+                self.delete_temp()
         self.update_button_state()
 
+    def take_closed(self, path):
+        # the paused take can be played from now on
+        self.temp_ready = path
+
+    def take_open_failed(self, error):
+        self.stop_recording(temp=False)
+        self.delete_temp()
+        messagebox.showerror("Recording Error", f"Failed to open {self.temp_audio}: {error}")
+
+    def clear_temp_takes(self):
+        """Runs on the I/O thread: remove takes left in temp/ by an earlier run."""
+        for name in os.listdir(self.temp_dir):
+            if name.startswith("take_"):
+                os.remove(os.path.join(self.temp_dir, name))
+
     def pause_recording(self):
         self.stop_recording(temp=True)
 
@@ -642,16 +965,17 @@ class AudioTextCollector:
         self.stop_recording(temp=False)
         self.delete_temp()
 
-        # Remove existing audio file for this sent id (we will overwrite when user links)
-        audio_file = os.path.join(self.session_path, f"{self.speaker_id}_{self.current_session}_sent{self.current_sent_id:04d}.wav")
-        try:
-            if os.path.exists(audio_file):
-                os.remove(audio_file)
-        except Exception as e:
-            print("Warning: failed to remove old audio during replace:", e)
+        # Remove existing audio file for this sent id (we will overwrite when user links);
+        # the line shows as pending at once, the files go on the I/O thread
+        audio_file = os.path.join(self.session_path, self.take_name(self.current_sent_id))
+        if self.session_index is not None:
+            self.session_index.stage(self.current_sent_id, audio=None, duration=None, status='pending')
+        if self.take_cache is not None:
+            self.take_cache.invalidate(audio_file)
+        self.io.submit(self.remove_take, audio_file, self.current_session, self.current_sent_id, self.session_index)
 
         self.current_audio = None
-        self.frames = []
+        self.capture.new_take()
         self.waveform_canvas.delete("wave")
 
         # Set replacing mode so link_line will not advance or change checkpoint
@@ -660,30 +984,75 @@ class AudioTextCollector:
         # Start recording replacement audio
         self.start_recording()
 
+    def remove_take(self, audio_file, session, sent_id, index):
+        """Runs on the I/O thread: delete a take and its copies ahead of its replacement."""
+        try:
+            with self.take_lock:
+                self.remove_files(audio_file, flac_path(audio_file), vad.raw_path(audio_file))
+            peaks.remove_peaks(audio_file)
+            peaks.remove_peaks(flac_path(audio_file))
+            if config.DERIVATIVE_RATE:
+                self.remove_files(resample.derivative_path(audio_file, int(config.DERIVATIVE_RATE)))
+            if index is not None:
+                index.update(sent_id, audio=None, duration=None, status='pending')
+            if self.store is not None:
+                self.store.mark_pending(session, sent_id)
+        except Exception as e:
+            print("Warning: failed to remove old audio during replace:", e)
+
+    def resolve_current_audio(self):
+        """Follow the current take to its FLAC if it was encoded while on screen."""
+        if self.current_audio and self.current_audio != self.temp_audio:
+            self.current_audio = audiofile.resolve(self.current_audio) or self.current_audio
+        return self.current_audio
+
     def toggle_play(self):
-        if not self.current_audio:
+        if self.current_audio in self.pending_takes or not self.resolve_current_audio():
+            return
+        if self.current_audio == self.temp_audio and self.temp_ready != self.temp_audio:
+            # the paused take is still being flushed (a few milliseconds)
             return
         if self.is_playing:
-            pygame.mixer.music.pause()
+            self.player.pause()
             self.is_playing = False
         else:
-            if pygame.mixer.music.get_busy():
-                pygame.mixer.music.unpause()
-            else:
-                pygame.mixer.music.load(self.current_audio)
-                pygame.mixer.music.play()
+            try:
+                # decodes only when the take is new or changed; otherwise resumes from the cursor
+                self.player.load(self.current_audio, self.cached_take(self.current_audio))
+                self.player.play()
+            except Exception as e:
+                messagebox.showerror("Playback Error", str(e))
+                return
             self.is_playing = True
         self.update_button_state()
         self.update_progress()
 
+    def stop_playback(self):
+        if self.is_playing:
+            self.player.stop()
+            self.is_playing = False
+            self.update_button_state()
+
+    def seek_playback(self, event):
+        """Click on the progress bar: jump there (and keep playing if it was)."""
+        if not self.current_audio or self.is_recording or self.player.path != self.current_audio:
+            return
+        width = max(1, self.progress_canvas.winfo_width())
+        target = self.player.duration * min(1.0, max(0.0, event.x / width))
+        if self.is_playing:
+            self.player.play(start=target)
+        else:
+            self.player.seek(target)
+
     def update_progress(self):
+        if self.is_playing and not self.player.active:
+            # reached the end of the take
+            self.is_playing = False
+            self.player.seek(0)
+            self.update_button_state()
         if self.is_playing:
-            pos_ms = pygame.mixer.music.get_pos()
-            pos = pos_ms / 1000.0
-            with wave.open(self.current_audio, 'rb') as wf:
-                total_frames = wf.getnframes()
-                rate = wf.getframerate()
-                total = total_frames / rate if rate else 0
+            pos = self.player.position()
+            total = self.player.duration
             percent = pos / total if total > 0 else 0
             width = self.progress_canvas.winfo_width()
             self.progress_canvas.delete("progress")
@@ -716,48 +1085,156 @@ class AudioTextCollector:
         else:
             self.play_btn.config(text="▶️ Resume Rec", command=self.resume_recording)
 
+    def reset_live_waveform(self):
+        self.waveform_canvas.delete("wave")
+        self.wave_items.clear()
+        self.wave_drawn = 0
+        self.wave_offset = 0
+
+    @metrics.timed('ui.update_waveform')
     def update_waveform(self):
+        """
+        Scrolling live view, one canvas column per envelope column. Each tick only draws
+        the columns captured since the last tick and shifts the older ones left, so the
+        cost does not depend on how long the take already is.
+        """
+        self.poll_capture_events()
         if self.is_recording:
-            if self.frames:
-                data = b''.join(self.frames)
-                audio_data = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
-                max_points = 1000
-                if len(audio_data) > max_points:
-                    audio_data = audio_data[::len(audio_data)//max_points]
-                self.waveform_canvas.delete("wave")
-                width = self.waveform_canvas.winfo_width()
-                height = self.waveform_canvas.winfo_height()
-                points = []
-                for i, val in enumerate(audio_data):
-                    x = (i / len(audio_data)) * width if len(audio_data) > 0 else 0
-                    y = height / 2 - val * (height / 2)
-                    points.extend([x, y])
-                self.waveform_canvas.create_line(points, fill='#00ff00', tags="wave")
+            env = self.capture.envelope
+            count = env.count
+            width = max(1, self.waveform_canvas.winfo_width())
+            start = max(self.wave_drawn, count - width)
+            if count > start:
+                offset = max(0, count - width)
+                shift = offset - self.wave_offset
+                if shift > 0:
+                    self.waveform_canvas.move("wave", -shift, 0)
+                    while self.wave_items and self.wave_items[0][1] <= offset:
+                        self.waveform_canvas.delete(self.wave_items.popleft()[0])
+                # start one column early so consecutive batches join up
+                if start > offset:
+                    start -= 1
+                mins, maxs = env.columns(start, count)
+                coords = envelope_coords(mins, maxs, start - offset, self.waveform_canvas.winfo_height())
+                if len(coords) >= 4:
+                    item = self.waveform_canvas.create_line(coords, fill='#00ff00', tags="wave")
+                    self.wave_items.append((item, count))
+                self.wave_offset = offset
+                self.wave_drawn = count
             self.master.after(100, self.update_waveform)
         else:
             self.waveform_canvas.delete("wave")
 
+    def poll_capture_events(self):
+        """Handle what the capture threads reported (they never touch Tk themselves)."""
+        for kind, value in self.capture.poll_events():
+            if kind == 'buffer':
+                print(f"Input overruns: capture buffer raised to {value} frames from the next take")
+            elif kind == 'error' and self.is_recording:
+                self.stop_recording(temp=False)
+                self.delete_temp()
+                messagebox.showerror("Recording Error", f"Recording stopped, the take could not be written: {value}")
+        self.show_dropouts()
+
+    def show_dropouts(self):
+        count, seconds = self.capture.take_dropouts()
+        text = ""
+        if count:
+            text = f"{count} overrun{'s' if count > 1 else ''} ({seconds:.2f} s of silence)"
+            if self.capture.frames_per_buffer > config.CAPTURE_FRAMES_PER_BUFFER:
+                text += f", buffer {self.capture.frames_per_buffer}"
+        self.xrun_label.config(text=text)
+
+    def update_auto_link(self):
+        """
+        Hands-free mode: once the reader has been quiet for HANDS_FREE_SILENCE_SECONDS
+        after speaking, link the take (which moves on and starts the next one). The
+        remaining time is shown while it counts down; Escape or speaking again stops it.
+        """
+        self.auto_link_job = None
+        if not self.is_recording or self.auto_link_cancelled:
+            if not self.auto_link_cancelled:
+                self.auto_link_label.config(text="")
+            return
+        silence = self.capture.endpoint.silence()
+        remaining = config.HANDS_FREE_SILENCE_SECONDS - silence
+        if silence and remaining <= 0:
+            self.auto_link_label.config(text="")
+            self.link_line()
+            return
+        if silence >= AUTO_LINK_SHOW_AFTER:
+            self.auto_link_label.config(text=f"Linking in {remaining:.1f} s (Esc to cancel)")
+        else:
+            self.auto_link_label.config(text="")
+        self.auto_link_job = self.master.after(AUTO_LINK_POLL_MS, self.update_auto_link)
+
+    def cancel_auto_link(self):
+        if self.capture.endpoint is None or not self.is_recording:
+            return
+        self.auto_link_cancelled = True
+        self.auto_link_label.config(text="Auto-link cancelled, press Enter to link")
+
+    @metrics.timed('ui.draw_static_waveform')
     def draw_static_waveform(self):
-        if self.current_audio:
-            with wave.open(self.current_audio, 'rb') as wf:
-                data = wf.readframes(wf.getnframes())
-                audio_data = np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0
-            max_points = 1000
-            if len(audio_data) > max_points:
-                audio_data = audio_data[::len(audio_data)//max_points]
-            self.waveform_canvas.delete("wave")
-            width = self.waveform_canvas.winfo_width()
+        if self.current_audio in self.pending_takes:
+            # drawn when the take is in place (take_written)
+            return
+        if self.resolve_current_audio():
+            width = max(1, self.waveform_canvas.winfo_width())
             height = self.waveform_canvas.winfo_height()
-            points = []
-            for i, val in enumerate(audio_data):
-                x = (i / len(audio_data)) * width if len(audio_data) > 0 else 0
-                y = height / 2 - val * (height / 2)
-                points.extend([x, y])
-            self.waveform_canvas.create_line(points, fill='#00ff00', tags="wave")
+            try:
+                cached = self.cached_take(self.current_audio)
+                if cached is not None:
+                    mins, maxs = peaks.reduce_to_width(cached.levels, width)
+                elif self.current_audio == self.temp_audio:
+                    # the paused take: the live envelope already holds its peaks (its file may
+                    # still be being flushed)
+                    envelope = self.capture.envelope
+                    levels = [(envelope.samples_per_column,) + envelope.columns(0)]
+                    mins, maxs = peaks.reduce_to_width(levels, width)
+                else:
+                    # linked takes read the level they need from their peak file
+                    mins, maxs = peaks.read_width(self.current_audio, width) or (None, None)
+            except Exception as e:
+                print(f"Failed to read waveform for {self.current_audio}: {e}")
+                return
+            self.waveform_canvas.delete("wave")
+            if mins is None:
+                # no current peak file (an old or re-encoded take): drawn once it is built
+                self.build_peaks(self.current_audio)
+                return
+            if len(mins) == 0:
+                return
+            coords = envelope_coords(mins, maxs, 0, height, x_step=width / len(mins))
+            self.waveform_canvas.create_line(coords, fill='#00ff00', tags="wave")
+
+    def build_peaks(self, path):
+        """Build the peak file of a take on the I/O thread, then redraw if it is still shown."""
+        if path in self.peaks_pending:
+            return
+        self.peaks_pending.add(path)
+
+        def built(result):
+            self.peaks_pending.discard(path)
+            if self.current_audio == path:
+                self.draw_static_waveform()
+
+        def failed(error):
+            self.peaks_pending.discard(path)
+            print(f"Failed to build peaks for {path}: {error}")
+        self.io.submit(peaks.write_peaks, path, on_done=built, on_error=failed)
 
     def delete_temp(self):
-        if os.path.exists(self.temp_audio):
-            os.remove(self.temp_audio)
+        """Drop the current temp take (on the I/O thread, after it has been closed)."""
+        if self.temp_audio is not None:
+            self.io.submit(self.remove_files, self.temp_audio, self.temp_audio + ".raw")
+        self.temp_take_open = False
+
+    @staticmethod
+    def remove_files(*paths):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
 
     def previous_line(self):
         if self.current_index > 0:
@@ -804,6 +1281,7 @@ class AudioTextCollector:
                     # not linked — start recording for the new line
                     self.start_recording()
 
+    @metrics.timed('ui.link_line')
     def link_line(self):
         """
         Save current temp recording to the session transcript. If self.is_replacing is True,
@@ -811,63 +1289,41 @@ class AudioTextCollector:
         DO NOT advance current_index or save checkpoint. If not replacing, behave as before:
         - if the line exists in session transcript, update it
         - else append a new session line and advance
+        The files are written by write_take on the I/O thread; the line counts as linked
+        (in the session index, in memory) as soon as it is queued.
         """
         if not self.current_session:
             return
         # stop recording and store temp
         self.stop_recording(temp=True)
-        if not (os.path.exists(self.temp_audio) or self.frames):
+        if not self.temp_take_open:
             return
         current_text = self.text_box.get('1.0', tk.END).strip()
-        # load existing session transcript lines
-        with open(self.session_txt, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-
         if self.current_sent_id is not None:
-            # update existing sentence line
             sent_id = self.current_sent_id
-            # ensure lines list long enough
-            if sent_id - 1 < len(lines):
-                lines[sent_id - 1] = current_text + '\n'
-            else:
-                # unlikely, but append to ensure index correctness
-                while len(lines) < sent_id - 1:
-                    lines.append('\n')
-                lines.append(current_text + '\n')
         else:
-            # creating new entry
-            sent_id = len(lines) + 1
-            lines.append(current_text + '\n')
-
-        audio_file = os.path.join(self.session_path, f"{self.speaker_id}_{self.current_session}_sent{sent_id:04d}.wav")
-        # write audio: either move temp or write frames
-        if os.path.exists(self.temp_audio):
-            try:
-                if os.path.exists(audio_file):
-                    os.remove(audio_file)
-                os.rename(self.temp_audio, audio_file)
-            except Exception as e:
-                messagebox.showerror("Save Error", f"Failed to save audio file: {e}")
-                return
-        else:
-            try:
-                with wave.open(audio_file, 'wb') as wf:
-                    wf.setnchannels(1)
-                    wf.setsampwidth(self.p.get_sample_size(pyaudio.paInt16))
-                    wf.setframerate(44100)
-                    wf.writeframes(b''.join(self.frames))
-            except Exception as e:
-                messagebox.showerror("Save Error", f"Failed to write audio: {e}")
-                return
-
-        self.frames = []
-        # write transcript
-        try:
-            with open(self.session_txt, 'w', encoding='utf-8') as f:
-                f.write(''.join(lines))
-        except Exception as e:
-            messagebox.showerror("Save Error", f"Failed to write session transcript: {e}")
-            return
+            sent_id = self.next_sent_id
+            self.next_sent_id += 1
+        audio_file = os.path.join(self.session_path, self.take_name(sent_id))
+        fields = {'hash': text_hash(current_text), 'audio': os.path.basename(audio_file), 'status': 'linked'}
+        # so QA can single out takes with gaps
+        overruns, dropout_seconds = self.capture.take_dropouts()
+        fields['overruns'] = overruns
+        fields['dropout_seconds'] = round(dropout_seconds, 3)
+        if not self.source_is_session:
+            # keep where the line came from so duplicates of a sentence stay distinct
+            fields['source'] = self.source_key()
+            fields['line'] = self.current_index
+        index = self.session_index
+        previous = index.stage(sent_id, **fields) if index is not None else None
+        take = self.temp_audio
+        self.pending_takes[audio_file] = self.pending_takes.get(audio_file, 0) + 1
+        self.io.submit(self.write_take, take, audio_file, sent_id, current_text, fields,
+                       self.current_session, self.session_txt, index,
+                       on_done=lambda result: self.take_written(audio_file),
+                       on_error=lambda e: self.take_failed(e, take, audio_file, sent_id, index, previous))
+        self.temp_take_open = False
+        self.capture.new_take()
 
         self.current_sent_id = sent_id
 
@@ -885,27 +1341,110 @@ class AudioTextCollector:
                 self.update_display()
                 self.start_recording()
 
+    def write_take(self, take, audio_file, sent_id, text, fields, session, session_txt, index):
+        """
+        Runs on the I/O thread: link the recorded take (see atc.linking: trim, move it into
+        the session, record it in the store or session transcript, peaks, index entry), then
+        queue its copies.
+        """
+        linking.link_take(take, audio_file, sent_id, text, fields, session, session_txt, index,
+                          store=self.store, lock=self.take_lock)
+        if self.derivatives is not None:
+            self.derivatives.submit(self.write_derivative, audio_file)
+        if self.encoder is not None:
+            # never waits: if the pool is full the take stays WAV until its session is opened again
+            self.encoder.submit(audio_file)
+
+    def _take_done(self, audio_file):
+        count = self.pending_takes.get(audio_file, 0) - 1
+        if count > 0:
+            self.pending_takes[audio_file] = count
+        else:
+            self.pending_takes.pop(audio_file, None)
+        if self.take_cache is not None:
+            self.take_cache.invalidate(audio_file)
+
+    def take_written(self, audio_file):
+        self._take_done(audio_file)
+        if self.current_audio == audio_file and audio_file not in self.pending_takes:
+            self.draw_static_waveform()
+
+    def take_failed(self, error, take, audio_file, sent_id, index, previous):
+        self._take_done(audio_file)
+        if index is not None:
+            index.restore(sent_id, previous)
+        if previous is None and self.next_sent_id == sent_id + 1:
+            self.next_sent_id = sent_id
+        if self.current_audio == audio_file:
+            self.update_display()
+        messagebox.showerror("Save Error", f"Failed to save take {os.path.basename(audio_file)}: {error}\n"
+                                           f"The recording was left in {take}.")
+
+    @staticmethod
+    def take_durations(session_path, index):
+        """{sent_id: seconds} of a session's linked takes, from its index (else their headers)."""
+        if index is not None:
+            return index.take_durations(session_path)
+        durations = {}
+        for name in os.listdir(session_path):
+            sent_id = take_sent_id(name) if audiofile.is_take(name) else None
+            if sent_id is not None:
+                try:
+                    info = audiofile.read_info(os.path.join(session_path, name))
+                    durations[sent_id] = info.nframes / info.rate
+                except Exception as e:
+                    print(f"Failed to read take header {name}: {e}")
+        return durations
+
+    def write_derivative(self, audio_file):
+        """Runs on the derivatives worker: the resampled copy of a linked take."""
+        try:
+            resample.write_derivative(audio_file, int(config.DERIVATIVE_RATE), int(config.DERIVATIVE_CHANNELS))
+        except Exception as e:
+            print(f"Failed to write resampled copy of {audio_file}: {e}")
+
     # -------------------------
     # End session metadata window (uses NORMAL fonts)
     # -------------------------
     def end_session(self):
+        if self.session_busy or not self.current_session:
+            return
         self.stop_recording(temp=True)
+        end_datetime = datetime.datetime.now()
+        self.session_busy = True
+        # counted on the I/O thread once every linked take is written; the dialog opens when done
+        self.io.submit(self.session_totals, self.current_session, self.session_path, self.session_txt,
+                       self.session_index,
+                       on_done=lambda totals: self.show_session_metadata(totals, end_datetime),
+                       on_error=self.session_failed)
+
+    def session_totals(self, session, session_path, session_txt, index):
+        """Runs on the I/O thread: line count, total duration, start and capture format of a session."""
+        if self.store is not None:
+            num_lines = self.store.sentence_count(session)
+            total_dur = self.store.total_duration(session)
+        else:
+            num_lines = 0
+            if os.path.exists(session_txt):
+                with open(session_txt, 'r', encoding='utf-8') as f:
+                    num_lines = sum(1 for _ in f)
+            # durations were cached in the session index when each take was linked
+            total_dur = sum(self.take_durations(session_path, index).values())
+        return num_lines, total_dur, self._load_session_start_from_info(session_path), self.session_profile(session_path)
+
+    def show_session_metadata(self, totals, end_datetime):
+        self.session_busy = False
+        num_lines, total_dur, start_dt, profile = totals
+        session, session_path, session_txt, index = (self.current_session, self.session_path, self.session_txt,
+                                                      self.session_index)
         meta_win = Toplevel(self.master)
         meta_win.title("Session Metadata")
         meta_win.configure(bg='#333333')
         meta_win.geometry("600x900")  # a bit taller to fit new dropdowns
 
-        end_datetime = datetime.datetime.now()
-        num_lines = sum(1 for _ in open(self.session_txt, 'r', encoding='utf-8')) if os.path.exists(self.session_txt) else 0
-        total_dur = 0
-        wav_files = [f for f in os.listdir(self.session_path) if f.endswith('.wav')]
-        for wav in wav_files:
-            with wave.open(os.path.join(self.session_path, wav), 'rb') as wf:
-                total_dur += wf.getnframes() / wf.getframerate()
         avg_dur = total_dur / num_lines if num_lines > 0 else 0
-
         if not self.session_start_datetime:
-            self.session_start_datetime = self._load_session_start_from_info(self.session_path)
+            self.session_start_datetime = start_dt
 
         frame = tk.Frame(meta_win, bg='#333333')
         frame.pack(padx=20, pady=20, fill=tk.BOTH, expand=True)
@@ -1029,21 +1568,21 @@ class AudioTextCollector:
 
         tk.Label(frame, text="Sample Rate:", bg='#333333', fg='white', font=LABEL_FONT_NORMAL).grid(row=row, column=0, sticky='e', pady=5)
         sample_rate_entry = tk.Entry(frame, bg='#444444', fg='white', font=ENTRY_FONT_NORMAL, insertbackground='white')
-        sample_rate_entry.insert(0, "44100")
+        sample_rate_entry.insert(0, str(profile['sample_rate']))
         sample_rate_entry.config(state='readonly')
         sample_rate_entry.grid(row=row, column=1, sticky='w', pady=5)
         row += 1
 
         tk.Label(frame, text="Channels:", bg='#333333', fg='white', font=LABEL_FONT_NORMAL).grid(row=row, column=0, sticky='e', pady=5)
         channels_entry = tk.Entry(frame, bg='#444444', fg='white', font=ENTRY_FONT_NORMAL, insertbackground='white')
-        channels_entry.insert(0, "1")
+        channels_entry.insert(0, str(profile['channels']))
         channels_entry.config(state='readonly')
         channels_entry.grid(row=row, column=1, sticky='w', pady=5)
         row += 1
 
         tk.Label(frame, text="Bit Depth:", bg='#333333', fg='white', font=LABEL_FONT_NORMAL).grid(row=row, column=0, sticky='e', pady=5)
         bit_depth_entry = tk.Entry(frame, bg='#444444', fg='white', font=ENTRY_FONT_NORMAL, insertbackground='white')
-        bit_depth_entry.insert(0, "16")
+        bit_depth_entry.insert(0, str(profile['bit_depth']))
         bit_depth_entry.config(state='readonly')
         bit_depth_entry.grid(row=row, column=1, sticky='w', pady=5)
         row += 1
@@ -1058,57 +1597,57 @@ class AudioTextCollector:
             #style = style_entry.get()
             speaking_style = speaking_style_var.get()          # new
             session_quality = int(quality_var.get())     # new
-            if self.session_start_datetime and os.path.exists(self.session_path):
-                # write minimal start_datetime first (this keeps earlier behavior)
-                self._save_session_info_file(self.session_path, self.session_start_datetime)
-            # Save additional session-level metadata to session_info.json
-            try:
-                info = {
-                    'start_datetime': self.session_start_datetime.isoformat() if self.session_start_datetime else None,
-                    'end_datetime': end_datetime.isoformat(),
-                    'collector': collector,
-                    'language': lang,
-                    'sensitive_flagged': sensitive,
-                    'speaking_style': speaking_style,
-                    'session_quality': session_quality,
-                    'speaker_gender': gender,
-                    'speaker_age': age,
-                    'speaker_accent': accent,
-                    #'speaking_style': speaking_style
-                }
-                with open(os.path.join(self.session_path, "session_info.json"), 'w', encoding='utf-8') as sf:
-                    json.dump(info, sf, ensure_ascii=False, indent=2)
-            except Exception as e:
-                print("Failed to save extended session_info.json:", e)
-
-            self.generate_session_metadata()
-            readme_path = os.path.join(self.audio_path, "README_audio.md")
-            with open(readme_path, 'a', encoding='utf-8') as f:
-                f.write(f"\nSession {self.current_session}:\n")
-                f.write(f"Start Date: {self.session_start_datetime.strftime('%Y-%m-%d %H:%M:%S') if self.session_start_datetime else ''}\n")
-                f.write(f"End Date: {end_datetime.strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"Data Collector: {collector}\n")
-                f.write(f"Language: {lang}\n")
-                f.write(f"Sensitive Information Flagged: {sensitive}\n")
-                f.write(f"Number of Audios/Lines: {num_lines}\n")
-                f.write(f"Total Duration (seconds): {total_dur:.2f}\n")
-                f.write(f"Average Duration (seconds): {avg_dur:.2f}\n")
-                f.write(f"Speaker Gender: {gender}\n")
-                f.write(f"Speaker Age: {age}\n")
-                f.write(f"Speaker Accent: {accent}\n")
-                #f.write(f"Speaking Style: {style}\n")
-                f.write(f"Speaking Style: {speaking_style}\n")           # new
-                f.write(f"Session Quality: {session_quality}\n")  # new
-                f.write("Sample Rate: 44100\n")
-                f.write("Channels: 1\n")
-                f.write("Bit Depth: 16\n")
+            # additional session-level metadata for session_info.json
+            info = {
+                'start_datetime': self.session_start_datetime.isoformat() if self.session_start_datetime else None,
+                'end_datetime': end_datetime.isoformat(),
+                'collector': collector,
+                'language': lang,
+                'sensitive_flagged': sensitive,
+                'speaking_style': speaking_style,
+                'session_quality': session_quality,
+                'speaker_gender': gender,
+                'speaker_age': age,
+                'speaker_accent': accent,
+                #'speaking_style': speaking_style
+            }
+            info.update(profile)
+            readme = (f"\nSession {session}:\n"
+                      f"Start Date: {self.session_start_datetime.strftime('%Y-%m-%d %H:%M:%S') if self.session_start_datetime else ''}\n"
+                      f"End Date: {end_datetime.strftime('%Y-%m-%d %H:%M:%S')}\n"
+                      f"Data Collector: {collector}\n"
+                      f"Language: {lang}\n"
+                      f"Sensitive Information Flagged: {sensitive}\n"
+                      f"Number of Audios/Lines: {num_lines}\n"
+                      f"Total Duration (seconds): {total_dur:.2f}\n"
+                      f"Average Duration (seconds): {avg_dur:.2f}\n"
+                      f"Speaker Gender: {gender}\n"
+                      f"Speaker Age: {age}\n"
+                      f"Speaker Accent: {accent}\n"
+                      f"Speaking Style: {speaking_style}\n"           # new
+                      f"Session Quality: {session_quality}\n"  # new
+                      f"Sample Rate: {profile['sample_rate']}\n"
+                      f"Channels: {profile['channels']}\n"
+                      f"Bit Depth: {profile['bit_depth']}\n")
+            save_btn.config(state=tk.DISABLED)
+            # the files are written on the I/O thread; the window closes once they are
+            self.io.submit(self.save_session_files, session, session_path, session_txt, index, info, readme,
+                           on_done=lambda result: session_saved(), on_error=save_failed)
+
+        def session_saved():
             meta_win.destroy()
-            self.current_session = None
-            self.session_start_datetime = None
-            self.new_session_btn.config(bg='#555555')
-            self.save_checkpoint()
+            if self.current_session == session:
+                self.current_session = None
+                self.session_index = None
+                self.session_start_datetime = None
+                self.new_session_btn.config(bg='#555555')
+                self.save_checkpoint()
             print("Session ended.")
 
+        def save_failed(error):
+            save_btn.config(state=tk.NORMAL)
+            messagebox.showerror("Save Error", f"Failed to save session metadata: {error}")
+
         # Collector entry placed after the labels; place it now (normal font)
         tk.Label(frame, text="Data Collector Name:", bg='#333333', fg='white', font=LABEL_FONT_NORMAL).grid(row=2, column=0, sticky='e', pady=5)
         collector_entry = tk.Entry(frame, bg='#444444', fg='white', font=ENTRY_FONT_NORMAL, insertbackground='white')
@@ -1120,57 +1659,78 @@ class AudioTextCollector:
     # -------------------------
     # Metadata generation / merge (unchanged)
     # -------------------------
-    def generate_session_metadata(self):
-        meta_file = os.path.join(self.session_path, f"{self.current_session}.metadata.csv")
-        with open(meta_file, 'w', encoding='utf-8') as f:
-            f.write("sentence_id,audio_file,text,duration\n")
-            with open(self.session_txt, 'r', encoding='utf-8') as txt:
-                lines = [line.strip() for line in txt.readlines()]
-            for i, text in enumerate(lines):
-                sent_id = i + 1
-                audio = f"{self.speaker_id}_{self.current_session}_sent{sent_id:04d}.wav"
-                audio_p = os.path.join(self.session_path, audio)
-                dur = 0
-                if os.path.exists(audio_p):
-                    with wave.open(audio_p, 'rb') as wf:
-                        dur = wf.getnframes() / wf.getframerate()
-                f.write(f"{sent_id},{audio},{text},{dur}\n")
-        self.merge_metadata()
-
-    def merge_metadata(self):
+    def save_session_files(self, session, session_path, session_txt, index, info, readme):
+        """Runs on the I/O thread: session_info.json, the metadata CSVs and the README_audio.md entry of a closed session."""
+        try:
+            with open(os.path.join(session_path, "session_info.json"), 'w', encoding='utf-8') as sf:
+                json.dump(info, sf, ensure_ascii=False, indent=2)
+            if self.store is not None:
+                self.store.upsert_session(session, info['start_datetime'], info)
+        except Exception as e:
+            print("Failed to save extended session_info.json:", e)
+        self.generate_session_metadata(session, session_path, session_txt, index)
+        readme_path = os.path.join(self.audio_path, "README_audio.md")
+        with open(readme_path, 'a', encoding='utf-8') as f:
+            f.write(readme)
+
+    def generate_session_metadata(self, session, session_path, session_txt, index):
         global_meta = "metadata.csv"
-        with open(global_meta, 'w', encoding='utf-8') as g:
-            g.write("session,sentence_id,audio_file,text,duration\n")
-            sessions = [d for d in os.listdir(self.audio_path) if d.startswith('session_')]
-            for ses in sessions:
-                meta = os.path.join(self.audio_path, ses, f"{ses}.metadata.csv")
-                if os.path.exists(meta):
-                    with open(meta, 'r', encoding='utf-8') as m:
-                        next(m)
-                        for line in m:
-                            g.write(f"{ses},{line}")
+        if self.store is not None:
+            # the txt/csv files are views of the store; refresh them for this session
+            self.store.export_transcript(session, session_txt)
+            self.store.export_session_metadata(session, session_path)
+            # merged like the file layout's, so closing a session never rewrites the whole corpus
+            merge_metadata(self.audio_path, global_meta, sessions=[session])
+        else:
+            # only the session being closed can have changed; the rest of metadata.csv is left alone
+            export_session(self.audio_path, session, session_path, session_txt, self.speaker_id, global_meta,
+                           durations=self.take_durations(session_path, index))
 
     def load_existing_session(self):
+        if self.session_busy:
+            return
         session_dir = filedialog.askdirectory(initialdir=self.audio_path, title="Select Session Folder")
         if session_dir:
             ses_name = os.path.basename(session_dir)
-            self.session_path = session_dir
-            self.session_txt = os.path.join(self.transcripts_path, f"{ses_name}.txt")
-            if os.path.exists(self.session_txt):
-                with open(self.session_txt, 'r', encoding='utf-8') as f:
-                    self.source_lines = [line.strip() for line in f.readlines()]
-                self.current_index = 0
-                self.current_session = ses_name
-                # clear replacing state when loading session
-                self.is_replacing = False
-                start_dt = self._load_session_start_from_info(self.session_path)
-                if start_dt:
-                    self.session_start_datetime = start_dt
-                self.new_session_btn.config(bg='red')
-                self.update_display()
-                print(f"Session {ses_name} loaded for checking.")
-            else:
-                messagebox.showerror("Error", "Session transcript not found")
+            session_txt = os.path.join(self.transcripts_path, f"{ses_name}.txt")
+            self.session_busy = True
+            # read on the I/O thread after the open session's writes; continues in session_loaded
+            self.io.submit(self.read_session, ses_name, session_dir, session_txt,
+                           on_done=lambda result: self.session_loaded(result, ses_name, session_dir, session_txt),
+                           on_error=self.session_failed)
+
+    def read_session(self, session, session_path, session_txt):
+        """Runs on the I/O thread: the transcript lines, index, next sent_id and start of a recorded session."""
+        if self.store is not None and (self.store.has_session(session) or os.path.exists(session_txt)):
+            index, next_sent_id = self.read_session_index(session, session_path, session_txt)
+            lines = self.store.transcript_lines(session)
+        elif os.path.exists(session_txt):
+            with open(session_txt, 'r', encoding='utf-8') as f:
+                lines = [line.strip() for line in f.readlines()]
+            index, next_sent_id = self.read_session_index(session, session_path, session_txt)
+        else:
+            raise FileNotFoundError("Session transcript not found")
+        return lines, index, next_sent_id, self._load_session_start_from_info(session_path)
+
+    def session_loaded(self, result, ses_name, session_dir, session_txt):
+        self.session_busy = False
+        lines, index, next_sent_id, start_dt = result
+        self.session_path = session_dir
+        self.session_txt = session_txt
+        self.current_session = ses_name
+        self.session_index, self.next_sent_id = index, next_sent_id
+        self.close_source()
+        self.source_lines = lines
+        self.current_index = 0
+        self.source_is_session = True
+        # clear replacing state when loading session
+        self.is_replacing = False
+        if start_dt:
+            self.session_start_datetime = start_dt
+        self.new_session_btn.config(bg='red')
+        self.encode_session()
+        self.update_display()
+        print(f"Session {ses_name} loaded for checking.")
 
     # -------------------------
     # About dialog (NORMAL fonts)
@@ -1230,8 +1790,8 @@ class AudioTextCollector:
     def save_current_edit(self):
         """
         Save the text currently shown in the textbox back to the loaded source file.
-        Preserves original file blank-line layout by mapping non-empty lines in the
-        file to entries in self.source_lines.
+        The edit is appended to the source's edit journal and shown from there; the
+        file itself is rewritten in bulk later (see SourceModel.compact).
         """
         if not self.source_lines:
             messagebox.showinfo("Info", "No source loaded.")
@@ -1243,61 +1803,33 @@ class AudioTextCollector:
             return
 
         new_text = self.text_box.get('1.0', tk.END).rstrip('\n')
-        # Update in-memory lines first
-        self.source_lines[self.current_index] = new_text
 
-        if not self.source_file:
-            # Nothing to write to on disk, but update display anyway
+        if not isinstance(self.source_lines, SourceModel):
+            # reviewing a session: its lines are not those of the source file
+            self.source_lines[self.current_index] = new_text
             self.update_display()
-            messagebox.showinfo("Saved", "Edit saved to memory (no source file path).")
-            return
-
-        try:
-            with open(self.source_file, 'r', encoding='utf-8') as f:
-                orig_lines = f.readlines()
-        except Exception as e:
-            messagebox.showerror("Save Error", f"Failed to read source file: {e}")
+            messagebox.showinfo("Saved", "Edit saved to memory (the session transcript is not changed).")
             return
 
-        out_lines = []
-        src_idx = 0
-        for ol in orig_lines:
-            if ol.strip():  # map to source_lines entries
-                if src_idx < len(self.source_lines):
-                    out_lines.append(self.source_lines[src_idx] + '\n')
-                else:
-                    out_lines.append(ol)
-                src_idx += 1
-            else:
-                out_lines.append(ol)
-
-        # Append any remaining in-memory lines if original had fewer non-empty lines
-        while src_idx < len(self.source_lines):
-            out_lines.append(self.source_lines[src_idx] + '\n')
-            src_idx += 1
-
-        try:
-            tmp_path = self.source_file + ".tmp"
-            with open(tmp_path, 'w', encoding='utf-8') as tf:
-                tf.writelines(out_lines)
-            os.replace(tmp_path, self.source_file)
-        except Exception as e:
-            # fallback direct write
-            try:
-                with open(self.source_file, 'w', encoding='utf-8') as f:
-                    f.writelines(out_lines)
-            except Exception as e2:
-                messagebox.showerror("Save Error", f"Failed to write source file: {e2}")
-                try:
-                    if os.path.exists(tmp_path):
-                        os.remove(tmp_path)
-                except Exception:
-                    pass
-                return
+        # the journal append (and its fsync) runs on the I/O thread
+        model, index = self.source_lines, self.current_index
+        self.io.submit(model.edit, index, new_text,
+                       on_done=lambda result: self.edit_saved(model, index), on_error=self.edit_failed)
 
+    def edit_saved(self, model, index):
+        if model is not self.source_lines:
+            return
+        self.compact_source()
         # Refresh display and confirm
-        self.update_display()
-        messagebox.showinfo("Saved", f"Line {self.current_index + 1} saved to {os.path.basename(self.source_file)}.")
+        if index == self.current_index:
+            self.update_display()
+        messagebox.showinfo("Saved", f"Line {index + 1} saved to {os.path.basename(model.path)}.")
+
+    def edit_failed(self, error):
+        if isinstance(error, ValueError):
+            messagebox.showerror("Save Error", f"Edit not saved: {error}")
+        else:
+            messagebox.showerror("Save Error", f"Failed to write source edit: {error}")
 
 if __name__ == "__main__":
     root = tk.Tk()
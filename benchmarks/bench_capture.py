@@ -0,0 +1,98 @@
+"""
+Compare the old list-of-bytes capture path with the ring-buffer engine.
+
+Both paths are fed the same simulated PyAudio chunks (1024 frames of mono int16 at
+44.1 kHz, a fresh `bytes` object per chunk as PyAudio hands them out), read the take
+the way the live waveform does every 100 ms, and then do what stop_recording needs
+to write the take. Reported per captured second: CPU time, the number of allocations
+still alive when the take is written, and the peak traced memory.
+
+    python benchmarks/bench_capture.py --seconds 300 [--no-live-view]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from atc.capture import RingBuffer  # noqa: E402
+
+RATE = 44100
+CHUNK = 1024
+TICK_CHUNKS = int(0.1 * RATE / CHUNK)  # chunks between two waveform redraws
+MAX_POINTS = 1000
+
+
+def make_pool():
+    rng = np.random.default_rng(0)
+    return [rng.integers(-3000, 3000, CHUNK, dtype=np.int16).tobytes() for _ in range(64)]
+
+
+def snapshot():
+    return tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+
+
+def run_list(pool, n_chunks, live_view):
+    frames = []
+    for i in range(n_chunks):
+        frames.append(bytes(memoryview(pool[i % len(pool)])))
+        if live_view and i % TICK_CHUNKS == 0:
+            audio = np.frombuffer(b''.join(frames), dtype=np.int16).astype(np.float32) / 32768.0
+            if len(audio) > MAX_POINTS:
+                audio = audio[::len(audio) // MAX_POINTS]
+    snap = snapshot()
+    data = b''.join(frames)
+    return len(data), snap
+
+
+def run_ring(pool, n_chunks, live_view):
+    ring = RingBuffer(n_chunks * CHUNK + CHUNK)
+    for i in range(n_chunks):
+        ring.write(bytes(memoryview(pool[i % len(pool)])))
+        if live_view and i % TICK_CHUNKS == 0:
+            take = ring.view(0)
+            if len(take) > MAX_POINTS:
+                take = take[::len(take) // MAX_POINTS]
+            audio = take.astype(np.float32) / 32768.0
+    snap = snapshot()
+    take = ring.view(0)
+    return take.nbytes, snap
+
+
+def measure(fn, pool, seconds, live_view):
+    n_chunks = int(seconds * RATE / CHUNK)
+    # CPU is timed on its own run: tracemalloc makes every allocation much slower
+    cpu0 = time.process_time()
+    nbytes, _ = fn(pool, n_chunks, live_view)
+    cpu = time.process_time() - cpu0
+    tracemalloc.start()
+    _, snapshot = fn(pool, n_chunks, live_view)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    live = sum(s.count for s in snapshot.statistics('filename'))
+    captured = nbytes / 2 / RATE
+    return {
+        'cpu_ms_per_s': 1000.0 * cpu / captured,
+        'live_allocs_per_s': live / captured,
+        'peak_mb': peak / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--seconds', type=float, default=120, help="simulated take length")
+    parser.add_argument('--no-live-view', action='store_true', help="skip the 100 ms waveform reads")
+    args = parser.parse_args()
+    pool = make_pool()
+    print(f"simulated take: {args.seconds:.0f} s, live view {'off' if args.no_live_view else 'on'}")
+    for name, fn in (("list-of-bytes", run_list), ("ring buffer", run_ring)):
+        r = measure(fn, pool, args.seconds, not args.no_live_view)
+        print(f"{name:>14}: {r['cpu_ms_per_s']:7.3f} ms CPU/s  "
+              f"{r['live_allocs_per_s']:8.1f} live allocs/s  {r['peak_mb']:8.1f} MB peak")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Measure what METRICS costs: the time @timed adds to a call, compared with the
+cheapest instrumented hot path (one capture callback's worth of work: a ring
+write plus the waveform envelope), and the time of one report line.
+
+    python benchmarks/bench_metrics.py --calls 200000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from atc import config  # noqa: E402
+
+config.METRICS = True
+from atc import metrics  # noqa: E402
+from atc.capture import RingBuffer  # noqa: E402
+from atc.waveform import PeakEnvelope  # noqa: E402
+
+
+def per_call(fn, calls):
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - t0) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--frames', type=int, default=1024)
+    args = parser.parse_args()
+
+    def nothing():
+        pass
+
+    bare = per_call(nothing, args.calls)
+    timed = per_call(metrics.timed('bench.nothing')(nothing), args.calls)
+    overhead = timed - bare
+
+    ring = RingBuffer(44100 * 60)
+    envelope = PeakEnvelope(samples_per_column=441)
+    chunk = np.random.default_rng(0).normal(0, 3000, args.frames).astype(np.int16).tobytes()
+
+    def capture_chunk():
+        start = ring.written
+        ring.write(chunk)
+        envelope.add(ring.view(start))
+
+    work = per_call(capture_chunk, args.calls // 10)
+    print(f"@timed overhead {overhead * 1e6:.2f} us per call; a {args.frames}-frame capture chunk takes "
+          f"{work * 1e6:.1f} us ({overhead / work * 100:.2f}% overhead) and arrives every "
+          f"{args.frames / 44100 * 1000:.1f} ms ({overhead / (args.frames / 44100) * 100:.4f}% of a core)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reporter = metrics.Reporter(path=os.path.join(tmp, "metrics.jsonl"), interval=3600)
+        t0 = time.perf_counter()
+        reporter.stop()
+        print(f"report line {(time.perf_counter() - t0) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
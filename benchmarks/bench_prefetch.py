@@ -0,0 +1,96 @@
+"""
+Time what navigating to a line costs for its take: waveform peaks for the canvas
+plus the decoded samples for playback, read from disk (cold) and from the
+navigation cache once the prefetcher has loaded the neighbours (warm).
+
+    python benchmarks/bench_prefetch.py --takes 20 --seconds 8 [--width 1200]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from atc import peaks  # noqa: E402
+from atc.audiofile import read_info, read_samples  # noqa: E402
+from atc.prefetch import Prefetcher, TakeCache  # noqa: E402
+from atc.wavfile import WavStreamWriter  # noqa: E402
+
+RATE = 44100
+
+
+def make_takes(directory, count, seconds):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"take_{i:03d}.wav")
+        writer = WavStreamWriter(path, rate=RATE, fsync=False)
+        writer.write(rng.normal(0, 3000, int(seconds * RATE)).astype(np.int16))
+        writer.close()
+        peaks.write_peaks(path)
+        paths.append(path)
+    return paths
+
+
+def cold(path, width):
+    peaks.peaks_for_width(path, width)
+    info = read_info(path)
+    samples = read_samples(path, info)
+    np.array(samples, dtype=np.int16)
+    del samples
+
+
+def warm(cache, path, width):
+    entry = cache.get(path)
+    peaks.reduce_to_width(entry.levels, width)
+
+
+def report(name, times):
+    times.sort()
+    print(f"{name}: median {times[len(times) // 2] * 1000:.2f} ms, max {times[-1] * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--takes', type=int, default=20)
+    parser.add_argument('--seconds', type=float, default=8)
+    parser.add_argument('--width', type=int, default=1200)
+    parser.add_argument('--neighbors', type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        paths = make_takes(tmp, args.takes, args.seconds)
+        times = []
+        for path in paths:
+            t0 = time.perf_counter()
+            cold(path, args.width)
+            times.append(time.perf_counter() - t0)
+        report("cold", times)
+
+        cache = TakeCache(256 << 20)
+        prefetcher = Prefetcher(cache)
+        times = []
+        for i, path in enumerate(paths):
+            # what the UI asks for after showing line i; give the thread time to load the next line
+            prefetcher.request([p for p in paths[i:i + args.neighbors + 1]])
+            while cache.get(path, count=False) is None:
+                time.sleep(0.001)
+            t0 = time.perf_counter()
+            warm(cache, path, args.width)
+            times.append(time.perf_counter() - t0)
+        prefetcher.stop()
+        report("warm", times)
+        stats = cache.stats()
+        print(f"cache: {stats['entries']} takes, {stats['bytes'] / (1 << 20):.1f} MiB, "
+              f"{stats['hits']} hits, {stats['misses']} misses")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
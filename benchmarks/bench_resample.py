@@ -0,0 +1,51 @@
+"""
+Resampling throughput against real time for a few capture profiles.
+
+For each source format a synthetic take (speech-band tones plus noise) is
+converted to the target rate and channel count, and the time taken is reported as
+a multiple of the take's duration (e.g. 150x = a 30 s take in 0.2 s).
+
+    python benchmarks/bench_resample.py [--seconds 30] [--rate 16000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from atc.resample import resample  # noqa: E402
+
+PROFILES = [(44100, 1), (48000, 1), (48000, 2), (22050, 1), (16000, 1)]
+
+
+def make_take(rate, channels, seconds):
+    rng = np.random.default_rng(0)
+    t = np.arange(int(rate * seconds)) / rate
+    x = sum(np.sin(2 * np.pi * f * t) for f in (180, 750, 2400)) * 6000 + rng.normal(0, 300, len(t))
+    x = np.repeat(x[:, None], channels, axis=1)
+    return np.clip(x, -32768, 32767).astype(np.int16).reshape(-1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--rate', type=int, default=16000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for rate, channels in PROFILES:
+        take = make_take(rate, channels, args.seconds)
+        resample(take[:rate * channels], channels, rate, args.rate)  # build the filter outside the timing
+        best = float('inf')
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            resample(take, channels, rate, args.rate)
+            best = min(best, time.perf_counter() - t0)
+        print(f"{rate:>6} Hz x{channels} -> {args.rate} Hz mono: {best * 1000:7.1f} ms "
+              f"for {args.seconds:.0f} s, {args.seconds / best:7.1f}x real time")
+
+
+if __name__ == "__main__":
+    main()
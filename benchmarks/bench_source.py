@@ -0,0 +1,67 @@
+"""
+Time opening a large source file with SourceModel: the first open (scan and index
+sidecar), a cached open, showing a line with its neighbours, journalling edits and
+compacting them into the file.
+
+    python benchmarks/bench_source.py --lines 5000000
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from atc.source_model import SourceModel  # noqa: E402
+
+WORDS = "the a recorder sentence speaker reads each line aloud while audio is captured and linked".split()
+
+
+def make_source(path, lines):
+    rng = random.Random(0)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(lines):
+            f.write(" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14))) + "\n")
+            if i % 1000 == 0:
+                f.write("\n")
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=1000000)
+    parser.add_argument('--edits', type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, "source.txt")
+        make_source(path, args.lines)
+        size = os.path.getsize(path) / (1 << 20)
+        model, first = timed(lambda: SourceModel(path))
+        model.close()
+        model, cached = timed(lambda: SourceModel(path))
+        middle = len(model) // 2
+        _, show = timed(lambda: [model[i] for i in range(middle - 3, middle + 4)])
+        rng = random.Random(1)
+        edited = [rng.randrange(len(model)) for _ in range(args.edits)]
+        _, save = timed(lambda: [model.edit(i, model[i] + " edited") for i in edited])
+        _, compact = timed(model.compact)
+        assert model[edited[-1]].endswith(" edited") and len(model) == args.lines
+        model.close()
+        print(f"{args.lines} lines, {size:.0f} MiB: first open {first:.2f} s, cached open {cached * 1000:.0f} ms, "
+              f"7 lines {show * 1000:.2f} ms, edit {save / args.edits * 1000:.2f} ms, "
+              f"compact {args.edits} edits {compact:.2f} s")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Time silence trimming of a synthetic take: speech-like tone with silence and a
+click before it, as link_line would see it with TRIM_SILENCE enabled.
+
+    python benchmarks/bench_vad.py --seconds 30 [--repeat 20]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from atc import vad  # noqa: E402
+from atc.wavfile import WavStreamWriter  # noqa: E402
+
+RATE = 44100
+
+
+def make_take(path, seconds):
+    rng = np.random.default_rng(0)
+    n = int(seconds * RATE)
+    x = rng.normal(0, 20, n)
+    t = np.arange(n) / RATE
+    lo, hi = int(0.15 * n), int(0.85 * n)
+    x[lo:hi] += np.sin(2 * np.pi * 180 * t[lo:hi]) * 8000 * (1 + np.sin(2 * np.pi * 3 * t[lo:hi])) / 2
+    x[RATE // 2:RATE // 2 + 100] += 20000
+    writer = WavStreamWriter(path, rate=RATE, fsync=False)
+    writer.write(np.clip(x, -32768, 32767).astype(np.int16))
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=30)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        source = os.path.join(tmp, "source.wav")
+        take = os.path.join(tmp, "take.wav")
+        make_take(source, args.seconds)
+        times = []
+        for _ in range(args.repeat):
+            shutil.copyfile(source, take)
+            t0 = time.perf_counter()
+            span = vad.trim_file(take)
+            times.append(time.perf_counter() - t0)
+        times.sort()
+        kept = (span[1] - span[0]) / RATE if span else args.seconds
+        print(f"{args.seconds:.0f} s take -> {kept:.2f} s kept; "
+              f"trim median {times[len(times) // 2] * 1000:.1f} ms, max {times[-1] * 1000:.1f} ms")
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
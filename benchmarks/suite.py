@@ -0,0 +1,378 @@
+"""
+Benchmark suite: synthetic corpora, a fake audio device, JSON results and a
+regression check against a baseline.
+
+    python benchmarks/suite.py [--preset quick|full] [--only link,navigate,...]
+                               [--out results.json] [--baseline baseline.json]
+                               [--tolerance 0.25]
+
+Scenarios (each timing is the median of --repeat runs, in milliseconds; lower is
+better):
+
+    link        record takes through CaptureEngine from the replay audio backend
+                (--speed times faster than real time, see atc.backends) and
+                link each one through an IOQueue with atc.linking.link_take, the
+                code the recorder's write_take runs, in the file layout and
+                with the SQLite store
+    navigate    show a line of a session of N sentences: index lookup, resolve
+                the take, waveform peaks for the canvas
+    end_session atc.metadata.export_session (what End Session runs), for
+                corpora of N sessions
+    waveform    peak sidecar build and canvas reduction, against take length
+    source      opening a source file (scan and cached), against its size
+
+The "full" preset covers corpora of 10 to 5,000 sessions and sessions of up to
+5,000 sentences; "quick" runs in well under a minute. Results are written to
+--out; with --baseline every metric slower than the baseline by more than
+--tolerance (and by more than --floor ms, to ignore timer noise) is reported and
+the run exits with status 1. Save a baseline on the same machine with
+--out baseline.json.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from atc import audiofile, linking, peaks  # noqa: E402
+from atc.backends import ReplayBackend, synthetic_speech  # noqa: E402
+from atc.capture import CaptureEngine  # noqa: E402
+from atc.io_queue import IOQueue  # noqa: E402
+from atc.layout import Corpus, take_name  # noqa: E402
+from atc.metadata import export_session, rebuild_metadata, session_meta_path, write_session_metadata  # noqa: E402
+from atc.session_index import SessionIndex, index_path, text_hash  # noqa: E402
+from atc.source_model import SourceModel  # noqa: E402
+from atc.store import Store  # noqa: E402
+from atc.wavfile import WavStreamWriter, format_fields, read_header  # noqa: E402
+
+RATE = 44100
+SPEAKER = "spk"
+WIDTH = 1200
+WORDS = "the a recorder sentence speaker reads each line aloud while audio is captured and linked".split()
+
+PRESETS = {
+    'quick': {'speed': 20.0, 'link_takes': 40, 'take_seconds': 2.0, 'navigate': [100, 1000], 'sessions': [10, 100],
+              'session_sentences': 100, 'waveform': [10, 60], 'source': [100000, 1000000], 'repeat': 5},
+    'full': {'speed': 20.0, 'link_takes': 300, 'take_seconds': 3.0, 'navigate': [100, 1000, 5000],
+             'sessions': [10, 500, 5000], 'session_sentences': 100, 'waveform': [10, 60, 600], 'source': [100000, 1000000, 5000000],
+             'repeat': 9},
+}
+
+
+def sentence(rng):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14)))
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000.0
+
+
+def median_ms(fn, repeat):
+    return statistics.median(timed(fn) for _ in range(repeat))
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def write_take(path, seconds, seed=0):
+    writer = WavStreamWriter(path, rate=RATE, fsync=False)
+    writer.write(synthetic_speech(seconds, RATE, seed=seed))
+    writer.close()
+
+
+# -------------------------
+# Synthetic corpora
+# -------------------------
+def make_session(corpus, session, sentences, seconds=1.0):
+    """
+    A session of `sentences` linked lines. Every take is a hard link of one
+    recorded take (with its peak sidecar), so large sessions cost no disk space.
+    """
+    rng = random.Random(session)
+    path = corpus.session_path(session)
+    os.makedirs(path, exist_ok=True)
+    os.makedirs(corpus.transcripts_root, exist_ok=True)
+    master = os.path.join(path, "master.wav")
+    write_take(master, seconds)
+    peaks.write_peaks(master)
+    fields = format_fields(read_header(master))
+    lines = []
+    index = SessionIndex(index_path(path, session))
+    for sent_id in range(1, sentences + 1):
+        text = sentence(rng)
+        lines.append(text + "\n")
+        name = take_name(SPEAKER, session, sent_id)
+        os.link(master, os.path.join(path, name))
+        os.link(peaks.peaks_path(master), peaks.peaks_path(os.path.join(path, name)))
+        index._apply(dict(fields, sent_id=sent_id, source="source.txt", line=sent_id - 1, hash=text_hash(text),
+                          audio=name, status='linked'))
+    index.compact()
+    os.remove(master)
+    peaks.remove_peaks(master)
+    with open(corpus.transcript(session), 'w', encoding='utf-8') as f:
+        f.write(''.join(lines))
+    return lines
+
+
+def make_metadata_only_session(corpus, session, sentences):
+    """Just the session metadata CSV, which is all merge_metadata reads."""
+    rng = random.Random(session)
+    path = corpus.session_path(session)
+    os.makedirs(path, exist_ok=True)
+    write_session_metadata(session_meta_path(path, session),
+                           ((i, take_name(SPEAKER, session, i), sentence(rng), 1.0) for i in range(1, sentences + 1)))
+
+
+def make_source(path, lines):
+    rng = random.Random(0)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(lines):
+            f.write(sentence(rng) + "\n")
+            if i % 1000 == 0:
+                f.write("\n")
+
+
+# -------------------------
+# Scenarios
+# -------------------------
+def bench_link(tmp, preset):
+    """
+    Capture through the replay backend and link each take the way the recorder does:
+    atc.linking.link_take on an IOQueue worker, timed from submit until it is done.
+    """
+    results = {}
+    for mode in ('file', 'store'):
+        corpus = Corpus(os.path.join(tmp, mode))
+        session = "session_1"
+        path = corpus.session_path(session)
+        os.makedirs(path)
+        os.makedirs(corpus.transcripts_root)
+        txt = corpus.transcript(session)
+        open(txt, 'w').close()
+        store = None
+        if mode == 'store':
+            store = Store(os.path.join(corpus.root, "corpus.db"))
+            store.upsert_session(session)
+        index = SessionIndex.open(path, session, txt)
+        # completions are delivered by drain(), so nothing needs scheduling
+        io = IOQueue(lambda ms, fn: None)
+        backend = ReplayBackend(source=preset['replay'], speed=preset['speed'])
+        engine = CaptureEngine(backend, rate=RATE)
+        frames = int(preset['take_seconds'] * RATE)
+        rng = random.Random(0)
+        stop, link = [], []
+        for sent_id in range(1, preset['link_takes'] + 1):
+            temp = os.path.join(corpus.root, f"take_{sent_id:05d}.wav")
+            engine.new_take()
+            engine.start(temp)
+            backend.wait_frames(backend.frames_captured + frames)
+            # stopping flushes what the disk sink has not written yet and closes the take
+            stop.append(timed(engine.stop))
+
+            text = sentence(rng)
+            audio_file = os.path.join(path, take_name(SPEAKER, session, sent_id))
+            fields = {'hash': text_hash(text), 'audio': os.path.basename(audio_file), 'status': 'linked',
+                      'source': "source.txt", 'line': sent_id - 1}
+            t0 = time.perf_counter()
+            io.submit(linking.link_take, temp, audio_file, sent_id, text, fields, session, txt, index, store,
+                      on_error=lambda e: print(f"link failed: {e}"))
+            io.drain()
+            link.append((time.perf_counter() - t0) * 1000.0)
+        io.shutdown()
+        backend.terminate()
+        if store is not None:
+            store.close()
+        prefix = 'link' if mode == 'file' else 'link/store'
+        results[f'{prefix}/p50_ms'] = statistics.median(link)
+        results[f'{prefix}/p95_ms'] = percentile(link, 95)
+        if mode == 'file':
+            results['link/stop_p50_ms'] = statistics.median(stop)
+            results['link/stop_p95_ms'] = percentile(stop, 95)
+    return results
+
+
+def bench_navigate(tmp, preset):
+    results = {}
+    for sentences in preset['navigate']:
+        corpus = Corpus(os.path.join(tmp, f"nav_{sentences}"))
+        session = "session_1"
+        lines = make_session(corpus, session, sentences)
+        path = corpus.session_path(session)
+        t0 = time.perf_counter()
+        index = SessionIndex.open(path, session, corpus.transcript(session))
+        results[f'navigate/{sentences}/open_index_ms'] = (time.perf_counter() - t0) * 1000.0
+        rng = random.Random(1)
+        steps = []
+        for _ in range(200):
+            line = rng.randrange(sentences)
+            t0 = time.perf_counter()
+            entry = index.lookup("source.txt", line, lines[line])
+            audio = audiofile.resolve(os.path.join(path, entry['audio']))
+            peaks.peaks_for_width(audio, WIDTH)
+            steps.append((time.perf_counter() - t0) * 1000.0)
+        results[f'navigate/{sentences}/p50_ms'] = statistics.median(steps)
+        results[f'navigate/{sentences}/p95_ms'] = percentile(steps, 95)
+        shutil.rmtree(corpus.root)
+    return results
+
+
+def bench_end_session(tmp, preset):
+    results = {}
+    sentences = preset['session_sentences']
+    for sessions in preset['sessions']:
+        corpus = Corpus(os.path.join(tmp, f"corpus_{sessions}"))
+        for n in range(1, sessions):
+            make_metadata_only_session(corpus, f"session_{n}", sentences)
+        rebuild_metadata(corpus.audio_root, corpus.global_meta)
+        results[f'end_session/{sessions}/rebuild_metadata_ms'] = median_ms(
+            lambda: rebuild_metadata(corpus.audio_root, corpus.global_meta), min(3, preset['repeat']))
+        times = []
+        for r in range(preset['repeat']):
+            # a newly recorded session is closed: its CSV is written and appended to the global one
+            session = f"session_{sessions + r}"
+            make_session(corpus, session, sentences)
+            path = corpus.session_path(session)
+
+            def end_session():
+                index = SessionIndex.open(path, session, corpus.transcript(session))
+                export_session(corpus.audio_root, session, path, corpus.transcript(session), SPEAKER,
+                               corpus.global_meta, durations=index.take_durations(path))
+            times.append(timed(end_session))
+        results[f'end_session/{sessions}/ms'] = statistics.median(times)
+        shutil.rmtree(corpus.root)
+    return results
+
+
+def bench_waveform(tmp, preset):
+    results = {}
+    for seconds in preset['waveform']:
+        path = os.path.join(tmp, f"take_{seconds}s.wav")
+        write_take(path, seconds)
+        results[f'waveform/{seconds}s/write_peaks_ms'] = median_ms(lambda: peaks.write_peaks(path),
+                                                                   min(3, preset['repeat']))
+        results[f'waveform/{seconds}s/draw_ms'] = median_ms(lambda: peaks.peaks_for_width(path, WIDTH),
+                                                            preset['repeat'])
+        levels = peaks.load_levels(path)
+        results[f'waveform/{seconds}s/draw_cached_ms'] = median_ms(lambda: peaks.reduce_to_width(levels, WIDTH),
+                                                                   preset['repeat'])
+        del levels
+        os.remove(path)
+        peaks.remove_peaks(path)
+    return results
+
+
+def bench_source(tmp, preset):
+    results = {}
+    for lines in preset['source']:
+        path = os.path.join(tmp, f"source_{lines}.txt")
+        make_source(path, lines)
+
+        def first_open():
+            shutil.rmtree(os.path.join(tmp, ".index"), ignore_errors=True)
+            SourceModel(path).close()
+        results[f'source/{lines}/first_open_ms'] = median_ms(first_open, min(3, preset['repeat']))
+        results[f'source/{lines}/open_ms'] = median_ms(lambda: SourceModel(path).close(), preset['repeat'])
+        os.remove(path)
+    return results
+
+
+SCENARIOS = {
+    'link': bench_link,
+    'navigate': bench_navigate,
+    'end_session': bench_end_session,
+    'waveform': bench_waveform,
+    'source': bench_source,
+}
+
+
+# -------------------------
+# Baseline comparison
+# -------------------------
+def compare(results, baseline, tolerance, floor):
+    """Metrics slower than the baseline by more than `tolerance` (relative) and `floor` ms."""
+    regressions = []
+    for name, value in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if value > base * (1 + tolerance) and value - base > floor:
+            regressions.append((name, base, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick')
+    parser.add_argument('--only', help="comma-separated scenarios (default: all)")
+    parser.add_argument('--repeat', type=int, help="runs per timing (default: from the preset)")
+    parser.add_argument('--speed', type=float, help="replay speed for link, times real time (default: 20)")
+    parser.add_argument('--replay', default="", help="take or folder of takes to record in link (default: synthetic)")
+    parser.add_argument('--takes', type=int, help="takes to record and link (default: from the preset)")
+    parser.add_argument('--out', default="benchmark_results.json")
+    parser.add_argument('--baseline', help="results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument('--floor', type=float, default=0.05, help="ignore slowdowns smaller than this (ms)")
+    args = parser.parse_args()
+
+    preset = dict(PRESETS[args.preset])
+    if args.repeat:
+        preset['repeat'] = args.repeat
+    if args.speed:
+        preset['speed'] = args.speed
+    if args.takes:
+        preset['link_takes'] = args.takes
+    preset['replay'] = args.replay
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}; choose from {', '.join(SCENARIOS)}")
+
+    np.random.seed(0)
+    results = {}
+    for name in names:
+        tmp = tempfile.mkdtemp()
+        try:
+            t0 = time.perf_counter()
+            scenario = SCENARIOS[name](tmp, preset)
+        finally:
+            shutil.rmtree(tmp)
+        print(f"{name} ({time.perf_counter() - t0:.1f} s)")
+        for key, value in scenario.items():
+            print(f"  {key:<44}{value:>12.3f}")
+        results.update(scenario)
+
+    report = {'preset': args.preset, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                          'processor': platform.processor(), 'cpus': os.cpu_count()},
+              'results': {k: round(v, 4) for k, v in results.items()}}
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('preset') != args.preset:
+            print(f"Warning: baseline was run with preset {baseline.get('preset')}")
+        regressions = compare(report['results'], baseline['results'], args.tolerance, args.floor)
+        for name, base, value in regressions:
+            print(f"REGRESSION {name}: {base:.3f} -> {value:.3f} ms (+{(value / base - 1) * 100:.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()